@@ -1,14 +1,14 @@
 import datetime
 import pickle
 import yaml
+import sys
 import os
 
 import pandas as pd
 import numpy as np
-import yfinance as yf
-import matplotlib.pyplot as plt
 
 from datetime import datetime
+from functools import partial
 
 ### Important!!
 # Somehow, somewhy, this code raises an error about columns not being there or ETF being delisted or something else.
@@ -16,7 +16,21 @@ from datetime import datetime
 # Once you run it again, the code should work. Should.
 
 directory_path = os.getenv("Short_Volatility_Path") # Personal path for data storage.
+sys.path.append(directory_path) # The shared shortvol package lives there too.
 directory_path = directory_path + "/On ETFs/"
+
+from shortvol.instrument import start_run
+from shortvol.panel import load_panel, ticker_frame
+from shortvol.regimes import load_features, save_features, update_features
+from shortvol.schema import flag, frame_bytes
+from shortvol.shared import SharedPanel, map_tickers
+from shortvol.signal_index import SignalIndex, save_index, signal_params
+from shortvol.signals import add_signals, forecast_summary
+from shortvol.validation import panel_checks
+
+# Stage timings, cache counters and dropped rows go to "Run reports" (see shortvol/instrument.py).
+report = start_run("ETFs")
+
 Config_path = os.path.join(directory_path, "config.yaml")
 with open(Config_path, "r") as file:
     config = yaml.safe_load(file)
@@ -27,12 +41,19 @@ tickers = config["tickers"]
 
 etf_data = {}
 
+report.stage("load panel")
+# The yfinance history of every ticker is cached in one panel (see shortvol/panel.py), shared with the seasonal scripts.
+# Only tickers missing from the cache are downloaded, so re-runs don't hit yfinance at all.
+# The download keeps actions=True (dividends and splits) and auto_adjust=False, as before.
+# Only Close is loaded, the signals need nothing else, with categorical tickers and int64 dates (shortvol/schema.py).
+# Downloaded history is checked first (shortvol/validation.py), rows with missing or duplicated closes are quarantined.
+panel = load_panel(tickers, start_date, end_date, os.path.join(directory_path, "ETF panel.pkl"), columns=["Close"],
+                   checks=panel_checks(config))
+
 for idx, ticker in enumerate(tickers, start=1):
     etf_data[idx] = {
         "ticker" : ticker,
-        "data" : yf.Ticker(ticker).history(start=start_date, end=end_date, actions=True, auto_adjust=False) 
-        #Actions is whether to include dividens and splits, it's True by default.
-        #For easier manipulation, in case some ETFs have and adjusted close, the auto_adjust makes the Close being automatically adjusted.
+        "data" : ticker_frame(panel, ticker)
     }
     #print(f"Fetching data for {ticker} (ID: {idx})...") #Just to show code is working...
 
@@ -52,68 +73,63 @@ mom_1 = config["general"]["mom_1"] #First momentum thresold, in percentages of m
 
 x = 0 #This varible is for testing.
 
+report.stage("signals")
+###
+# For every ETF we create the "analysis" columns (shortvol/signals.py, also timed by the benchmarks).
+# With these columns we have our criteria, vol lower than 20% historical vol and momentum less or equal than certain percentage.
+# Then comes the "forecasting", I take the days that fit the criteria, and see the forecast move for a certain period.
+# How will I determine the forecast is good or bad?
+# First we have to know that I'm taking the historical volatility, including periods not yet happened in the data. 
+# For a forecast of 2019, the volatility thresold includes vol from 2020, 2021...
+# So, with that in mind, I will look up the premium of an ATM straddle, get the percentages in which it would've made money in this circunstances,
+# and then apply that to the good/bad forecasting.
+
+# The panel is published once in shared memory (shortvol/shared.py), general.workers processes read the ETFs from it.
+with SharedPanel.from_panel(panel) as shared_panel:
+    signals = map_tickers(partial(add_signals, vol_window=vol_window, mom_window=mom_window, for_window=for_window,
+                                  mom_1=mom_1), shared_panel, tickers, config["general"]["workers"])
+
 for index, etf_info in etf_data.items():
     data = etf_info['data'] #Here we extract the dataframe from the dictionary.
-    data['Log_returns'] = np.log(data['Close'] / data['Close'].shift(1)) #Getting the Logarithmic returns.
-    data['Volatility'] = data['Log_returns'].rolling(window=vol_window).std() #Volatility as standard deviation of Close on Close over "vol_window" days.
-    Vol_20th = data['Volatility'].quantile(0.2)  #The 20 percent level of volatility.
-    data['Signal_vol'] = data['Volatility'] <= Vol_20th #Signal if Voltility is below the thresold of 20 percent.
-    data['Momentum'] = ((data['Close'] - data['Close'].shift(mom_window)) / data['Close'].shift(mom_window)) *100 #Get momentum as percentage change over "mom_window" days.
-    data['Signal_mom_1'] = data['Momentum'].abs() <= mom_1 #Signal if momentum is below thresold desired
-
-    data = data.dropna() #Dropping the NaN generated by shifting
-    data = data.drop(columns=['Volume', 'Dividends', 'Stock Splits']) #Mostly no use for these columns 
+    rows = len(data)
+    data = signals[etf_info['ticker']] #Rows with NaN from shifting are dropped in add_signals.
+    report.dropped("ETFs signals dropna", rows, len(data))
 
-    etf_info['data'] = data #Updating the dictionary
-
-    ###
-    # Up till now, what it's done is the creation of the "analysis" columns.
-    # With these columns we have our criteria, vol lower than 20% historical vol and momentum less or equal than certain percentage.
-    # Now, it's turn to do the "forecasting", I will take the days that fit the criteria, and see the forecast move for a certain period.
-    # How will I determine the forecast is good or bad?
-    # First we have to know that I'm taking the historical volatility, including periods not yet happened in the data. 
-    # For a forecast of 2019, the volatility thresold includes vol from 2020, 2021...
-    # So, with that in mind, I will look up the premium of an ATM straddle, get the percentages in which it would've made money in this circunstances,
-    # and then apply that to the good/bad forecasting.
-
-    data['Future_Close'] = data['Close'].shift(-for_window) #Creating a new column makes our future calculations easier.
-    data['Forecast_Move'] = ((data['Future_Close'] - data['Close']) / data['Close']) * 100 #Calculating the future move as a percentage change.
-    data['Forecast_Move_abs'] = data['Forecast_Move'].abs() #This is what we will be using for statistics.
-
-    # Signal_1: Both Signal_vol and Signal_mom_1 must be True (1)
-    data['Signal_1'] = ((data['Signal_vol']) & (data['Signal_mom_1'])).astype(int)
-
-    etf_info['data'] = data #Updating the data (again)
+    etf_info['data'] = data #Updating the data
 
     #if x == 0: #This lines are for testing.
     #    print(data['Momentum'].head())
-    #    print(data[data['Signal_1'] == 1].tail(25))
+    #    print(data[flag(data)].tail(25))
     #    x += 1
 
-results = [] #Start a list that will contain the statistics for forecasted moves.
+report.stage("regime features")
+# The market backdrop of every session (vol, trend and roll of the tickers, cross-asset vol, calendar flags) is kept
+# in "Regime features.pkl" at the root of the data path (shortvol/regimes.py), any P&L can be split by it.
+# Features already there are reused.
+regimes = config["regimes"]
+save_features(update_features(load_features(), panel, regimes["features"], regimes["window"], regimes["trend_window"]))
 
-for index, etf_info in etf_data.items():
-    name = etf_info['ticker']
-    data = etf_info['data'] #Same procedure as before.
-    filtered_data = data[data['Signal_1'] == 1] #Filter the data so we can get only our interested part.
+del panel, signals #Every ticker has its own frame now, the long panel is not needed anymore.
 
-    if filtered_data.empty: #In case some ETF does not match the criteria we have selected, this gets called and gives us the name of such ETF for further testing.
-        print(f'Etf number {index}, has no rows that match criteria. Investigatee further\n'
-              f'ETF = {name}')
-        continue
+# What the signal frames cost per ticker, kept in the run report to watch the memory budget as the universe grows.
+etf_bytes = frame_bytes({etf_info['ticker']: etf_info['data'] for etf_info in etf_data.values()})
+report.count("memory.etf_data_bytes", sum(etf_bytes.values()))
+report.count("memory.bytes_per_ticker", sum(etf_bytes.values()) // max(len(etf_bytes), 1))
 
-    mean = filtered_data['Forecast_Move_abs'].mean() 
-    median = filtered_data['Forecast_Move_abs'].median()
-    std = filtered_data['Forecast_Move_abs'].std()
+report.stage("signal index")
+# The Signal_1 days of every ETF are masked once, into one columnar table with per-ticker offsets (shortvol/signal_index.py).
+# Everything below reads its signal days from there, ticker and date range lookups are binary searches on sorted dates.
+signal_index = SignalIndex.from_signals({etf_info['ticker']: etf_info['data'] for etf_info in etf_data.values()},
+                                        signal_params(config))
 
-    results.append({
-        "ETF_Name": name,              #ETF ticker name
-        "Mean_Forecast_Move": mean,  #Mean of Forecast_Move_asb
-        "Median_Forecast_Move": median,  #Median of Forecast_Move_asb
-        "Std_Forecast_Move": std     #Standard deviation of Forecast_Move_asb
-    })
+report.stage("forecast statistics")
+# Statistics for forecasted moves on the signal days of each ETF (shortvol/signals.py).
+summary_table = forecast_summary(signal_index.query())
 
-summary_table = pd.DataFrame(results)
+for index, etf_info in etf_data.items():
+    if etf_info['ticker'] not in set(summary_table['ETF_Name']): #In case some ETF does not match the criteria we have selected, this gives us the name of such ETF for further testing.
+        print(f'Etf number {index}, has no rows that match criteria. Investigatee further\n'
+              f'ETF = {etf_info["ticker"]}')
 
 pd.set_option('display.max_rows', None)  #Show all rows
 pd.set_option('display.max_columns', None)  #Show all columns
@@ -122,7 +138,7 @@ pd.set_option('display.max_columns', None)  #Show all columns
 #summary_table.to_excel('Summary table.xlsx')
 
 data = etf_data[1]['data'] #This is for the first ETF, could be any number between 1 and 99. The number is a manually setted index, it does not start in 0.
-filtered_data = data[data['Signal_1'] == 1]
+filtered_data = signal_index.frame(etf_data[1]['ticker']) #Signal_1 days, straight from the index.
 
 x = 1 #More tests :)
 if x == 0:
@@ -179,31 +195,20 @@ if x == 0:
     print(f"Expected value of the SPY straddle: {expected_value:.2f}")
     # The expected value here should help answer whether the forecasted moves align with actual market pricing.
 
+report.stage("filter and save")
 # Create a set of ETF names with "Mean_Forecast_Move" > "thresold" from the results list
 mean_threshold = config["general"]["mean_threshold"]
-excluded_etfs = {res["ETF_Name"] for res in results if res["Mean_Forecast_Move"] > mean_threshold}
+excluded_etfs = set(summary_table.loc[summary_table["Mean_Forecast_Move"] > mean_threshold, "ETF_Name"])
 
-# Filtering the dataset to create a dictionary of filtered ETFs for further analysis.
-# This dictionary will only include relevant columns for the "Signal_1" data.
-ETF_filtered = {}
-
-for index, etf_info in etf_data.items():
-    name = etf_info['ticker']  # Get the ticker name.
-    data = etf_info['data']  # Get the corresponding dataframe for this ETF.
+for name in summary_table.loc[summary_table["ETF_Name"].isin(excluded_etfs), "ETF_Name"]: #In ticker order.
+    print(f"Excluding ETF {name} due to high Mean_Forecast_Move (>{mean_threshold}).")
 
-    # Skip ETFs that are in the exclusion set
-    if name in excluded_etfs:
-        print(f"Excluding ETF {name} due to high Mean_Forecast_Move (>{mean_threshold}).")
-        continue
-
-    # Filter rows where 'Signal_1' is True, i.e., matching the criteria set earlier.
-    filtered_data = data[data['Signal_1'] == 1]
-
-    # Keep only the relevant columns for this analysis: Date, Close, Future_Close, Forecast_Move.
-    filtered_data = filtered_data.loc[:, filtered_data.columns.intersection(['Date', 'Close', 'Future_Close', 'Forecast_Move'])]
-
-    # Add this filtered dataset to the dictionary, keyed by the ETF ticker.
-    ETF_filtered[name] = filtered_data
+# Filtering the dataset to create a dictionary of filtered ETFs for further analysis.
+# Only rows where 'Signal_1' is True are kept, with the relevant columns: Date, Close, Future_Close, Forecast_Move.
+# Volatility is kept too, the pricing model in "Polygon data.py" needs it to estimate premiums.
+# The index already holds exactly those rows, the excluded ETFs are recorded in it and left out of ETF_filtered.
+signal_index.excluded = tuple(summary_table.loc[summary_table['ETF_Name'].isin(excluded_etfs), 'ETF_Name'])
+ETF_filtered = signal_index.query(signal_index.selected)
 
 # Display the first few rows of the filtered data for SPY as a sanity check.
 print(ETF_filtered['SPY'].head())
@@ -216,3 +221,6 @@ Path = os.path.join(directory_path, "ETF_filtered.pkl")
 # This saves time by avoiding the need to re-run the entire analysis pipeline.
 with open(Path, 'wb') as f:
     pickle.dump(ETF_filtered, f)
+
+# The index goes next to it, under this run's signal parameters, for the scripts that query it (shortvol/pipelines.py).
+save_index(signal_index)
@@ -0,0 +1,65 @@
+import os
+import sys
+import yaml
+import pickle
+
+import pandas as pd
+
+directory_path = os.getenv("Short_Volatility_Path") # Personal path for data storage.
+sys.path.append(directory_path) # The shared shortvol package lives there too.
+directory_path = directory_path + "/On ETFs/"
+
+from shortvol.implied_vol import update_surface, vrp_table
+
+Config_path = os.path.join(directory_path, "config.yaml")
+with open(Config_path, "r") as file:
+    config = yaml.safe_load(file)
+
+risk_free_rate = config["pricing"]["risk_free_rate"]
+
+# The premiums fetched by "Polygon data.py" are turned into implied vols here.
+# Only premiums that came from the API are used, the model-filled ones would just give back the model's vol.
+with open(os.path.join(directory_path, "Portfolio_PL.pkl"), 'rb') as f:
+    Portfolio_PL = pickle.load(f)
+
+needed = ['Date', 'Close', 'Strike', 'Expiration', 'Volatility', 'Call_Price', 'Put_Price']
+quotes = []
+realized = []
+for ticker, data in Portfolio_PL.items():
+    if not set(needed).issubset(data.columns):
+        print(f"{ticker} was saved before strikes and leg prices were kept, re-run Polygon data.py for it.")
+        continue
+    if 'Premium_Source' in data.columns:
+        data = data[data['Premium_Source'] == "api"]
+
+    # One quote per leg: the call and the put of the straddle share strike, expiry and underlying.
+    for option_type, price in (("call", 'Call_Price'), ("put", 'Put_Price')):
+        quotes.append(pd.DataFrame({
+            "Ticker": ticker,
+            "Date": data['Date'],
+            "Expiration": data['Expiration'],
+            "Strike": data['Strike'],
+            "Type": option_type,
+            "Underlying": data['Close'],
+            "Price": data[price],
+        }))
+    realized.append(data[['Date', 'Volatility']].assign(Ticker=ticker))
+
+if not quotes:
+    sys.exit(f"No straddle of Portfolio_PL.pkl has the {', '.join(needed)} columns implied vols need, "
+             "re-run Polygon data.py to regenerate it.")
+
+# The surface is cached per ticker and date, so each run only solves the quotes it hasn't seen before.
+quotes = pd.concat(quotes, ignore_index=True)
+surface = update_surface(os.path.join(directory_path, "IV surface.pkl"), quotes, risk_free_rate)
+
+# VRP = IV - realized vol. Positive means options were priced above the vol the underlying had just shown
+# (the Volatility column from ETFs.py looks back "vol_window" days).
+VRP = vrp_table(surface, pd.concat(realized, ignore_index=True))
+VRP.to_pickle(os.path.join(directory_path, "VRP.pkl"))
+
+pd.set_option('display.max_rows', None)
+pd.set_option('display.max_columns', None)
+
+summary = VRP.groupby("Ticker")[["IV", "Realized_Vol", "VRP"]].agg(["mean", "median"])
+print(summary)
@@ -1,16 +1,26 @@
 import pickle
 import yaml
+import sys
 import os
 
 import pandas as pd
 import numpy as np
 
-import matplotlib.pyplot as plt
-
 # Define the path for data storage.
 # The path is constructed using an environment variable to keep it flexible and secure.
 directory_path = os.getenv("Short_Volatility_Path") # Personal path for data storage.
+sys.path.append(directory_path) # The shared shortvol package lives there too.
 directory_path = directory_path + "/On ETFs/"
+
+from shortvol.instrument import start_run
+from shortvol.metrics import etf_results
+from shortvol.pipelines import exit_rules, hedge_panel, polygon_client, regime_results, shared_cache
+from shortvol.portfolio import portfolio_results
+from shortvol.regimes import load_features
+from shortvol.render import etf_report
+
+report = start_run("PL analysis") # Stage timings go to "Run reports" (see shortvol/instrument.py).
+
 Portfolio_path = os.path.join(directory_path, "Portfolio_PL.pkl")  # Path to the portfolio P&L data.
 Config_path = os.path.join(directory_path, "config.yaml")
 with open(Config_path, "r") as file:
@@ -25,38 +35,18 @@ with open(Config_path, "r") as file:
 #   would be more appropriate, as losses in one ETF might be offset by gains in others.
 Portfolio_equity = config["general"]["initial_equity"]  # Initial equity for the portfolio.
 
+report.stage("load")
 # Load the portfolio P&L data from the pickle file.
 # This data contains the pre-processed P&L values for each ETF, based on the straddle strategy.
 with open(Portfolio_path, 'rb') as f:
     Portfolio_PL = pickle.load(f)
 
-individual_results = []
-
-for etf, data in Portfolio_PL.items():
-    equity_curve = [Portfolio_equity]  # Start with the initial equity.
-    PL = data['PL'].tolist()
-    if len(data) >= 10:
-        for trade_pl in PL:
-            equity_curve.append(equity_curve[-1] + trade_pl)
-        equity_curve = np.array(equity_curve)
-        log_returns = np.log(equity_curve[1:] / equity_curve[:-1])
-        sharpe_ratio = np.mean(log_returns) / np.std(log_returns)
-        downside_returns = log_returns[log_returns < 0]
-        sortino_ratio = np.mean(log_returns) / np.std(downside_returns) if len(downside_returns) > 0 else np.nan
-        running_max = np.maximum.accumulate(equity_curve)
-        drawdowns = ((running_max - equity_curve) / running_max) * 100 * 100
-        max_drawdown = np.max(drawdowns)
-        total_return = ((equity_curve[-1] - equity_curve[0]) / equity_curve[0]) * 100 * 100 
-
-        individual_results.append({
-            "ETF" : etf,
-            "Sharpe_ratio" : sharpe_ratio,
-            "Sortino_ratio" : sortino_ratio,
-            "Max_drawdown" : max_drawdown,
-            "Overall_return" : total_return
-        })
-
-individual_results = pd.DataFrame(individual_results)
+rolling_window = config["general"]["rolling_window"] # Trades per window for the rolling metrics.
+
+report.stage("metrics")
+# Per ETF, Sharpe, Sortino, max drawdown and overall return of its own equity curve (ETFs with 10 trades or more),
+# and the streaming metrics after every trade, which keep running sums instead of recomputing every window.
+individual_results, rolling_results = etf_results(Portfolio_PL, Portfolio_equity, rolling_window)
 
 pd.set_option('display.max_rows', None)  
 pd.set_option('display.max_columns', None)  
@@ -65,21 +55,46 @@ print(individual_results)
 individual_results_path = os.path.join(directory_path, "individual results.xlsx")
 individual_results.to_excel(individual_results_path)
 
-formatted_values = individual_results.round(2).values
-
-fig, ax = plt.subplots(figsize=(8, 4))  # Adjust size as needed
-ax.axis("tight")
-ax.axis("off")
-
-table = ax.table(cellText=formatted_values,  
-                 colLabels=individual_results.columns,
-                 cellLoc="center",
-                 loc="center")
-
-table.auto_set_font_size(False)
-table.set_fontsize(10)
-table.auto_set_column_width([i for i in range(len(individual_results.columns))])  
-
-image_path = os.path.join(directory_path, "individual_results.png")
-plt.savefig(image_path, dpi=300, bbox_inches="tight")  # Save high-res image
-plt.show()
\ No newline at end of file
+rolling_path = os.path.join(directory_path, "Rolling metrics.pkl")
+with open(rolling_path, 'wb') as f:
+    pickle.dump(rolling_results, f)
+
+report.stage("portfolio")
+# Combining the ETFs: every ETF's P&L on one date grid, weights from rolling covariances (shortvol/portfolio.py),
+# the equally weighted book next to the inverse-vol, risk parity and correlation-capped ones.
+portfolio_config = config["portfolio"]
+portfolio_table, portfolio_weights = portfolio_results(Portfolio_PL, Portfolio_equity, portfolio_config["window"],
+                                                       portfolio_config["rebalance"], portfolio_config["cluster_threshold"],
+                                                       portfolio_config["cluster_cap"], portfolio_config["shrinkage"],
+                                                       portfolio_config["methods"])
+print(portfolio_table)
+portfolio_table.to_excel(os.path.join(directory_path, "Portfolio results.xlsx"))
+with open(os.path.join(directory_path, "Portfolio weights.pkl"), 'wb') as f:
+    pickle.dump(portfolio_weights, f)
+
+if config["exits"]["enabled"]:
+    report.stage("exit rules")
+    # Every straddle above is held to expiry. Here every profit target, stop-loss and time stop of the exits section is
+    # tried on every straddle at once (shortvol/exits.py), on daily paths priced with the model or the options' own closes.
+    paths_from_api = config["exits"]["paths"] == "api"
+    exit_table = exit_rules(Portfolio_PL, config, polygon_client(config, shared_cache(), budget=0) if paths_from_api else None,
+                            None if paths_from_api else hedge_panel(config))
+    print(exit_table.head(10))
+    exit_table.to_excel(os.path.join(directory_path, "Exit rules.xlsx"))
+
+features = load_features()
+if config["regimes"]["enabled"] and features is not None:
+    report.stage("regimes")
+    # How the straddles did by market backdrop: every trade takes the regime features of its signal date, kept by ETFs.py
+    # (shortvol/regimes.py), and the P&L is summed per quantile bucket of each feature in one group-by.
+    regime_table = regime_results(Portfolio_PL, config, features)
+    print(regime_table)
+    regime_table.to_excel(os.path.join(directory_path, "Regime results.xlsx"), index=False)
+
+report.stage("render")
+# Equity and drawdown of every ETF and of the book, the metrics table as an image, and one static page with all of it:
+# report.folder/index.html (shortvol/render.py). Figures are drawn offscreen in a pool of processes, nothing waits on a window,
+# and a figure whose data hasn't changed since the last run is not drawn again.
+index_path = etf_report(Portfolio_PL, Portfolio_equity, individual_results, portfolio_table, portfolio_weights,
+                        directory_path, config)
+print(f"Report written to {index_path}")
@@ -1,52 +1,41 @@
 import os
-import time
-import json
+import sys
 import yaml
 import pickle
-import requests
-import datetime
-
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-
-from datetime import datetime, timedelta
 
 directory_path = os.getenv("Short_Volatility_Path") # Personal path for data storage.
+sys.path.append(directory_path) # The shared shortvol package lives there too.
 directory_path = directory_path + "/On ETFs/"
+
+from shortvol.instrument import start_run
+from shortvol.option_store import load_option_store, save_option_store
+from shortvol.pipelines import (PORTFOLIO_COLUMNS, etf_signals, hedge_panel, hedge_straddles, polygon_client, portfolio_path,
+                                premium_multipliers, price_straddles, shared_cache, shared_plan, underlying_closes)
+from shortvol.plan import execute_plan, plan_summary
+
 Config_path = os.path.join(directory_path, "config.yaml")
 with open(Config_path, "r") as file:
     config = yaml.safe_load(file)
 
+# Requests per endpoint, cache hits, rate limiter waits and stage timings go to "Run reports" (see shortvol/instrument.py).
+report = start_run("ETF Polygon data")
+
 ### README
 # Be carefull when running this code, the free polygon version offers 5 API calls per minute.
 # Right now the loop is setted to break after the first iteration, this is, only with SPY data.
 # If you want to loop over all the ETFs, this is gonna take time, a lot of time.
 # So be carefull, we could be talking +10 hours at a rate of 5 API calls per minute.
+# Set general.dry_run to true to see the real number of requests (after the cache) and the wall time before starting,
+# and general.request_budget to split the run in chunks that each send at most that many requests.
 
-ETFs_Friday = config['expiration_rules']['friday_expiration_etfs']
-
-POLYGON_API_KEY = os.getenv("POLYGON_API_KEY") # Environmental variable for API key, keeping it secure.
-Path = os.path.join(directory_path, "ETF_filtered.pkl") # Path to the filtered ETF data.
-
-# Load the filtered ETF data from the pickle file.
-# This contains the pre-processed data with signals, forecasted moves, etc.
-with open(Path, 'rb') as f:
-    ETF_filtered = pickle.load(f)
+# The API key comes from the POLYGON_API_KEY environment variable, keeping it secure (see shortvol/pipelines.py).
 
-# Create a new dictionary to store data filtered for 2023 and beyond.
-# This is to focus on recent data for more relevant analysis.
-ETF_filtered_2023 = {}
-
-# Filter the data to include only rows from 2023 onwards.
-# This ensures we're working with the most recent market conditions.
-for ticker, df in ETF_filtered.items():
-    df = df.reset_index()  # Reset index for easier manipulation.
-    df_filtered = df[df["Date"] >= "2023-02-01"]  # Filter rows where the year is 2023 or later.
-    ETF_filtered_2023[ticker] = df_filtered.copy()  # Store the filtered data in the new dictionary.
-    # We use .copy() here to create a new, independent DataFrame object. Without .copy(), 
-    # df_filtered would be a view of the original DataFrame, and modifications to it could 
-    # inadvertently affect the original data. This ensures data integrity.
+# Load the filtered ETF data (the signal index from ETFs.py), keeping only rows from general.filter_start_date onwards.
+# This is to focus on recent data, the most relevant market conditions.
+# The loop below stops after "max_etfs" ETFs, so only those are loaded (see shortvol/pipelines.py),
+# each one a binary search for the start date in the index (shortvol/signal_index.py), not a mask over its history.
+report.stage("load signals")
+ETF_selected = etf_signals(config)
 
 ### To do:
 # Call the Polygon.io API to get option contracts for each signal.
@@ -67,220 +56,89 @@ for ticker, df in ETF_filtered.items():
 # Compute performance metrics like Sharpe ratio, total returns, etc.
 # Measure overall portfolio profitability.
 
-# Define API endpoints and headers for Polygon.io.
-url = config["api"]["base_url"]
-options_contracts_endpoint = config["api"]["endpoints"]["options_contracts"]  # Endpoint for option contracts.
-Daily_OC = config["api"]["endpoints"]["daily_oc"]  # Endpoint for daily open/close data.
+# Define API endpoints for Polygon.io.
 rate_limit = config["api"]["rate_limit_per_minute"]
-headers = {"Authorization" : f"{POLYGON_API_KEY}"}  # Authorization header for API requests.
-api_limit = config["general"]["api_result_limit"]
-max_etfs = config["general"]["max_etfs"]
-
+dry_run = config["general"]["dry_run"] # Only plan the requests, report the cost and stop.
+request_budget = config["general"]["request_budget"] # Requests sent per run, None (~) sends everything.
+
+# Premium source: "api" fetches every premium (rows Polygon can't price are dropped),
+# "fill" fetches and prices the gaps with Black-Scholes, "model" skips the API for a fast estimate.
+premium_source = config["pricing"]["premium_source"]
+
+# Realized vol understates what options cost, the gap being the premium we sell.
+# We calibrate that gap per ETF on the premiums fetched in earlier runs, with a fallback for ETFs never fetched.
+multipliers, default_multiplier = premium_multipliers(config)
+
+# Every response is kept in a local cache shared with the Seasonal scripts, so a request is never paid for twice,
+# even across runs or subprojects.
+cache = shared_cache()
+client = None
+
+if premium_source != "model":
+    # Before sending anything, we list every request this backtest and the Seasonal Friday study need,
+    # drop the duplicates and the ones the cache already answers, batch the daily closes of contracts
+    # needed on several dates into one request, and see what is left at our rate limit.
+    report.stage("plan requests")
+    plan = shared_plan(cache, request_budget)
+    plan.to_pickle(os.path.join(directory_path, "Request plan.pkl"))
+    for key, value in plan_summary(plan, rate_limit, request_budget).items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+
+    if dry_run:
+        sys.exit(0)
+
+    # The plan is sent signal by signal (contracts first, then their prices), so whatever part of it
+    # fits in the budget gives complete straddles. The next run carries on where this one stopped.
+    report.stage("fetch")
+    client = polygon_client(config, cache, request_budget)
+    execute_plan(client, plan, config["api"]["endpoints"])
+    if client.skipped or client.sent == request_budget:
+        print(f"Request budget of {request_budget} used, run again for the next chunk.")
+
+    # From here on everything is read from the cache, nothing else is sent.
+    client.budget = client.sent
+
+report.stage("assemble P&L")
 # Dictionary to store portfolio P&L for each ETF.
 Portfolio_PL = {}
 
-ETFs_looped = 0
-
-# Loop through each ETF and its filtered data.
-for ticker, data in ETF_filtered_2023.items():
-    Calls = []  # List to store Call option tickers.
-    Puts = []   # List to store Put option tickers.
-    Calls_Price = []  # List to store Call option prices.
-    Puts_Price = []   # List to store Put option prices.
-    Calls_Volume = []  # List to store Call option volumes.
-    Puts_Volume = []   # List to store Put option volumes.
-    Strikes = []  # List to store strike prices.
-
-    x = 0  # Counter for rate limiting.
-    for row in range(len(data)):
-        strike = round(data.iloc[row]['Close'])  # Round Close price to get the strike.
-        # We round the Close price to the nearest integer because option strikes are typically 
-        # set at whole numbers. This ensures we're working with realistic, tradable strikes.
-        signal_date = data.iloc[row]['Date']  # Date when the trading signal occurred
-        
-        # --- Expiration Date Calculation Logic ---
-        if ticker in ETFs_Friday:
-            # Special handling for Friday-expiration ETFs
-            # Python weekday(): Monday = 0, Sunday = 6
-            weekday = signal_date.weekday()
-            
-            if weekday == 0:  # Monday
-                # For Monday signals: use same week's Friday (+4 days)
-                expiration_date = signal_date + timedelta(days=4)
-            else:
-                # For Tue-Sun signals: calculate days to next week's Friday
-                # (4 - weekday) % 7 = days until Friday in current week
-                # +7 to push to next week if past Friday
-                days_until_next_friday = (4 - weekday) % 7
-                expiration_date = signal_date + timedelta(days=days_until_next_friday + 7)
-        else:
-            # Default behavior for non-Friday ETFs
-            # Use original 7-day expiration logic
-            expiration_date = signal_date + timedelta(days=7)
-
-        # Format for API requests
-        expiration_date = expiration_date.strftime('%Y-%m-%d')
-        Strikes.append(strike)  
-
-        params = {
-            "underlying_ticker": ticker,
-            "contract_type": "call",
-            "expiration_date": expiration_date,
-            "strike_price": strike,
-            "expired": "true",  # Include expired contracts.
-            "limit": api_limit,  # Limit results to 10.
-            "sort": "expiration_date",  # Sort by expiration date.
-        }
-        full_url = url + options_contracts_endpoint
-        response = requests.get(full_url, headers=headers, params=params)
+# The premium minus the payoff mixes the vol premium with the direction the ETF took. With hedging.enabled each
+# straddle is also delta-hedged along the ETF's path (shortvol/hedging.py), on daily closes from the panel of ETFs.py
+# or on the hourly/minute bars the plan fetched.
+hedging = config["hedging"]["enabled"]
+hedge_prices = hedge_panel(config) if hedging and config["hedging"]["bars"] == "day" else None
+if hedging and config["hedging"]["bars"] != "day" and client is None:
+    client = polygon_client(config, cache, budget=0)  # Model premiums, but the bars are read from the cache.
 
-        if response.status_code == 200:
-            response = response.json()
-            results = response.get("results", [])
-            if results:
-                Call_ticker = results[0]['ticker']  # Get the first matching Call option ticker.
-                Calls.append(Call_ticker)
-            else:
-                print(f"No results for Call: {params}")  # Log if no results are found.
-                Calls.append(None)  # Append None if no result is found.
-        else:
-            print(f"Error in Call request: {response.status_code} - {response.text}")  # Log API errors.
-            Calls.append(None)
-
-        # Rate limiting: Sleep after every 5 requests to avoid hitting API limits.
-        # Polygon.io has rate limits, so we sleep for 60 seconds after every 5 requests 
-        # to stay within the allowed number of requests per minute.
-        x += 1
-        if x == rate_limit:
-            x = 0
-            time.sleep(60)
-
-        # API call to get Put option contracts.
-        params = {
-            "underlying_ticker": ticker,
-            "contract_type": "put",
-            "expiration_date": expiration_date,
-            "strike_price": strike,
-            "expired": "true",
-            "limit": api_limit,
-            "sort": "expiration_date",
-        }
-        response = requests.get(full_url, headers=headers, params=params)
-
-        if response.status_code == 200:
-            response_data = response.json()
-            results = response_data.get("results", [])
-            if results:
-                Put_ticker = results[0]['ticker']  # Get the first matching Put option ticker.
-                Puts.append(Put_ticker)
-            else:
-                print(f"No results for Put: {params}")  # Log if no results are found.
-                Puts.append(None)  # Append None if no result is found.
-        else:
-            print(f"Error in Put request: {response.status_code} - {response.text}")  # Log API errors.
-            Puts.append(None)
-
-        # Rate limiting: Sleep after every 5 requests.
-        x += 1
-        if x == rate_limit:
-            x = 0
-            time.sleep(60)
-
-    # Add Call and Put tickers, and strike prices to the dataset.
-    data['Call_ticker'] = Calls
-    data['Put_ticker'] = Puts
-    data['Strike'] = Strikes
-
-    # Drop rows with missing values.
-    # We use inplace=True to modify the DataFrame directly instead of creating a new one.
-    # Using df = df.dropna() would create a new DataFrame, which is less memory efficient 
-    # and can lead to confusion if the variable name is reused.
-    data.dropna(inplace=True)  # Drop rows with missing values.
+# Contracts and closes read in earlier runs (by either subproject) are integers and arrays in the option store,
+# only the legs it doesn't have yet are read from the cache, and added to it (shortvol/option_store.py).
+option_store = load_option_store()
 
+# Loop through each ETF and its filtered data.
+# Expiration, strike, both legs' prices and the P&L are worked out in shortvol/pipelines.py (price_straddles).
+for ticker, data in ETF_selected.items():
+    closes = underlying_closes(ticker, data, config, client, hedge_prices) if hedging else None  # Before any row is dropped.
+    data = price_straddles(ticker, data, config, client, multipliers.get(ticker, default_multiplier), option_store)
+    if hedging:
+        data = hedge_straddles(data, closes, config, multipliers.get(ticker, default_multiplier))
     print(data)  # Print the updated dataset for verification.
-    time.sleep(60)  # Sleep to avoid API rate limits.
-
-    # Function to fetch option data (Close price and Volume) for a specific ticker and date.
-    def fetch_option_data(ticker, date, option_type, url, headers):
-        """Fetch option data for a specific ticker and expiration date."""
-        full_url = f"{url}{Daily_OC}{ticker}/{date}"
-        params = {"adjusted": True}  # Use adjusted prices.
-
-        try:
-            response = requests.get(full_url, headers=headers, params=params)
-            if response.status_code == 200:
-                response = response.json()
-                if response:
-                    return response.get("close"), response.get("volume")  # Return Close price and Volume.
-                else:
-                    print(f"No results for {option_type}: {params}")  # Log if no results are found.
-                    return None, None
-            else:
-                print(f"Error in {option_type} request: {response.status_code} - {response.text}")  # Log API errors.
-                return None, None
-        except Exception as e:
-            print(f"Exception in {option_type} request: {e}")  # Log exceptions.
-            return None, None
-    
-    x = 0
-    time.sleep(60)  # Sleep to avoid API rate limits.
-    for row in range(len(data)):
-        # Extract basic info for the current row.
-        call_ticker = data.iloc[row]["Call_ticker"]
-        put_ticker = data.iloc[row]["Put_ticker"]
-        date = (data.iloc[row]["Date"]).strftime("%Y-%m-%d")  # Format date for API request.
-            
-        x += 1
-        if x == rate_limit:
-            time.sleep(60)  # Sleep after every 5 requests.
-            x = 0
-        # Fetch Call option data.
-        call_price, call_volume = fetch_option_data(call_ticker, date, "Call", url, headers)
-        Calls_Price.append(call_price)
-        Calls_Volume.append(call_volume)
-            
-        x += 1
-        if x == rate_limit:
-            time.sleep(60)  # Sleep after every 5 requests.
-            x = 0
-        # Fetch Put option data.
-        put_price, put_volume = fetch_option_data(put_ticker, date, "Put", url, headers)
-        Puts_Price.append(put_price)
-        Puts_Volume.append(put_volume)
-
-    # Add Call and Put prices/volumes to the dataset.
-    data['Call_Price'] = Calls_Price
-    data['Call_Volume'] = Calls_Volume
-    data['Put_Price'] = Puts_Price
-    data['Put_Volume'] = Puts_Volume
-
-    data.dropna(inplace = True)
-
-    # Calculate straddle premium and payoff.
-    data['Premium'] = data['Call_Price'] + data['Put_Price']  # Total premium received.
-    data['Payoff'] = np.maximum(data['Future_Close'] - data['Strike'], 0) + \
-        np.maximum(data['Strike'] - data['Future_Close'], 0)  # Payoff from the straddle.
-    data['PL'] = data['Premium'] - data['Payoff']  # P&L for each straddle position.
 
     # Calculate total P&L for the ETF.
-
-    Premium = data['Premium'].tolist()
-    Payoff = data['Payoff'].tolist()
-    PL = data['PL'].tolist()
-    final_PL = sum(PL)
+    final_PL = data['PL'].sum()
     print(f"Result of the strategy on {ticker}: {final_PL}")  # Print the total P&L.
+    if hedging:
+        print(f"Delta-hedged result on {ticker}: {data['Hedged_PL'].sum()}")
 
-    filtered_data = data.loc[:, data.columns.intersection(['Date', 'Premium', 'Payoff', 'PL'])]
-    Portfolio_PL[ticker] = filtered_data
-
-    ETFs_looped += 1
-    if ETFs_looped == max_etfs:
-        break
+    # Besides the P&L we keep what the pricing model needs, so the next run can calibrate on these premiums.
+    Portfolio_PL[ticker] = data.loc[:, data.columns.intersection(PORTFOLIO_COLUMNS)]
 
-Path = os.path.join(directory_path, "Portfolio_PL.pkl") # Path to the Portfolio_PL data.
+report.stage("save")
+Path = portfolio_path(config) # Model estimates go to their own file, they never overwrite the fetched results.
 
 with open(Path, 'wb') as f:
     pickle.dump(Portfolio_PL, f)
+if config["pricing"]["premium_source"] != "model":
+    save_option_store(option_store)
 
 ### To do:
 # Make the loop work for every ETF in the list, get the column of "PL" in dictionaries containing as keys the ETFs and as values the "PL" list.
@@ -1,16 +1,18 @@
 import requests
 import os
 import yaml
-import datetime
-import time
-
-import pandas as pd
-
-from datetime import timedelta, datetime
+import sys
 
 directory_path = os.getenv("Short_Volatility_Path")
+sys.path.append(directory_path) # The shared shortvol package lives there.
 directory_path = directory_path +"/Seasonal/BTC/"
 
+from shortvol.candles import ingest, store_range
+from shortvol.instrument import start_run
+
+# Requests, the seconds spent waiting on the rate limit and stage timings go to "Run reports".
+report = start_run("BTC API data")
+
 config_path = os.path.join(directory_path, "config.yaml")
 with open(config_path, "r") as file:
     config = yaml.safe_load(file)
@@ -18,64 +20,13 @@ with open(config_path, "r") as file:
 deribit_get_trades = config["deribit_api"]["get_trades"]
 deribit_get_instruments = config["deribit_api"]["get_instruments"]
 
-bitget_url = config["bitget_api"]["url"]
-bitget_data = config["bitget_api"]["endpoints"]["historical_data"]
-limit_per_second = config["bitget_api"]["limit"]
-
-symbol = config["data"]["symbol"]
-granularity = config["data"]["granularity"]
-limit = config["data"]["limit"]
-
-bitget_data = bitget_url + bitget_data
-
-data_start = datetime.strptime("2020-01-01", "%Y-%m-%d")
-data_end = datetime.strptime("2025-02-01", "%Y-%m-%d")
-interval = timedelta(hours=limit)
-
-data_timepoints = []
-current_time = data_start
-while current_time <= data_end:
-    # Convert current_time to Unix milliseconds
-    data_timepoints.append(int(current_time.timestamp() * 1000))
-    current_time += interval
-
-historical_data_time = []
-historical_data_open = []
-historical_data_high = []
-historical_data_low = []
-historical_data_close = []
-
-requests_per_second = 0
-for i in range(len(data_timepoints)):
-    params = {
-        "symbol": symbol,
-        "granularity": granularity,
-        "endTime": data_timepoints[i],
-        "limit": limit
-    }
-
-    response = requests.get(url=bitget_data, params=params)
-    response = response.json()
-    data = response.get("data",[])
-    for datapoint in data:
-        historical_data_time.append(datapoint[0])
-        historical_data_open.append(float(datapoint[1]))
-        historical_data_high.append(float(datapoint[2]))
-        historical_data_low.append(float(datapoint[3]))
-        historical_data_close.append(float(datapoint[4]))
-    requests_per_second += 1
-    if requests_per_second == limit_per_second:
-        time.sleep(1)
-        requests_per_second = 0
-
-Historical_data = {
-    "Time" : historical_data_time,
-    "Open" : historical_data_open,
-    "High" : historical_data_high,
-    "Low" : historical_data_low,
-    "Close" : historical_data_close
-}
-
-Historical_data = pd.DataFrame(Historical_data)
+data_start, data_end = store_range(config)
 
-Historical_data.to_csv(directory_path + "Historical BTC data 2020 - 2025")
\ No newline at end of file
+# Every symbol and granularity of the store section, each partition fetched in its own thread from its last candle
+# on, the requests of a venue sharing its rate limit (see shortvol/candles.py). Candles from overlapping pages
+# (the same Time twice) or with a missing price are quarantined, see "Data quality"; the rest is merged into
+# "Candle store", one candle per time and the missing ones filled flat.
+report.stage("ingest")
+added = ingest(requests.get, config, data_start, data_end)
+for (venue, symbol, granularity), count in added.items():
+    print(f"{venue} {symbol} {granularity}: {count} new candles")
@@ -1,9 +1,9 @@
-import requests
 import os
 import yaml
 import datetime
 import json
 import time
+import sys
 
 import numpy as np
 import pandas as pd
@@ -12,32 +12,41 @@ import matplotlib.pyplot as plt
 from datetime import timedelta, datetime
 
 directory_path = os.getenv("Short_Volatility_Path")
+sys.path.append(directory_path) # The shared shortvol package lives there.
 directory_path = directory_path +"/Seasonal/BTC/"
 
+from shortvol.candles import study_candles
+from shortvol.instrument import start_run
+from shortvol.pyramid import load_pyramid, save_pyramid
+from shortvol.query import query
+
+report = start_run("BTC data analysis") # Stage timings go to "Run reports".
+
 config_path = os.path.join(directory_path, "config.yaml")
 with open(config_path, "r") as file:
     config = yaml.safe_load(file)
 
-Historical_data = pd.read_csv(directory_path + "Historical BTC data 2020 - 2025")
-
-Historical_data["Time"] = pd.to_datetime(Historical_data["Time"], unit="ms")
-Historical_data["Date"] = Historical_data["Time"].dt.date
-Historical_data["is_08"] = Historical_data["Time"].dt.hour == 8
-Historical_data["is_00"] = Historical_data["Time"].dt.hour == 0
-
-data_00 = Historical_data[Historical_data["Time"].dt.hour == 0][["Date", "Open"]].rename(columns={"Open": "Open_00"})
-data_08 = Historical_data[Historical_data["Time"].dt.hour == 8][["Date", "Open"]].rename(columns={"Open": "Open_08"})
-
-merged_data = pd.merge(data_00, data_08, on="Date", how="inner")
-
-merged_data["Return"] = abs(((merged_data["Open_08"] - merged_data["Open_00"]) / merged_data["Open_00"]) * 100)
-merged_data["Log_Return"] = np.log(merged_data["Open_08"] / merged_data["Open_00"])
-
-# Add a day-of-week column (e.g. Monday, Tuesday, etc.)
-merged_data["DayOfWeek"] = pd.to_datetime(merged_data["Date"]).dt.day_name()
+# The candles of data.venue, data.symbol and data.granularity from the candle store: the same study runs on
+# ETHUSDT or SOLUSDT by changing data.symbol. Candles filled in for missing ones are left out.
+report.stage("load")
+symbol = config["data"]["symbol"]
+engine = config["data"]["query_engine"] # The summaries below are queries (shortvol/query.py), on pandas or polars.
+Historical_data = study_candles(config["data"]["venue"], symbol, config["data"]["granularity"])
+
+# The hourly candles are rolled up into coarser bars once (shortvol/pyramid.py), the pyramid is saved,
+# and each run only rolls up the candles fetched since the last one.
+report.stage("candle pyramid")
+pyramid_path = directory_path + f"{symbol} candle pyramid.pkl"
+pyramid = load_pyramid(pyramid_path, config["pyramid"]["levels"])
+pyramid.update(Historical_data)
+save_pyramid(pyramid, pyramid_path)
+
+# 00:00 open to 08:00 open of each day, with its day-of-week: the 8 hour bars starting at midnight.
+report.stage("00:00 to 08:00 moves")
+merged_data = pyramid.moves("8h@00", start_hour=0)
 
 # Summary statistics for the intraday move by day-of-week
-intraday_summary = merged_data.groupby("DayOfWeek")["Return"].agg(["mean", "std", "median", "count"])
+intraday_summary = query(merged_data).group_by("DayOfWeek", "Return").collect(engine)
 print("00:00 to 08:00 move summary by Day-of-Week:")
 print(intraday_summary)
 
@@ -49,20 +58,12 @@ plt.ylabel("Frequency")
 plt.show()
 
 # --- For the 08:00 to 08:00 moves (next-day moves) ---
-# Use the 08:00 data; ensure the Open values are numeric
-data_08 = Historical_data[Historical_data["Time"].dt.hour == 8][["Date", "Open"]].rename(columns={"Open": "Open_08"})
-data_08["Open_08"] = data_08["Open_08"].astype(float)
-data_08 = data_08.sort_values("Date").reset_index(drop=True)
-
-# Compute the next-day move
-data_08["Return_08"] = abs(((data_08["Open_08"].shift(-1) - data_08["Open_08"]) / data_08["Open_08"]) * 100)
-data_08["Log_Return_08"] = np.log(data_08["Open_08"].shift(-1) / data_08["Open_08"])
-
-# Add a day-of-week column (based on the day the 08:00 observation occurs)
-data_08["DayOfWeek"] = pd.to_datetime(data_08["Date"]).dt.day_name()
+report.stage("08:00 to 08:00 moves")
+# The daily bars anchored at 08:00, from each 08:00 open to the next day's (based on the day the 08:00 observation occurs).
+data_08 = pyramid.moves("1d@08").rename(columns={"Open": "Open_08", "Return": "Return_08", "Log_Return": "Log_Return_08"})
 
 # Summary statistics for the 08:00 to 08:00 move by day-of-week
-nextday_summary = data_08.groupby("DayOfWeek")["Return_08"].agg(["mean", "std", "median", "count"])
+nextday_summary = query(data_08).group_by("DayOfWeek", "Return_08").collect(engine)
 print("08:00 to 08:00 move summary by Day-of-Week:")
 print(nextday_summary)
 
@@ -71,4 +72,11 @@ plt.hist(data_08["Return_08"].dropna(), bins=200, edgecolor="k")
 plt.title("Histogram: 08:00 to 08:00 Returns")
 plt.xlabel("Return (%)")
 plt.ylabel("Frequency")
-plt.show()
\ No newline at end of file
+plt.show()
+
+# --- Every level of the pyramid: size of the move from one bar's open to the next ---
+report.stage("moves by horizon")
+horizon_summary = pd.DataFrame({level: pyramid.moves(level)["Return"].agg(["mean", "std", "median", "count"])
+                                for level in pyramid.levels}).T
+print("Open to next open move summary by horizon:")
+print(horizon_summary)
@@ -0,0 +1,66 @@
+import os
+import sys
+import yaml
+
+# We start from our private data path, where the shared shortvol package lives too.
+directory_path = os.getenv("Short_Volatility_Path")
+sys.path.append(directory_path)
+directory_path = directory_path + "/Seasonal/"
+
+from shortvol.entry_timing import build_store, grid_minutes, load_store, save_store, timing_pl, timing_summary
+from shortvol.instrument import start_run
+from shortvol.pipelines import friday_signals, shared_cache
+from shortvol.plan import build_plan, execute_plan, plan_summary, timing_requests
+from shortvol.polygon import PolygonClient
+
+# Our settings live in the same config as the rest of the seasonal study, under entry_timing.
+with open(os.path.join(directory_path, "config.yaml"), "r") as file:
+    config = yaml.safe_load(file)
+timing = config["entry_timing"]
+endpoints = config["api"]["endpoints"]
+
+# Every stage is timed, requests and cache hits counted, in a JSON report under "Run reports".
+report = start_run("Seasonal entry timing")
+
+# Our study sells the straddle on the Friday close. Here we ask: what if we had sold it at any other minute
+# of the Friday, and bought it back at any minute of the session it expires on, instead of waiting for expiry?
+report.stage("load Fridays")
+F_SPY = friday_signals(config)
+underlying = config["ETFs"][0]
+
+# The minute bars of SPY and of every straddle of each Friday's range come in bulk: one request per contract
+# covering both sessions, the contracts of a Friday found with a single chain lookup per leg type.
+# They go through the plan and the cache shared with the other Polygon scripts, nothing is asked twice.
+report.stage("plan requests")
+cache = shared_cache()
+request_budget = config["general"]["request_budget"]
+rate_limit = config["api"]["rate_limit_per_minute"]
+plan = build_plan(timing_requests(F_SPY, underlying, endpoints, timing["strike_padding"]), cache, endpoints, request_budget)
+for key, value in plan_summary(plan, rate_limit, request_budget).items():
+    print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+
+report.stage("fetch")
+client = PolygonClient(config["api"]["base_url"], os.getenv("POLYGON_API_KEY"), rate_limit, cache, request_budget)
+execute_plan(client, plan, endpoints)
+client.budget = client.sent  # From here on we only read what the cache holds.
+
+# The bars are laid out once in arrays, a row per Friday, and saved: Fridays already complete in the saved
+# arrays are not read from the cache again, so a new week only adds its own Friday.
+report.stage("minute bars")
+store = build_store(client, F_SPY, underlying, endpoints, timing["strike_padding"], load_store())
+save_store(store)
+if not store["Complete"].all():
+    print(f"{(~store['Complete']).sum()} Fridays are still missing bars, run again once the budget allows.")
+
+# Every entry minute against every exit minute (and holding to expiry), for every Friday at once.
+report.stage("grid")
+entries = grid_minutes(timing["entry_start"], timing["entry_end"], timing["step"])
+exits = grid_minutes(timing["exit_start"], timing["exit_end"], timing["step"])
+pl = timing_pl(store, entries, exits)
+summary = timing_summary(pl, entries, exits)
+summary.to_csv(os.path.join(directory_path, "Entry timing grid.csv"), index=False)
+
+# The close held to expiry is what our study trades today, the yardstick for every other cell.
+print(summary[(summary["Entry"] == "16:00") & (summary["Exit"] == "expiry")].to_string(index=False))
+print("\nBest entry and exit windows:")
+print(summary[summary["Trades"] >= max(len(pl) // 2, 1)].head(10).to_string(index=False))
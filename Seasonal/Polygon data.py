@@ -1,24 +1,34 @@
-import requests
 import os
+import sys
 import pandas as pd
 import numpy as np
 import yaml
-import time
-import pickle
-from datetime import timedelta
 
 # We start by pinpointing the secret location where our data lives.
 # The environment variable "Short_Volatility_Path" ensures that our sensitive file paths remain private.
 directory_path = os.getenv("Short_Volatility_Path")
+# The shared shortvol package lives right there, so we make it importable.
+sys.path.append(directory_path)
 # To keep our seasonal analyses neatly organized, we append the "Seasonal" subdirectory.
 directory_path = directory_path + "/Seasonal/"
 
+from shortvol.instrument import start_run
+from shortvol.option_store import NO_CONTRACT, load_option_store, lookup_closes, lookup_contracts, save_option_store
+from shortvol.pipelines import friday_signals, shared_cache, shared_plan
+from shortvol.plan import execute_plan, plan_summary
+from shortvol.polygon import PolygonClient
+from shortvol.validation import check, option_checks, validate_options
+
 # Our configuration settings are stored externally in a YAML file.
 # This allows us to adjust API endpoints, rate limits, and other parameters without changing our code.
 Config_path = os.path.join(directory_path, "config.yaml")
 with open(Config_path, "r") as file:
     config = yaml.safe_load(file)
 
+# Every stage we go through is timed, and each request, cache hit and rate limit wait is counted,
+# all of it landing in a JSON report under "Run reports" (see shortvol/instrument.py).
+report = start_run("Seasonal Polygon data")
+
 # We retrieve our API key from an environment variable for security reasons.
 # This practice keeps our credentials safe and out of our source code.
 POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
@@ -30,16 +40,16 @@ options_contracts_endpoint = config["api"]["endpoints"]["options_contracts"]
 Daily_OC = config["api"]["endpoints"]["daily_oc"]
 # We also respect the API’s request-per-minute limitations by reading the rate limit from our config.
 rate_limit = config["api"]["rate_limit_per_minute"]
-
-# Our API requests need proper identification.
-# Thus, we build an authorization header that quietly conveys our credentials.
-headers = {"Authorization" : f"{POLYGON_API_KEY}"}
+# The number of contracts asked for per lookup is part of the request, kept equal to the ETF pipeline's.
+api_limit = config["general"]["api_result_limit"]
 
 # Our journey continues as we load historical SPY data.
 # This CSV file forms the foundation for our options strategy analysis.
-F_SPY = pd.read_csv(directory_path + "Friday SPY data")
-# We choose to focus on data from March 1, 2023, onward, where our strategy's dynamics truly unfold.
-F_SPY_2025 = F_SPY[F_SPY["Date"] >= "2023-03-01"].copy()
+# We choose to focus on data from general.filter_start_date (March 1, 2023) onward, where our strategy's dynamics truly unfold.
+report.stage("load signals")
+F_SPY_2025 = friday_signals(config)
+# "Friday SPY data" holds a single underlying, the one listed under ETFs in our config.
+underlying = config["ETFs"][0]
 
 # From our curated DataFrame, we extract key details:
 # Dates tell us when each trade was signaled,
@@ -49,161 +59,58 @@ Dates = F_SPY_2025["Date"].to_list()
 Strikes = F_SPY_2025["Strike_Close"].to_list()
 Expiration_dates = F_SPY_2025["Next_Date"].to_list()
 
-# We initialize empty lists to capture the call and put option details.
-# These lists will store the tickers and, later on, their closing prices.
-Calls = []
-Puts = []
-Call_prices = []
-Put_prices = []
-
-# We combine our base URL with the endpoint for option contracts.
-# This concatenation provides a complete address for our API calls.
-full_url = url + options_contracts_endpoint
-
-# Before diving into our API calls, we give the system a brief moment (60 seconds).
-# This pause can help avoid triggering rate limits immediately upon starting our requests.
-time.sleep(60)
-
-# We introduce a simple counter, 'x', to keep track of our API requests.
-# Respecting rate limits is paramount, and this counter helps us stay within bounds.
-x = 0
-
-# Now begins the first chapter of our API saga: fetching call option tickers.
-# For each trading day, we construct a set of parameters that reflect our precise requirements—
-# targeting SPY calls with the exact strike and expiration criteria.
-for i in range(len(Dates)):
-    params = {
-        "underlying_ticker": "SPY",  # Our strategy revolves around the SPY ETF.
-        "contract_type": "call",     # We start with the bullish call options.
-        "expiration_date": Expiration_dates[i],
-        "strike_price": Strikes[i],
-        "expired": "true",           # We include expired contracts to gain a comprehensive view.
-        "sort": "expiration_date"    # Sorting by expiration ensures consistency in results.
-    }
-
-    # We send our request to the API, carrying our carefully crafted parameters.
-    response = requests.get(full_url, headers=headers, params=params)
-    x += 1  # Each API call nudges our counter upward.
-    if x == 5:
-        # Every five requests, we pause—a respectful nod to the API's rate limitations.
-        time.sleep(60)
-        x = 0
-
-    # Upon receiving a response, we first check for success.
-    if response.status_code == 200:
-        response = response.json()  # Convert the raw response into a navigable dictionary.
-        results = response.get("results", [])
-        if results:
-            # When the stars align and we get valid data, we select the first call option ticker.
-            print(results)
-            Call_ticker = results[0]["ticker"]
-            Calls.append(Call_ticker)
-        else:
-            # Should no results appear, we log the circumstance and carry on.
-            print(f"No results for Call: {params}")
-    else:
-        # Any API hiccups are noted with a detailed error message for future debugging.
-        print(f"Error in Call request: {response.status_code} - {response.text}")
-
-# With our call options recorded, we turn our gaze to the put options.
-# This loop mirrors the previous one, with the only difference being the option type.
-for i in range(len(Dates)):
-    params = {
-        "underlying_ticker": "SPY",
-        "contract_type": "put",      # Now, we focus on the defensive put options.
-        "expiration_date": Expiration_dates[i],
-        "strike_price": Strikes[i],
-        "expired": "true",
-        "sort": "expiration_date"
-    }
-
-    response = requests.get(full_url, headers=headers, params=params)
-    x += 1
-    if x == 5:
-        time.sleep(60)
-        x = 0
-
-    if response.status_code == 200:
-        response = response.json()
-        results = response.get("results", [])
-        if results:
-            print(results)
-            Put_ticker = results[0]["ticker"]
-            Puts.append(Put_ticker)
-        else:
-            print(f"No results for Put: {params}")
-    else:
-        print(f"Error in Put request: {response.status_code} - {response.text}")
-    
-# Having gathered the tickers, we now delve into pricing data for the call options.
-# Each ticker is paired with its corresponding trading date, as we seek to capture the closing price.
-for i in range(len(Calls)):
-    ticker = Calls[i]
-    date = Dates[i]
-    # We craft a URL specific to the daily open/close data for the given ticker and date.
-    full_url = f"{url}{Daily_OC}{ticker}/{date}"
-
-    params = {"adjusted": True}  # Adjustments are crucial to account for corporate actions or splits.
-
-    response = requests.get(full_url, headers=headers, params=params)
-    x += 1
-    if x == 5:
-        time.sleep(60)
-        x = 0
-    if response.status_code == 200:
-        response = response.json()
-        if response:
-            # The 'close' price encapsulates the final market sentiment for the day.
-            Call_price = response["close"]
-            Call_prices.append(Call_price)
-            print(response)
-        else:
-            print(f"No results for {ticker}: {params}")
-    else:
-        print(f"Error in {ticker} request: {response.status_code} - {response.text}")
-
-# In a similar vein, we fetch the closing prices for our put options.
-for i in range(len(Puts)):
-    ticker = Puts[i]
-    date = Dates[i]
-    full_url = f"{url}{Daily_OC}{ticker}/{date}"
-
-    params = {"adjusted": True}
-
-    response = requests.get(full_url, headers=headers, params=params)
-    x += 1
-    if x == 5:
-        time.sleep(60)
-        x = 0
-    if response.status_code == 200:
-        response = response.json()
-        if response:
-            Put_price = response["close"]
-            Put_prices.append(Put_price)
-            print(response)
-        else:
-            print(f"No results for {ticker}: {params}")
-    else:
-        print(f"Error in {ticker} request: {response.status_code} - {response.text}")
-
-# With our data now in hand, we consolidate our findings into a single dictionary.
-# This packaging step makes it simple to store and later retrieve our curated dataset.
-Data = {
-    "Calls" : Calls,
-    "Puts" : Puts,
-    "Call_prices" : Call_prices,
-    "Put_prices": Put_prices
-}
-
-# We persist our options data to disk using pickle—a fast, binary serialization method.
-# This choice avoids unnecessary API calls on subsequent runs, saving time and resources.
-with open(directory_path + "Friday Options Data.pkl", "wb") as file:
-    pickle.dump(Data, file)
+# Every response lands in a cache shared with the "On ETFs" pipeline, so nothing is ever requested twice,
+# not in this run, not in a later one, and not by the other subproject.
+cache = shared_cache()
+
+# Before sending a single request we plan them all, ours and the ETF backtest's together.
+# Identical requests are merged, cached ones are skipped, and a contract needed on several Fridays
+# has its daily closes fetched in one aggregates request instead of one call per date.
+report.stage("plan requests")
+request_budget = config["general"]["request_budget"]
+plan = shared_plan(cache, request_budget)
+for key, value in plan_summary(plan, rate_limit, request_budget).items():
+    print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+
+# The client respects the API's rate limit on its own, waiting only as long as needed,
+# and stops sending once the run's budget is spent; the next run picks up from the cache.
+report.stage("fetch")
+client = PolygonClient(url, POLYGON_API_KEY, rate_limit, cache, request_budget)
+execute_plan(client, plan, config["api"]["endpoints"])
+client.budget = client.sent  # From here on we only read what the cache holds.
+
+# Now we read our call and put contracts back, for the exact strike and expiration of each Friday.
+# Contracts and closes already in the option store (shortvol/option_store.py) are found with an integer search,
+# the others are read from the cache and interned: each contract becomes an id, each close a row of typed arrays.
+# A missing contract is NO_CONTRACT (-1), so every array lines up with our Fridays.
+report.stage("assemble P&L")
+option_store = load_option_store()
+Calls = lookup_contracts(option_store, client, options_contracts_endpoint, underlying, "call", Expiration_dates, Strikes, api_limit)
+Puts = lookup_contracts(option_store, client, options_contracts_endpoint, underlying, "put", Expiration_dates, Strikes, api_limit)
+
+# The 'close' price encapsulates the final market sentiment for the day, so that's what we take for each leg,
+# along with how many contracts traded on it.
+Call_prices, Call_volumes = lookup_closes(option_store, client, Daily_OC, Calls, Dates)
+Put_prices, Put_volumes = lookup_closes(option_store, client, Daily_OC, Puts, Dates)
+
+# We persist our options data to disk: the store replaces the lists of tickers and prices we used to pickle,
+# and "Results analysis.py" joins our Fridays with their premiums from it.
+save_option_store(option_store)
 
 # Our final act is to weave the collected option prices back into our original SPY DataFrame.
 # By merging this data, we enrich our historical record with real option performance.
 F_SPY_2025["Call_prices"] = Call_prices
 F_SPY_2025["Put_prices"] = Put_prices
+F_SPY_2025["Calls"] = pd.array(np.where(Calls == NO_CONTRACT, None, Calls), dtype="Int32")
+F_SPY_2025["Puts"] = pd.array(np.where(Puts == NO_CONTRACT, None, Puts), dtype="Int32")
+F_SPY_2025["Call_volumes"] = Call_volumes
+F_SPY_2025["Put_volumes"] = Put_volumes
+
+# Before any P&L, closes that printed on no volume, stale quotes and strikes far from the Close are quarantined
+# (shortvol/validation.py), what was taken out is kept in "Data quality".
+F_SPY_2025 = check("Friday options", F_SPY_2025, validate_options, close="Close", strike="Strike_Close",
+                   prices=("Call_prices", "Put_prices"), volumes=("Call_volumes", "Put_volumes"), contracts=("Calls", "Puts"),
+                   **option_checks(config)).copy()
 # The "Premium" is simply the sum of both call and put prices, representing the total received.
 F_SPY_2025["Premium"] = F_SPY_2025["Call_prices"] + F_SPY_2025["Put_prices"]
 
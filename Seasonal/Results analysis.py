@@ -1,24 +1,62 @@
 import pickle
 import pandas as pd
 import os
+import sys
+import yaml
 import numpy as np
 
+# The shared shortvol package lives at the root of our data path, next to the subprojects.
+sys.path.append(os.getenv("Short_Volatility_Path"))
+from shortvol.entry_timing import load_store
+from shortvol.exits import close_out, exit_grid, exit_summary, minute_values, rule_values
+from shortvol.instrument import start_run
+from shortvol.metrics import compute_performance, StrategyMonitor
+from shortvol.option_store import load_option_store, save_option_store
+from shortvol.pipelines import friday_signals
+from shortvol.regimes import load_features, regime_table
+
+# Each stage below is timed, along with the Fridays we drop, in a JSON report under "Run reports".
+report = start_run("Seasonal results analysis")
+report.stage("load")
+
 # We begin by retrieving our saved option pricing data—our careful record of past API calls.
-# By using pickle, we can effortlessly rehydrate our Python objects without re-running expensive API requests.
+# The option store keeps every contract and close we fetched as integers and arrays, no request is re-run.
 directory_path = os.getenv("Short_Volatility_Path") + "/Seasonal/"
-with open(os.path.join(directory_path, "Friday Options Data.pkl"), "rb") as file:
-    Data_dict = pickle.load(file)
+with open(os.path.join(directory_path, "config.yaml"), "r") as file:
+    config = yaml.safe_load(file)
+option_store = load_option_store()
 
 # Next, we load our SPY data, the backbone of our analysis.
 # We focus on data from March 1, 2023, onward to capture the era in which our strategy is actively deployed.
-F_SPY = pd.read_csv(os.path.join(directory_path, "Friday SPY data"))
-F_SPY_2025 = F_SPY[F_SPY["Date"] >= "2023-03-01"].copy()
+# The same Fridays "Polygon data.py" priced, read as one query (shortvol/query.py): the dates are sorted, a binary
+# search finds where to start, on pandas or polars as general.query_engine says.
+F_SPY_2025 = friday_signals(config)
 
+report.stage("P&L")
 # We now enrich our SPY data with the option pricing details.
 # Multiplying by 100 converts the prices to a more granular unit (e.g., cents instead of dollars),
 # which is standard practice when dealing with options premiums.
-F_SPY_2025["Call_prices"] = [100 * Data_dict["Call_prices"][i] for i in range(len(Data_dict["Call_prices"]))]
-F_SPY_2025["Put_prices"] = [100 * Data_dict["Put_prices"][i] for i in range(len(Data_dict["Put_prices"]))]
+# Each Friday's legs are found in the option store filled by "Polygon data.py", an integer search on
+# (underlying, expiry, type, strike), then their closes on the Friday with another one on (contract, day).
+# Fridays Polygon had no price for come back as NaN.
+underlying = config["ETFs"][0]
+
+
+def leg_closes(contract_type):
+    legs = option_store.find(underlying, F_SPY_2025["Next_Date"], contract_type, F_SPY_2025["Strike_Close"])
+    return option_store.closes(legs, F_SPY_2025["Date"])[0]
+
+
+# Fridays priced before the store existed are read once from the lists of tickers and prices we used to pickle.
+legacy_path = os.path.join(directory_path, "Friday Options Data.pkl")
+if np.isnan(leg_closes("call")).all() and os.path.exists(legacy_path):
+    with open(legacy_path, "rb") as file:
+        Data_dict = pickle.load(file)
+    for legs, prices in (("Calls", "Call_prices"), ("Puts", "Put_prices")):
+        option_store.add_prices(option_store.intern(Data_dict[legs]), F_SPY_2025["Date"], np.array(Data_dict[prices], dtype=float))
+    save_option_store(option_store)
+F_SPY_2025["Call_prices"] = 100 * leg_closes("call")
+F_SPY_2025["Put_prices"] = 100 * leg_closes("put")
 # The total premium is the sum of what we received from both call and put options,
 # offering a complete view of the income from our strategy.
 F_SPY_2025["Premium"] = F_SPY_2025["Call_prices"] + F_SPY_2025["Put_prices"]
@@ -40,80 +78,16 @@ F_SPY_2025.to_csv(os.path.join(directory_path, "Friday SPY 2023 to 2025 data"),
 # Time is of the essence in performance evaluation.
 # We convert our 'Date' column to datetime so that our time-series analysis is accurate,
 # then sort the records chronologically to properly trace the evolution of our equity curve.
+# Fridays without both premiums can't be traded, so they sit out of the performance figures.
+report.stage("performance")
+rows = len(F_SPY_2025)
+F_SPY_2025.dropna(subset=["PL"], inplace=True)
+report.dropped("Fridays without premiums dropna", rows, len(F_SPY_2025))
 F_SPY_2025["Date"] = pd.to_datetime(F_SPY_2025["Date"])
 F_SPY_2025.sort_values("Date", inplace=True)
 F_SPY_2025.reset_index(drop=True, inplace=True)
 
-def compute_performance(df, initial_equity):
-    """
-    Computes key performance metrics for a portfolio given an initial equity.
-    
-    Parameters:
-      df (DataFrame): The trade-level dataframe (must include Date and PL columns).
-      initial_equity (float): The starting equity.
-      
-    Returns:
-      dict: A dictionary containing performance metrics.
-    """
-    # We work on a copy of the data to safeguard the original record.
-    data = df.copy()
-    # Building an equity curve allows us to see how each trade influences our overall portfolio.
-    data['Cumulative_PL'] = data['PL'].cumsum()
-    data['Equity'] = initial_equity + data['Cumulative_PL']
-    
-    # Our final equity is the sum of the starting capital and the total profit/loss.
-    # This leads us naturally to calculate the total return and the ROI.
-    final_equity = data['Equity'].iloc[-1]
-    total_return = final_equity - initial_equity
-    ROI = total_return / initial_equity
-    
-    # To measure our strategy's annualized performance, we compute the Compound Annual Growth Rate (CAGR).
-    # This metric smooths out the journey, providing a yearly rate that’s comparable to other investments.
-    start_date = data["Date"].iloc[0]
-    end_date = data["Date"].iloc[-1]
-    years = (end_date - start_date).days / 365.25
-    CAGR = (final_equity / initial_equity) ** (1 / years) - 1 if years > 0 else np.nan
-    
-    # Trade-level statistics reveal the underlying mechanics of our performance.
-    # We separate winning trades from losing ones, calculate the win rate, and assess the average gains and losses.
-    wins = data[data["PL"] > 0]
-    losses = data[data["PL"] < 0]
-    win_rate = len(wins) / len(data) if len(data) > 0 else np.nan
-    avg_win = wins["PL"].mean() if not wins.empty else 0
-    avg_loss = losses["PL"].mean() if not losses.empty else 0
-    # The profit factor summarizes the risk/reward ratio by comparing total gains to total losses.
-    profit_factor = wins["PL"].sum() / abs(losses["PL"].sum()) if losses["PL"].sum() != 0 else np.nan
-
-    # Maximum drawdown tells the story of the worst period in our portfolio,
-    # quantifying the largest drop from a peak to a subsequent trough.
-    data['Roll_Max'] = data['Equity'].cummax()
-    data['Drawdown'] = (data['Equity'] - data['Roll_Max']) / data['Roll_Max']
-    max_drawdown = data['Drawdown'].min()
-    
-    # To understand risk-adjusted returns, we approximate the Sharpe Ratio.
-    # By examining the volatility of trade-to-trade returns, we gauge whether our gains justify the risk taken.
-    data['Trade_Return'] = data['Equity'].pct_change()
-    if data['Trade_Return'].std() != 0 and len(data) > 1:
-        sharpe_ratio = (data['Trade_Return'].mean() / data['Trade_Return'].std()) * np.sqrt(52)
-    else:
-        sharpe_ratio = np.nan
-
-    # Our performance dictionary encapsulates the entire narrative of our trading journey.
-    return {
-        "Final Equity": final_equity,
-        "Total Return ($)": total_return,
-        "ROI": ROI,
-        "CAGR": CAGR,
-        "Win Rate": win_rate,
-        "Average Win": avg_win,
-        "Average Loss": avg_loss,
-        "Profit Factor": profit_factor,
-        "Max Drawdown": max_drawdown,
-        "Sharpe Ratio": sharpe_ratio,
-        "Number of Trades": len(data)
-    }
-
-# With our performance engine defined, we now compute our strategy's performance assuming a starting equity of $50,000.
+# With our performance engine (shortvol/metrics.py) at hand, we now compute our strategy's performance assuming a starting equity of $50,000.
 metrics_50k = compute_performance(F_SPY_2025, 50000)
 
 # To make our output more accessible, we define a helper function that formats decimal values as percentages.
@@ -129,3 +103,39 @@ for key, value in metrics_50k.items():
         print(f"{key}: {value:.2f}")
     else:
         print(f"{key}: {value}")
+
+# Full-period numbers hide when the edge fades, so we also replay the trades through the streaming metrics.
+# Each row holds the rolling Sharpe, Sortino and win rate over the last "rolling_window" trades, plus the running drawdown.
+# The monitor's state could be kept around and fed each new Friday as it closes, giving the same numbers as a full replay.
+report.stage("rolling metrics")
+rolling_window = config["metrics"]["rolling_window"]
+monitor = StrategyMonitor(50000, window=rolling_window, periods_per_year=52)
+rolling_metrics = monitor.run(F_SPY_2025["PL"], index=F_SPY_2025["Date"])
+print(rolling_metrics.tail(10))
+print(f"Longest drawdown: {monitor.drawdown.max_duration} trades")
+
+# The Fridays split by market backdrop: the regime features ETFs.py keeps for every session (shortvol/regimes.py),
+# cut in quantile buckets, the P&L of each bucket of each feature from a single group-by.
+features = load_features()
+if config["regimes"]["enabled"] and features is not None:
+    report.stage("regimes")
+    regime_PL = regime_table(F_SPY_2025, features, config["regimes"]["features"], config["regimes"]["buckets"],
+                             until=config["regimes"]["buckets_until"])
+    print(regime_PL)
+    regime_PL.to_csv(os.path.join(directory_path, "Regime results.csv"), index=False)
+
+# Every Friday above is held to the close of the session it expires on. When "Entry timing.py" has saved the minute
+# bars of those sessions, we also try buying the straddle back early: every profit target, stop-loss and time stop
+# of our config (shortvol/exits.py), on every Friday at once along the minutes of its expiry session.
+minute_store = load_store()
+if minute_store is not None:
+    report.stage("exit rules")
+    exits = config["exits"]
+    # Minute prices are per share, our premiums and payoffs per contract: the paths are scaled the same way.
+    values = close_out(100 * minute_values(minute_store, F_SPY_2025["Date"].dt.strftime("%Y-%m-%d"), F_SPY_2025["Strike_Close"]),
+                       F_SPY_2025["Payoff"])
+    rules = [rule_values(exits[kind]) for kind in ("targets", "stops", "time_stops")]
+    exit_PL, exit_step = exit_grid(F_SPY_2025["Premium"], values, *rules)
+    exit_table = exit_summary(exit_PL, exit_step, *rules)  # Avg_Held in minutes of the expiry session.
+    print(exit_table.head(10))
+    exit_table.to_csv(os.path.join(directory_path, "Exit rules.csv"), index=False)
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pandas as pd
+
+# As in every script, the data lives under the path held by "Short_Volatility_Path".
+# That same directory holds the shared shortvol package, so we put it on the import path.
+sys.path.append(os.getenv("Short_Volatility_Path"))
+
+from shortvol.config import load_config, subproject_path
+from shortvol.panel import load_panel
+from shortvol.seasonality import seasonality_table, weekend_screen
+
+directory_path = subproject_path("Seasonal")
+config = load_config("Seasonal")
+etf_config = load_config("On ETFs")
+
+# "SPY Friday.py" answers the weekend question for one ticker and two weekdays.
+# Here we ask it for the whole ETF universe, every weekday and several holding lengths at once.
+tickers = etf_config["tickers"]
+start_date = etf_config["general"]["start_date"]
+end_date = etf_config["general"]["end_date"]
+horizons = config["seasonality"]["horizons"]
+screen_weekday = config["seasonality"]["screen_weekday"]
+
+# The daily panel is shared with ETFs.py, so whichever script runs first pays for the downloads.
+panel = load_panel(tickers, start_date, end_date, subproject_path("On ETFs") + "ETF panel.pkl")
+
+# One grouped pass gives close-to-close, overnight and intraday distributions for every (ticker, weekday, horizon).
+table = seasonality_table(panel, horizons)
+table.to_pickle(directory_path + "Weekday seasonality.pkl")
+
+pd.set_option('display.max_rows', None)
+pd.set_option('display.max_columns', None)
+
+# The screen ranks tickers by how much bigger the move after the chosen weekday is than after any other day.
+# Candidates at the top are where the underlying moves most over that weekday's night, relative to the others.
+# Only realized moves are compared, no premium: whether a straddle seller is paid enough for it is not measured here.
+screen = weekend_screen(table, horizon=1, weekday=screen_weekday)
+print(f"{screen_weekday} vs other weekdays, next session close-to-close move:")
+print(screen)
+
+print(table.loc["SPY"])
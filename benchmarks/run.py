@@ -0,0 +1,302 @@
+"""
+Timings of the hot paths on seeded synthetic data, at several scales.
+
+    python benchmarks/run.py                      # every scale
+    python benchmarks/run.py --scales small medium --repeat 5
+
+Each run is saved to benchmarks/results/<timestamp>.json and compared with the previous one, so
+a regression shows up as a ratio above 1, and the timings across scales give the scaling curve.
+Nothing here touches the network or the data path: APIs are answered by the stand-ins in synthetic.py.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import yaml
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from shortvol.btc import fetch_candles, granularity_ms, hour_window_moves
+from shortvol.candles import empty_partition, merge_candles
+from shortvol.entry_timing import build_store, grid_minutes, timing_pl, timing_summary
+from shortvol.exits import close_out, exit_grid, exit_summary, rule_values
+from shortvol.hedging import simulate_hedge
+from shortvol.metrics import compute_performance
+from shortvol.options import straddle_pl
+from shortvol.panel import ticker_frame
+from shortvol.plan import build_plan, execute_plan, signal_requests
+from shortvol.polygon import PolygonClient, ResponseCache
+from shortvol.portfolio import portfolio_results
+from shortvol.pricing import straddle_price
+from shortvol.pyramid import CandlePyramid
+from shortvol.query import query
+from shortvol.regimes import regime_table, update_features
+from shortvol.render import render_report, report_jobs
+from shortvol.schema import compact_panel, flag, frame_bytes
+from shortvol.shared import SharedPanel, map_tickers
+from shortvol.signal_index import SignalIndex
+from shortvol.signals import add_signals
+from shortvol.validation import validate_candles, validate_options, validate_panel
+
+from synthetic import FakeBitget, FakePolygon, daily_panel, friday_rows, hourly_candles, minute_paths, option_premiums
+
+RESULTS = os.path.join(REPO, "benchmarks", "results")
+
+# tickers x years of daily bars, days of hourly BTC candles, tickers sent through the Polygon fetch loop,
+# Fridays of minute bars for the entry timing grid.
+SCALES = {
+    "small": {"tickers": 5, "years": 2, "btc_days": 90, "fetch_tickers": 2, "fridays": 4},
+    "medium": {"tickers": 20, "years": 5, "btc_days": 365, "fetch_tickers": 5, "fridays": 13},
+    "large": {"tickers": 100, "years": 10, "btc_days": 1825, "fetch_tickers": 20, "fridays": 52},
+}
+
+with open(os.path.join(REPO, "On ETFs", "config.yaml"), "r") as file:
+    CONFIG = yaml.safe_load(file)
+with open(os.path.join(REPO, "Seasonal", "BTC", "config.yaml"), "r") as file:
+    BTC_CONFIG = yaml.safe_load(file)
+with open(os.path.join(REPO, "Seasonal", "config.yaml"), "r") as file:
+    SEASONAL_CONFIG = yaml.safe_load(file)
+
+
+def best_of(repeat, setup, func):
+    """Fastest of `repeat` runs of func(setup()), only func being timed, and its last result."""
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def run_signals(panel):
+    general = CONFIG["general"]
+    return {ticker: add_signals(ticker_frame(panel, ticker), general["vol_window"], general["mom_window"],
+                                general["for_window"], general["mom_1"])
+            for ticker in panel["Ticker"].unique()}
+
+
+def run_fetch(signals):
+    plan = build_plan(signal_requests(signals, [], CONFIG["api"]["endpoints"], CONFIG["general"]["api_result_limit"]),
+                      ResponseCache(":memory:"), CONFIG["api"]["endpoints"])
+    client = PolygonClient("http://localhost", "", 10 ** 9, ResponseCache(":memory:"), session=FakePolygon())
+    execute_plan(client, plan, CONFIG["api"]["endpoints"])
+    return client.sent
+
+
+def run_btc_fetch(days):
+    end = datetime(2020, 1, 1) + timedelta(days=days)
+    return fetch_candles(FakeBitget(), "http://localhost/api/v2/spot/market/history-candles", BTC_CONFIG["data"]["symbol"],
+                         BTC_CONFIG["data"]["granularity"], BTC_CONFIG["data"]["limit"], datetime(2020, 1, 1), end,
+                         BTC_CONFIG["bitget_api"]["limit"], sleep=lambda seconds: None)
+
+
+def run_timing_store(fridays):
+    client = PolygonClient("http://localhost", "", 10 ** 9, ResponseCache(":memory:"), session=FakePolygon())
+    return build_store(client, fridays, "SPY", CONFIG["api"]["endpoints"], SEASONAL_CONFIG["entry_timing"]["strike_padding"])
+
+
+def run_timing_grid(store):
+    timing = SEASONAL_CONFIG["entry_timing"]
+    entries = grid_minutes(timing["entry_start"], timing["entry_end"], timing["step"])
+    exits = grid_minutes(timing["exit_start"], timing["exit_end"], timing["step"])
+    return timing_summary(timing_pl(store, entries, exits), entries, exits)
+
+
+def run_exit_rules(premium, values):
+    rules = [rule_values(CONFIG["exits"][kind]) for kind in ("targets", "stops", "time_stops")]
+    return exit_summary(*exit_grid(premium, values, *rules), *rules)
+
+
+def run_scale(name, scale, repeat):
+    # Loaded the way ETFs.py loads it: compact schema, Close only.
+    panel = compact_panel(daily_panel(scale["tickers"], scale["years"]), ["Close"])
+    results = {}
+
+    full_panel = compact_panel(daily_panel(scale["tickers"], scale["years"]))
+    seconds, _ = best_of(repeat, lambda: (full_panel,), validate_panel)
+    results["validate_panel"] = {"seconds": seconds, "rows": len(full_panel)}
+
+    seconds, signals = best_of(repeat, lambda: (panel,), run_signals)
+    results["signals"] = {"seconds": seconds, "rows": len(panel),
+                          "bytes_per_ticker": sum(frame_bytes(signals).values()) / len(signals)}
+
+    seconds, _ = best_of(repeat, lambda: (panel,), lambda panel: SharedPanel.from_panel(panel).close())
+    results["shared_publish"] = {"seconds": seconds, "rows": len(panel)}
+
+    general = CONFIG["general"]
+    func = partial(add_signals, vol_window=general["vol_window"], mom_window=general["mom_window"],
+                   for_window=general["for_window"], mom_1=general["mom_1"])
+    with SharedPanel.from_panel(panel) as shared:
+        seconds, _ = best_of(repeat, lambda: (func, shared, None, 2), map_tickers)
+    results["signals_pool"] = {"seconds": seconds, "rows": len(panel)}  # Two workers attaching the panel, their start included.
+
+    index = SignalIndex.from_signals(signals)
+    dates = panel["Date"].to_numpy()
+    middle = (dates.min() + (dates.max() - dates.min()) // 4, dates.max() - (dates.max() - dates.min()) // 4)
+    seconds, _ = best_of(repeat, lambda: (None, *middle), index.query)
+    results["signal_query"] = {"seconds": seconds, "rows": len(index.dates)}  # Every ticker, the middle half of the dates.
+
+    selected = {ticker: data[flag(data)].reset_index() for ticker, data in signals.items()}
+    priced_by_ticker = {ticker: option_premiums(data, seed=i) for i, (ticker, data) in enumerate(selected.items())}
+    priced = pd.concat(priced_by_ticker.values(), ignore_index=True)
+    seconds, trades = best_of(repeat, lambda: (priced.copy(),), straddle_pl)
+    results["straddle_pl"] = {"seconds": seconds, "rows": len(priced)}
+
+    seconds, _ = best_of(repeat, lambda: (priced,), validate_options)
+    results["validate_options"] = {"seconds": seconds, "rows": len(priced)}
+
+    trades = trades.dropna(subset=["PL"]).sort_values("Date", ignore_index=True)
+    seconds, _ = best_of(repeat, lambda: (trades, 100000), compute_performance)
+    results["compute_performance"] = {"seconds": seconds, "rows": len(trades)}
+
+    # The regime features ETFs.py builds (the synthetic tickers stand in for SPY, VIXY...), then the book split by them.
+    regimes = CONFIG["regimes"]
+    names = ["T000_vol", "T001_trend", "T002_roll", "Cross_vol", "Dispersion", "Weekday", "Month_end", "Opex", "Holiday_next"]
+    seconds, features = best_of(repeat, lambda: (None, panel, names, regimes["window"], regimes["trend_window"]), update_features)
+    results["regime_features"] = {"seconds": seconds, "rows": len(panel)}
+    seconds, _ = best_of(repeat, lambda: (trades, features, names, regimes["buckets"]), regime_table)
+    results["regime_table"] = {"seconds": seconds, "rows": len(trades) * len(names)}  # Trade x feature pairs.
+
+    book = {ticker: straddle_pl(data.copy()) for ticker, data in priced_by_ticker.items()}
+    seconds, _ = best_of(repeat, lambda: (book, 100000), portfolio_results)
+    results["portfolio"] = {"seconds": seconds, "rows": len(book)}  # Tickers combined, all methods.
+
+    _, (_, weights) = best_of(1, lambda: (book, 100000), portfolio_results)
+    jobs = report_jobs(book, 100000, weights)
+    with tempfile.TemporaryDirectory() as folder:
+        # A new folder every repeat, every figure is drawn; then again in the last one, every figure is skipped.
+        seconds, _ = best_of(repeat, lambda: (jobs, tempfile.mkdtemp(dir=folder)), render_report)
+        results["render_report"] = {"seconds": seconds, "rows": len(jobs)}  # Figures drawn.
+        warm = os.path.join(folder, "warm")
+        render_report(jobs, warm)
+        seconds, _ = best_of(repeat, lambda: (jobs, warm), render_report)
+        results["render_report_unchanged"] = {"seconds": seconds, "rows": len(jobs)}
+
+    paths, tau = minute_paths(len(priced))
+    strike, sigma = np.full(len(paths), 100.0), np.full(len(paths), 0.2)
+    seconds, _ = best_of(repeat, lambda: (paths, tau, strike, sigma), simulate_hedge)
+    results["delta_hedge"] = {"seconds": seconds, "rows": paths.size}  # Trade-minutes, rebalanced every minute.
+
+    # The same straddles repriced on each day's close, the paths shortvol exits scores.
+    closes, days_left = paths[:, ::390], tau[:, ::390]
+    values = straddle_price(closes, strike[:, None], days_left, sigma[:, None])
+    premium, values = values[:, 0], close_out(values[:, 1:], np.abs(closes[:, -1] - strike))
+    seconds, table = best_of(repeat, lambda: (premium, values), run_exit_rules)
+    results["exit_rules"] = {"seconds": seconds, "rows": len(values) * len(table)}  # Trade x rule cells.
+
+    fridays = friday_rows(scale["fridays"])
+    seconds, store = best_of(repeat, lambda: (fridays,), run_timing_store)
+    results["entry_timing_store"] = {"seconds": seconds, "rows": len(fridays)}  # Answers parsed into the arrays, fake HTTP included.
+    seconds, grid = best_of(repeat, lambda: (store,), run_timing_grid)
+    results["entry_timing_grid"] = {"seconds": seconds, "rows": len(fridays) * len(grid)}  # Friday x entry x exit cells.
+
+    candles = hourly_candles(scale["btc_days"])
+    summary = lambda candles: query(hour_window_moves(candles, 0, 8)).group_by("DayOfWeek", "Return").collect()
+    seconds, _ = best_of(repeat, lambda: (candles,), summary)
+    results["btc_hour_window"] = {"seconds": seconds, "rows": len(candles)}
+
+    levels = BTC_CONFIG["pyramid"]["levels"]
+    seconds, _ = best_of(repeat, lambda: (CandlePyramid(levels), candles), CandlePyramid.update)
+    results["btc_pyramid_build"] = {"seconds": seconds, "rows": len(candles)}
+
+    def pyramid_after(history):
+        pyramid = CandlePyramid(levels)
+        pyramid.update(history)
+        return pyramid, candles
+
+    seconds, _ = best_of(repeat, lambda: pyramid_after(candles.iloc[:-24]), CandlePyramid.update)
+    results["btc_pyramid_update"] = {"seconds": seconds, "rows": 24}  # A day of new candles.
+
+    pyramid = pyramid_after(candles)[0]
+    summary = lambda pyramid: query(pyramid.moves("8h@00", 0)).group_by("DayOfWeek", "Return").collect()
+    seconds, _ = best_of(repeat, lambda: (pyramid,), summary)
+    results["btc_pyramid_window"] = {"seconds": seconds, "rows": len(pyramid.bars["8h@00"]["Start"])}  # The btc_hour_window study.
+
+    seconds, _ = best_of(repeat, lambda: (candles,), validate_candles)
+    results["validate_candles"] = {"seconds": seconds, "rows": len(candles)}
+
+    seconds, fetched = best_of(repeat, lambda: (scale["btc_days"],), run_btc_fetch)
+    results["btc_fetch"] = {"seconds": seconds, "rows": len(fetched)}
+
+    # A partition of the candle store taking a day of new candles, overlapping the last stored ones, with a gap.
+    step = granularity_ms(BTC_CONFIG["data"]["granularity"])
+    stored = merge_candles(empty_partition(), fetched.iloc[:-24], step)
+    seconds, _ = best_of(repeat, lambda: (stored, fetched.iloc[-30:].drop(fetched.index[-10]), step), merge_candles)
+    results["candle_merge"] = {"seconds": seconds, "rows": len(fetched)}
+
+    fetch_signals = dict(list(selected.items())[:scale["fetch_tickers"]])
+    seconds, sent = best_of(repeat, lambda: (fetch_signals,), run_fetch)
+    results["polygon_fetch"] = {"seconds": seconds, "rows": sent}  # Requests sent after planning.
+
+    for result in results.values():
+        result["rows_per_second"] = result["rows"] / result["seconds"] if result["seconds"] else None
+    return results
+
+
+def previous_result():
+    if not os.path.isdir(RESULTS):
+        return None
+    files = sorted(f for f in os.listdir(RESULTS) if f.endswith(".json"))
+    if not files:
+        return None
+    with open(os.path.join(RESULTS, files[-1]), "r") as f:
+        return json.load(f)
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=list(SCALES))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the fastest is kept.")
+    args = parser.parse_args()
+
+    previous = previous_result()
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "scales": {},
+    }
+    rows = []
+    for name in args.scales:
+        report["scales"][name] = run_scale(name, SCALES[name], args.repeat)
+        for bench, result in report["scales"][name].items():
+            before = ((previous or {}).get("scales", {}).get(name, {}).get(bench) or {}).get("seconds")
+            rows.append({"Scale": name, "Benchmark": bench, "Rows": result["rows"], "Seconds": result["seconds"],
+                         "Rows/s": result["rows_per_second"], "Bytes/ticker": result.get("bytes_per_ticker", np.nan),
+                         "vs previous": result["seconds"] / before if before else np.nan})
+
+    pd.set_option('display.max_rows', None)
+    pd.set_option('display.width', 200)
+    print(pd.DataFrame(rows).to_string(index=False))
+
+    os.makedirs(RESULTS, exist_ok=True)
+    path = os.path.join(RESULTS, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from shortvol.options import expiration_dates
+from shortvol.panel import PANEL_COLUMNS
+from shortvol.pricing import annualize_vol, black_scholes, year_fraction
+
+
+def daily_panel(n_tickers, n_years, seed=0):
+    """
+    Seeded stand-in for the yfinance panel (shortvol/panel.py): geometric random walks, one per ticker,
+    with a per-ticker volatility so the 20% volatility filter has something to pick from.
+
+    Returns:
+      DataFrame: Ticker, Date and PANEL_COLUMNS, sorted by Ticker then Date.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2010-01-01", periods=252 * n_years)
+    frames = []
+    for i in range(n_tickers):
+        vol = rng.uniform(0.005, 0.025)
+        # Volatility regimes, so quiet stretches (the signals) come and go.
+        regime = np.repeat(rng.uniform(0.5, 1.5, len(dates) // 21 + 1), 21)[:len(dates)]
+        returns = rng.normal(0.0002, vol * regime)
+        close = rng.uniform(20, 500) * np.exp(np.cumsum(returns))
+        gap = rng.normal(0, vol / 3, len(dates))
+        open_ = close * np.exp(-returns + gap)
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, vol / 2, len(dates))))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, vol / 2, len(dates))))
+        frames.append(pd.DataFrame({
+            "Ticker": f"T{i:03d}", "Date": dates,
+            "Open": open_, "High": high, "Low": low, "Close": close, "Adj Close": close,
+            "Volume": rng.integers(1e5, 1e7, len(dates)), "Dividends": 0.0, "Stock Splits": 0.0,
+        }))
+    return pd.concat(frames, ignore_index=True)[["Ticker", "Date"] + PANEL_COLUMNS]
+
+
+def hourly_candles(n_days, seed=0, start="2020-01-01"):
+    """Seeded stand-in for "Historical BTC data 2020 - 2025", with Time already parsed to datetime."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=24 * n_days, freq="h")
+    close = 10000 * np.exp(np.cumsum(rng.normal(0, 0.006, len(times))))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.003, len(times)))
+    return pd.DataFrame({"Time": times, "Open": open_, "High": np.maximum(open_, close) * (1 + spread),
+                         "Low": np.minimum(open_, close) * (1 - spread), "Close": close})
+
+
+def minute_paths(n_trades, days=7, sigma=0.2, seed=0):
+    """
+    Seeded minute paths (390 bars a session) of the underlyings of `n_trades` at-the-money straddles,
+    with their years to expiry, shaped like shortvol.hedging.gather_paths.
+    """
+    rng = np.random.default_rng(seed)
+    bars = days * 390
+    dt = days / 365 / bars
+    steps = rng.normal(-0.5 * sigma ** 2 * dt, sigma * np.sqrt(dt), (n_trades, bars))
+    paths = 100 * np.exp(np.concatenate([np.zeros((n_trades, 1)), np.cumsum(steps, axis=1)], axis=1))
+    tau = np.tile(days / 365 - np.arange(bars + 1) * dt, (n_trades, 1))
+    return paths, tau
+
+
+def friday_rows(n_fridays, start="2023-03-03"):
+    """Fridays shaped like friday_signals' rows, their range around the 100 the minute bars of FakePolygon start at."""
+    dates = pd.date_range(start, periods=n_fridays, freq="W-FRI")
+    return pd.DataFrame({"Date": dates.strftime("%Y-%m-%d"), "Next_Date": (dates + pd.offsets.BDay()).strftime("%Y-%m-%d"),
+                         "Low": 99.0, "High": 101.0, "Close": 100.0, "Next_Close": 100.0})
+
+
+def option_premiums(signals, friday_expiration=False, multiplier=1.3, seed=0):
+    """
+    Call and put premiums for the straddles sold on each signal, in the shape "Polygon data.py" assembles them.
+
+    Black-Scholes on realized vol times a noisy multiplier, standing in for the fetched prices.
+
+    Parameters:
+      signals (DataFrame): Date, Close, Volatility and Future_Close, like a ticker of ETF_filtered.
+    """
+    rng = np.random.default_rng(seed)
+    data = signals.copy()
+    data['Expiration'] = expiration_dates(data['Date'], friday_expiration)
+    data['Strike'] = data['Close'].round()
+    T = year_fraction(data['Date'], data['Expiration'])
+    sigma = annualize_vol(data['Volatility']) * multiplier * rng.lognormal(0, 0.15, len(data))
+    data['Call_Price'] = black_scholes(data['Close'], data['Strike'], T, sigma, is_call=True)
+    data['Put_Price'] = black_scholes(data['Close'], data['Strike'], T, sigma, is_call=False)
+    return data
+
+
+class _Response:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class FakePolygon:
+    """
+    Local stand-in for the Polygon API, used as the `session` of a PolygonClient.
+
+    Contract lookups return the standard OCC symbol (every strike of the range for chain lookups), daily closes
+    and aggregates return seeded prices, and `missing` of the daily closes answer 404 like untraded contracts do.
+    """
+
+    def __init__(self, missing=0.1, seed=0):
+        self.missing = missing
+        self.seed = seed
+        self.calls = 0
+
+    def _rng(self, url):
+        return np.random.default_rng([self.seed, zlib.crc32(url.encode())])
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        self.calls += 1
+        if "/options/contracts" in url:
+            expiry = params["expiration_date"].replace("-", "")[2:]
+            kind = params["contract_type"][0].upper()
+            if "strike_price" in params:
+                strikes = [float(params["strike_price"])]
+            else:  # A chain lookup, every dollar strike of the range.
+                strikes = np.arange(np.ceil(float(params["strike_price.gte"])), float(params["strike_price.lte"]) + 1)
+            return _Response(200, {"results": [{"ticker": f"O:{params['underlying_ticker']}{expiry}{kind}{round(strike * 1000):08d}",
+                                                "strike_price": float(strike)} for strike in strikes]})
+        rng = self._rng(url)
+        if "/range/" in url:
+            multiplier, timespan, first, last = url.split("/range/")[1].split("/")
+            days = pd.bdate_range(first, last, tz="America/New_York")
+            if timespan == "day":
+                starts = days + pd.Timedelta(hours=16)
+                prices = rng.uniform(0.5, 10, len(starts)).round(2)
+            else:  # Regular session bars of an underlying, a random walk.
+                step = pd.Timedelta(minutes=int(multiplier) * (60 if timespan == "hour" else 1))
+                session = pd.timedelta_range(pd.Timedelta(hours=9, minutes=30), pd.Timedelta(hours=16) - step, freq=step)
+                starts = pd.DatetimeIndex([day + offset for day in days for offset in session])
+                prices = (100 * np.exp(np.cumsum(rng.normal(0, 0.0005, len(starts))))).round(2)
+            bars = [{"t": int(start.timestamp() * 1000), "o": p, "h": p, "l": p, "c": p, "v": 100}
+                    for start, p in zip(starts, prices)]
+            return _Response(200, {"results": bars})
+        if rng.random() < self.missing:
+            return _Response(404, {})
+        return _Response(200, {"close": round(rng.uniform(0.5, 10), 2), "volume": 100})
+
+
+class FakeBitget:
+    """Local stand-in for Bitget's history-candles endpoint, called like requests.get."""
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.calls = 0
+
+    def __call__(self, url, params):
+        self.calls += 1
+        limit = int(params["limit"])
+        end = int(params["endTime"])
+        rng = np.random.default_rng([self.seed, end // 3600000])
+        close = 10000 * np.exp(np.cumsum(rng.normal(0, 0.006, limit)))
+        rows = [[str(end - (limit - i) * 3600000), f"{c:.2f}", f"{c * 1.002:.2f}", f"{c * 0.998:.2f}", f"{c:.2f}"]
+                for i, c in enumerate(close)]
+        return _Response(200, {"data": rows})
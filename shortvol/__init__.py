@@ -0,0 +1,6 @@
+"""Shared building blocks for the short volatility research scripts.
+
+The scripts under "On ETFs" and "Seasonal" stay the entry points; the code that
+is reused between them (data panels, analytics engines) lives here, along with
+the `shortvol` command (shortvol/cli.py) that chains the same stages in one process.
+"""
@@ -0,0 +1,5 @@
+import sys
+
+from shortvol.cli import main
+
+sys.exit(main())
@@ -0,0 +1,86 @@
+import time
+
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from shortvol import instrument
+from shortvol.polygon import RateLimiter
+
+CANDLE_COLUMNS = ["Time", "Open", "High", "Low", "Close"]
+GRANULARITY_MS = {"min": 60_000, "h": 3_600_000, "day": 86_400_000, "week": 604_800_000}
+
+
+def granularity_ms(granularity):
+    """Milliseconds per candle of a Bitget granularity: "1min", "15min", "1h", "4h", "1day", "1week"..."""
+    unit = granularity.lstrip("0123456789")
+    return int(granularity[:len(granularity) - len(unit)] or 1) * GRANULARITY_MS[unit]
+
+
+def fetch_candles(get, url, symbol, granularity, limit, data_start, data_end, limit_per_second, sleep=time.sleep,
+                  limiter=None):
+    """
+    Candles from Bitget between two dates, the loop of "BTC API data.py".
+
+    One request per `limit` candles, each asking for the `limit` candles before its time point (the first one
+    `limit` candles after data_start, the last one past data_end), at most `limit_per_second` requests in any second.
+
+    Parameters:
+      get (callable): requests.get, or anything answering get(url=..., params=...) the same way.
+      url (str): Bitget base url plus the historical data endpoint.
+      symbol, granularity (str): data.symbol and data.granularity from the BTC config.
+      limit (int): data.limit, candles per request.
+      data_start, data_end (datetime): Range to cover.
+      limit_per_second (int): bitget_api.limit.
+      sleep (callable): time.sleep, swapped out when the loop runs against a local stand-in.
+      limiter (RateLimiter): Shared with other fetches of the same venue running at the same time, in place of
+        one of this fetch's own (see shortvol/candles.py).
+
+    Returns:
+      DataFrame: CANDLE_COLUMNS, Time in Unix milliseconds as Bitget returns it.
+    """
+    data_timepoints = []
+    interval = timedelta(milliseconds=limit * granularity_ms(granularity))
+    current_time = data_start + interval
+    while current_time - interval <= data_end:
+        data_timepoints.append(int(current_time.timestamp() * 1000))  # Unix milliseconds.
+        current_time += interval
+
+    limiter = limiter or RateLimiter(limit_per_second, period=1.0, sleep=sleep)
+    rows = []
+    for end_time in data_timepoints:
+        params = {"symbol": symbol, "granularity": granularity, "endTime": end_time, "limit": limit}
+        limiter.wait()
+        with instrument.timed("http.seconds"):
+            response = get(url=url, params=params).json()
+        instrument.count("http.requests")
+        instrument.count("http.requests." + instrument.endpoint_group(urlsplit(url).path))
+        rows += [(datapoint[0], *map(float, datapoint[1:5])) for datapoint in response.get("data", [])]
+    return pd.DataFrame(rows, columns=CANDLE_COLUMNS)
+
+
+def hour_window_moves(candles, start_hour=0, end_hour=8):
+    """
+    Move from the start_hour open to the end_hour open of each day, as in "Data analysis.py".
+
+    Parameters:
+      candles (DataFrame): Hourly candles with Time (datetime) and Open.
+      start_hour, end_hour (int): Hours of the two opens, 0 and 8 in the study.
+
+    Returns:
+      DataFrame: Date, Open_<start>, Open_<end>, Return (absolute move in percent), Log_Return and DayOfWeek,
+      for days with both candles.
+    """
+    start_col, end_col = f"Open_{start_hour:02d}", f"Open_{end_hour:02d}"
+    hours = candles["Time"].dt.hour
+    dates = candles["Time"].dt.date
+    start = pd.DataFrame({"Date": dates[hours == start_hour], start_col: candles.loc[hours == start_hour, "Open"]})
+    end = pd.DataFrame({"Date": dates[hours == end_hour], end_col: candles.loc[hours == end_hour, "Open"]})
+
+    moves = pd.merge(start, end, on="Date", how="inner")
+    moves["Return"] = abs(((moves[end_col] - moves[start_col]) / moves[start_col]) * 100)
+    moves["Log_Return"] = np.log(moves[end_col] / moves[start_col])
+    moves["DayOfWeek"] = pd.to_datetime(moves["Date"]).dt.day_name()
+    return moves
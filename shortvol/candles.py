@@ -0,0 +1,188 @@
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from shortvol import instrument
+from shortvol.btc import CANDLE_COLUMNS, fetch_candles, granularity_ms
+from shortvol.config import subproject_path
+from shortvol.polygon import RateLimiter
+from shortvol.pyramid import HOUR_MS, candle_times
+from shortvol.validation import check, validate_candles
+
+### Candle store
+# Candles of every venue, symbol and granularity the BTC config lists, one partition each: a file per granularity
+# under "Candle store/<venue>/<symbol>/", holding Time (Unix milliseconds), the prices and Filled as columns.
+# Writes merge new candles into the partition: sorted, one candle per time (the latest fetch wins over overlapping
+# pages), and every missing candle in between filled flat at the previous close with Filled set. Times are then a
+# regular grid, so a date range is found with arithmetic rather than a search. Fetches only ask for what comes after
+# a partition's last candle, run concurrently across partitions, and the partitions of a venue share its rate limit.
+
+STORE_COLUMNS = CANDLE_COLUMNS + ["Filled"]
+HISTORY_FILE = "Historical BTC data 2020 - 2025"  # Bitget BTCUSDT hourly candles, saved before the store.
+
+
+def store_path(venue, symbol, granularity):
+    return subproject_path("Seasonal", "BTC") + os.path.join("Candle store", venue, symbol, granularity + ".npz")
+
+
+def store_jobs(config):
+    """(venue, symbol, granularity) of every partition of the config's store section."""
+    return [(venue, symbol, granularity) for venue, listed in config["store"]["venues"].items()
+            for symbol in listed["symbols"] for granularity in listed["granularities"]]
+
+
+def store_range(config):
+    """Start and end datetimes of the config's store section, end being now when it is ~."""
+    store = config["store"]
+    end = datetime.now() if store["end"] is None else datetime.strptime(store["end"], "%Y-%m-%d")
+    return datetime.strptime(store["start"], "%Y-%m-%d"), end
+
+
+def empty_partition():
+    return {column: np.empty(0, dtype=np.int64 if column == "Time" else bool if column == "Filled" else np.float64)
+            for column in STORE_COLUMNS}
+
+
+def read_partition(path):
+    """Columns of a partition, empty ones when it was never written."""
+    if not os.path.exists(path):
+        return empty_partition()
+    with np.load(path) as stored:
+        return {column: stored[column] for column in STORE_COLUMNS}
+
+
+def write_partition(path, columns):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:  # Readers never see a half written partition.
+        np.savez(f, **columns)
+    os.replace(path + ".tmp", path)
+
+
+def merge_candles(stored, candles, step):
+    """
+    Candles merged into a partition's columns, deduplicated and gap filled.
+
+    Parameters:
+      stored (dict): STORE_COLUMNS arrays, see read_partition.
+      candles (DataFrame): CANDLE_COLUMNS, as fetch_candles returns them.
+      step (int): Milliseconds per candle.
+
+    Returns:
+      dict: STORE_COLUMNS arrays, one row every `step` from the first candle to the last.
+    """
+    times = np.concatenate([stored["Time"], candle_times(candles["Time"])])
+    if not len(times):
+        return empty_partition()
+    prices = {column: np.concatenate([stored[column], candles[column].to_numpy(dtype=np.float64)])
+              for column in ("Open", "High", "Low", "Close")}
+    filled = np.concatenate([stored["Filled"], np.zeros(len(candles), dtype=bool)])
+    origin = times.min()
+    slot = (times - origin) // step
+    merged = {"Time": origin + np.arange(slot.max() + 1) * step, "Filled": np.ones(slot.max() + 1, dtype=bool)}
+    # The new candles come last and numpy keeps the last value written to a slot: they replace what was stored.
+    merged["Filled"][slot] = filled
+    for column, values in prices.items():
+        merged[column] = np.full(len(merged["Time"]), np.nan)
+        merged[column][slot] = values
+    # Missing candles are flat at the last close before them.
+    missing = np.isnan(merged["Close"])
+    last = np.maximum.accumulate(np.where(missing, 0, np.arange(len(missing))))
+    for column in ("Open", "High", "Low", "Close"):
+        merged[column][missing] = merged["Close"][last[missing]]
+    merged["Filled"] |= missing
+    return {column: merged[column] for column in STORE_COLUMNS}
+
+
+def read_candles(venue, symbol, granularity, start=None, end=None, filled=True):
+    """
+    Candles of a partition between two times, None when nothing was ingested for it.
+
+    Parameters:
+      start, end (datetime or str): First and last candle open times (UTC), the whole partition when None.
+      filled (bool): Keep the candles filled in for the missing ones.
+
+    Returns:
+      DataFrame: STORE_COLUMNS, Time in Unix milliseconds like the saved candle files.
+    """
+    columns = read_partition(store_path(venue, symbol, granularity))
+    times = columns["Time"]
+    if not len(times):
+        return None
+    step = granularity_ms(granularity)
+    first = 0 if start is None else int(np.clip(-(-(pd.Timestamp(start).value // 10 ** 6 - times[0]) // step), 0, len(times)))
+    last = len(times) if end is None else int(np.clip((pd.Timestamp(end).value // 10 ** 6 - times[0]) // step + 1, 0, len(times)))
+    candles = pd.DataFrame({column: values[first:last] for column, values in columns.items()})
+    return candles if filled else candles[~candles["Filled"]].reset_index(drop=True)
+
+
+def study_candles(venue, symbol, granularity):
+    """
+    The fetched candles of a partition (no filled ones) for the studies, e.g. data.venue, data.symbol and
+    data.granularity of the BTC config. Bitget's hourly BTCUSDT falls back to HISTORY_FILE until it is ingested.
+    """
+    candles = read_candles(venue, symbol, granularity, filled=False)
+    if candles is None and (venue, symbol, granularity) == ("bitget", "BTCUSDT", "1h"):
+        candles = pd.read_csv(subproject_path("Seasonal", "BTC") + HISTORY_FILE, index_col=0)
+    if candles is None:
+        raise FileNotFoundError(f"No {venue} {symbol} {granularity} candles in the store, run \"BTC API data.py\" first.")
+    return candles
+
+
+def fetch_bitget(get, config, symbol, granularity, start, end, limiter):
+    api = config["bitget_api"]
+    return fetch_candles(get, api["url"] + api["endpoints"]["historical_data"], symbol, granularity, config["data"]["limit"],
+                         start, end, api["limit"], limiter=limiter)
+
+
+VENUES = {"bitget": fetch_bitget}  # Venue -> fetch(get, config, symbol, granularity, start, end, limiter).
+
+
+def _fetch_new(get, config, job, start, end, limiter):
+    """A partition's stored columns and the candles opened after its last one (from `start` when empty)."""
+    venue, symbol, granularity = job
+    stored = read_partition(store_path(*job))
+    if len(stored["Time"]):
+        start = max(start, datetime.fromtimestamp((stored["Time"][-1] + granularity_ms(granularity)) / 1000))
+    if start > end:
+        return stored, pd.DataFrame(columns=CANDLE_COLUMNS)
+    return stored, VENUES[venue](get, config, symbol, granularity, start, end, limiter)
+
+
+def ingest(get, config, start, end, jobs=None, workers=None, sleep=time.sleep):
+    """
+    Fetch the new candles of every partition and write them to the store.
+
+    Fetches run in threads, each venue's requests under one rate limit (`<venue>_api.limit` per second).
+    Validation (see "Data quality") and writes happen here as fetches complete.
+
+    Parameters:
+      get (callable): requests.get, or a stand-in.
+      start, end (datetime): Range to cover, partitions already holding candles only fetch after their last one.
+      jobs (list): (venue, symbol, granularity) to ingest, store_jobs(config) by default.
+      workers (int): Fetch threads, one per partition when None.
+      sleep (callable): time.sleep, swapped out when the fetches run against a local stand-in.
+
+    Returns:
+      dict: (venue, symbol, granularity) -> candles added, filled ones included.
+    """
+    jobs = jobs or store_jobs(config)
+    limiters = {venue: RateLimiter(config[f"{venue}_api"]["limit"], period=1.0, sleep=sleep) for venue, _, _ in jobs}
+    added = {}
+    with ThreadPoolExecutor(max_workers=workers or max(len(jobs), 1)) as pool:
+        pending = {pool.submit(_fetch_new, get, config, job, start, end, limiters[job[0]]): job for job in jobs}
+        for future in as_completed(pending):
+            job = pending[future]
+            stored, candles = future.result()
+            step = granularity_ms(job[2])
+            name = " ".join(job) + " candles"
+            candles = check(name, candles, validate_candles, hours=step / HOUR_MS, name=name)
+            merged = merge_candles(stored, candles, step)
+            write_partition(store_path(*job), merged)
+            added[job] = len(merged["Time"]) - len(stored["Time"])
+            instrument.count("candles.added", added[job])
+    return {job: added[job] for job in jobs}
@@ -0,0 +1,411 @@
+"""
+Command line entry point: shortvol <command> [options] [<command> [options] ...]
+
+    shortvol signals                      # ETFs.py: panel, signals, ETF_filtered.pkl and the signal index
+    shortvol fetch --dry-run              # plan the Polygon requests of both pipelines, send with no --dry-run
+    shortvol pnl --premium-source model   # "On ETFs/Polygon data.py" assembly, from the cache or the model
+    shortvol report --plot                # "PL analysis.py" metrics, the figures and HTML report only when asked
+    shortvol exits --paths model          # profit targets, stop-losses and time stops scored on every straddle
+    shortvol regimes --features VIXY_vol  # the P&L split by regime, new features computed once and kept
+    shortvol btc --fetch                  # Bitget candles into the candle store, then the 00:00 to 08:00 study
+    shortvol signals pnl report           # chained: every stage reuses what the previous one loaded
+    shortvol shell                        # type commands one after the other, the context stays warm
+
+Plotting and network libraries are imported inside the commands that use them, so a command
+only pays for what it needs. Every run writes a report under "Run reports" (shortvol/instrument.py).
+"""
+import argparse
+import os
+import pickle
+import shlex
+import sys
+
+COMMANDS = ("signals", "fetch", "pnl", "report", "exits", "regimes", "btc", "shell")
+
+
+class Context:
+    """
+    Configs and data loaded by one command and reused by the next ones of the same process.
+
+    Pickles are keyed by path: a command that saves one also leaves it here, so the next
+    stage of a chain gets it without reading it back from disk.
+    """
+
+    def __init__(self):
+        self.configs = {}
+        self.data = {}
+
+    def config(self, *parts):
+        if parts not in self.configs:
+            from shortvol.config import load_config
+            self.configs[parts] = load_config(*parts)
+        return self.configs[parts]
+
+    def get(self, name, loader):
+        if name not in self.data:
+            self.data[name] = loader()
+        return self.data[name]
+
+    def load(self, path):
+        def loader():
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        return self.get(path, loader)
+
+    def save(self, path, value):
+        with open(path, "wb") as f:
+            pickle.dump(value, f)
+        self.data[path] = value
+
+
+def etf_filtered_path():
+    from shortvol.config import subproject_path
+    return subproject_path("On ETFs") + "ETF_filtered.pkl"
+
+
+def signal_index(ctx, config):
+    """The signal index of the config's parameters, from the signals command of this process or from disk."""
+    from shortvol.signal_index import load_index, signal_params
+    return ctx.get("signal index", lambda: load_index(signal_params(config)))
+
+
+def run_signals(ctx, args):
+    from functools import partial
+
+    from shortvol.panel import load_panel
+    from shortvol.regimes import load_features, save_features, update_features
+    from shortvol.shared import SharedPanel, map_tickers
+    from shortvol.signal_index import SignalIndex, save_index, signal_params
+    from shortvol.signals import add_signals, forecast_summary
+    from shortvol.config import subproject_path
+    from shortvol.validation import panel_checks
+
+    config = ctx.config("On ETFs")
+    general = config["general"]
+    panel = ctx.get("panel", lambda: load_panel(config["tickers"], general["start_date"], general["end_date"],
+                                                subproject_path("On ETFs") + "ETF panel.pkl", columns=["Close"],
+                                                checks=panel_checks(config)))
+    workers = general["workers"] if args.workers is None else args.workers
+    with SharedPanel.from_panel(panel) as shared:
+        signals = map_tickers(partial(add_signals, vol_window=general["vol_window"], mom_window=general["mom_window"],
+                                      for_window=general["for_window"], mom_1=general["mom_1"]),
+                              shared, config["tickers"], workers)
+    index = SignalIndex.from_signals(signals, signal_params(config))
+    summary = forecast_summary(index.query())
+    index.excluded = tuple(summary.loc[summary["Mean_Forecast_Move"] > general["mean_threshold"], "ETF_Name"])
+    ETF_filtered = index.query(index.selected)
+    ctx.save(etf_filtered_path(), ETF_filtered)
+    save_index(index)
+    ctx.data["signal index"] = index
+    regimes = config["regimes"]
+    features = update_features(ctx.get("regime features", load_features), panel, regimes["features"], regimes["window"],
+                               regimes["trend_window"])
+    save_features(features)
+    ctx.data["regime features"] = features
+    print(f"{sum(len(data) for data in ETF_filtered.values())} signals on {len(ETF_filtered)} ETFs, "
+          f"excluded for a mean move above {general['mean_threshold']}: {sorted(index.excluded) or 'none'}")
+
+
+def run_fetch(ctx, args):
+    from shortvol.pipelines import polygon_client, shared_cache, shared_plan
+    from shortvol.plan import execute_plan, plan_summary
+
+    config = ctx.config("On ETFs")
+    budget = args.budget if args.budget is not None else config["general"]["request_budget"]
+    cache = ctx.get("cache", shared_cache)
+    plan = shared_plan(cache, budget, index=signal_index(ctx, config))
+    for key, value in plan_summary(plan, config["api"]["rate_limit_per_minute"], budget).items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    if args.dry_run or config["general"]["dry_run"]:
+        return
+
+    client = polygon_client(config, cache, budget)
+    execute_plan(client, plan, config["api"]["endpoints"])
+    print(f"Sent {client.sent} requests.")
+    if client.skipped or client.sent == budget:
+        print(f"Request budget of {budget} used, run again for the next chunk.")
+
+
+def run_pnl(ctx, args):
+    from shortvol.option_store import load_option_store, save_option_store
+    from shortvol.pipelines import (PORTFOLIO_COLUMNS, etf_signals, hedge_panel, hedge_straddles, polygon_client, portfolio_path,
+                                    premium_multipliers, price_straddles, shared_cache, underlying_closes)
+
+    config = ctx.config("On ETFs")
+    if args.premium_source:
+        config = {**config, "pricing": {**config["pricing"], "premium_source": args.premium_source}}
+    premium_source = config["pricing"]["premium_source"]
+
+    fetched = portfolio_path({**config, "pricing": {**config["pricing"], "premium_source": "api"}})
+    previous = ctx.load(fetched) if premium_source != "api" and os.path.exists(fetched) else None
+    multipliers, default_multiplier = premium_multipliers(config, previous)
+    # Budget 0: premiums are read from the cache only, "shortvol fetch" is what sends requests.
+    hedging = config["hedging"]["enabled"]
+    intraday = hedging and config["hedging"]["bars"] != "day"  # Bars from the cache, even for model premiums.
+    client = None if premium_source == "model" and not intraday else polygon_client(config, ctx.get("cache", shared_cache), budget=0)
+    hedge_prices = ctx.get("hedge panel", lambda: hedge_panel(config)) if hedging and not intraday else None
+    store = ctx.get("option store", load_option_store) if premium_source != "model" else None
+
+    Portfolio_PL = {}
+    index = signal_index(ctx, config)
+    signals = etf_signals(config, index=index) if index is not None else etf_signals(config, ctx.load(etf_filtered_path()))
+    for ticker, data in signals.items():
+        closes = underlying_closes(ticker, data, config, client, hedge_prices) if hedging else None
+        data = price_straddles(ticker, data, config, client, multipliers.get(ticker, default_multiplier), store)
+        print(f"Result of the strategy on {ticker}: {data['PL'].sum()}")
+        if hedging:
+            data = hedge_straddles(data, closes, config, multipliers.get(ticker, default_multiplier))
+            print(f"Delta-hedged result on {ticker}: {data['Hedged_PL'].sum()}")
+        Portfolio_PL[ticker] = data.loc[:, data.columns.intersection(PORTFOLIO_COLUMNS)]
+    if store is not None:
+        save_option_store(store)
+    path = portfolio_path(config)
+    ctx.save(path, Portfolio_PL)
+    ctx.data["portfolio"] = path  # What a chained "report" looks at.
+
+
+def run_report(ctx, args):
+    import pandas as pd
+
+    from shortvol.config import portfolio_path, subproject_path
+    from shortvol.metrics import etf_results
+    from shortvol.portfolio import portfolio_results
+
+    config = ctx.config("On ETFs")
+    path = args.file or ctx.data.get("portfolio") or portfolio_path(config)
+    individual_results, rolling_results = etf_results(ctx.load(path), config["general"]["initial_equity"],
+                                                      config["general"]["rolling_window"])
+    with pd.option_context("display.max_rows", None, "display.max_columns", None):
+        print(individual_results)
+    with open(subproject_path("On ETFs") + "Rolling metrics.pkl", "wb") as f:
+        pickle.dump(rolling_results, f)
+
+    portfolio = config["portfolio"]
+    portfolio_table, portfolio_weights = portfolio_results(ctx.load(path), config["general"]["initial_equity"],
+                                                           portfolio["window"], portfolio["rebalance"],
+                                                           portfolio["cluster_threshold"], portfolio["cluster_cap"],
+                                                           portfolio["shrinkage"], portfolio["methods"])
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(portfolio_table)
+    ctx.save(subproject_path("On ETFs") + "Portfolio weights.pkl", portfolio_weights)
+
+    if args.plot:
+        from shortvol.render import etf_report
+
+        index_path = etf_report(ctx.load(path), config["general"]["initial_equity"], individual_results, portfolio_table,
+                                portfolio_weights, subproject_path("On ETFs"), config)
+        print(f"Saved {index_path}")
+
+
+def run_exits(ctx, args):
+    import pandas as pd
+
+    from shortvol.config import subproject_path
+    from shortvol.pipelines import exit_rules, hedge_panel, polygon_client, portfolio_path, shared_cache
+
+    config = ctx.config("On ETFs")
+    if args.paths:
+        config = {**config, "exits": {**config["exits"], "paths": args.paths}}
+    path = args.file or ctx.data.get("portfolio") or portfolio_path(config)
+    from_api = config["exits"]["paths"] == "api"
+    client = polygon_client(config, ctx.get("cache", shared_cache), budget=0) if from_api else None  # Cache only, like pnl.
+    panel = None if from_api else ctx.get("hedge panel", lambda: hedge_panel(config))
+    table = exit_rules(ctx.load(path), config, client, panel)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(table.head(args.top))
+    table.to_excel(subproject_path("On ETFs") + "Exit rules.xlsx")
+
+
+def run_regimes(ctx, args):
+    import pandas as pd
+
+    from shortvol.config import subproject_path
+    from shortvol.pipelines import hedge_panel, portfolio_path, regime_results
+    from shortvol.regimes import load_features, save_features, update_features
+
+    config = ctx.config("On ETFs")
+    regimes = config["regimes"]
+    names = args.features or regimes["features"]
+    if args.buckets:
+        config = {**config, "regimes": {**regimes, "buckets": args.buckets}}
+    features = ctx.get("regime features", load_features)
+    if features is None or any(name not in features["Features"] for name in names):
+        # Only the features the file doesn't have are computed, on the panel of ETFs.py.
+        features = update_features(features, ctx.get("hedge panel", lambda: hedge_panel(config)), names, regimes["window"],
+                                   regimes["trend_window"])
+        save_features(features)
+        ctx.data["regime features"] = features
+    path = args.file or ctx.data.get("portfolio") or portfolio_path(config)
+    table = regime_results(ctx.load(path), config, features, names)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(table)
+    table.to_excel(subproject_path("On ETFs") + "Regime results.xlsx", index=False)
+
+
+def run_btc(ctx, args):
+    import pandas as pd
+
+    from shortvol.btc import hour_window_moves
+    from shortvol.candles import study_candles
+    from shortvol.config import subproject_path
+    from shortvol.query import query
+
+    config = ctx.config("Seasonal", "BTC")
+    partition = (config["data"]["venue"], args.symbol or config["data"]["symbol"], config["data"]["granularity"])
+    if args.fetch:
+        from datetime import datetime
+
+        import requests
+
+        from shortvol.candles import ingest
+
+        ingest(requests.get, config, datetime.strptime(args.start, "%Y-%m-%d"), datetime.strptime(args.end, "%Y-%m-%d"),
+               jobs=[partition])
+        ctx.data.pop(("candles", *partition), None)
+
+    def load_candles():
+        candles = study_candles(*partition)
+        candles["Time"] = pd.to_datetime(candles["Time"], unit="ms")
+        return candles
+
+    moves = hour_window_moves(ctx.get(("candles", *partition), load_candles), *args.hours)
+    print(f"{partition[1]} {args.hours[0]:02d}:00 to {args.hours[1]:02d}:00 move summary by Day-of-Week:")
+    print(query(moves).group_by("DayOfWeek", "Return").collect(args.engine or config["data"]["query_engine"]))
+
+    if args.plot:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=(10, 6))
+        plt.hist(moves["Return"], bins=200, edgecolor="k")
+        plt.title(f"Histogram: {args.hours[0]:02d}:00 to {args.hours[1]:02d}:00 Returns")
+        plt.xlabel("Return (%)")
+        plt.ylabel("Frequency")
+        image_path = subproject_path("Seasonal", "BTC") + f"{partition[1]} returns {args.hours[0]:02d} to {args.hours[1]:02d}.png"
+        plt.savefig(image_path, dpi=150, bbox_inches="tight")
+        plt.close(fig)
+        print(f"Saved {image_path}")
+
+
+def run_shell(ctx, args):
+    print(f"Commands: {', '.join(COMMANDS[:-1])}. Data stays loaded between them, quit or Ctrl-D to leave.")
+    while True:
+        try:
+            line = input("shortvol> ").strip()
+        except EOFError:
+            print()
+            return
+        if line in ("quit", "exit"):
+            return
+        if not line:
+            continue
+        try:
+            run(shlex.split(line), ctx)
+        except SystemExit:
+            pass  # argparse already printed the error, the shell carries on.
+        except Exception as error:  # A failed command (a missing file, a bad config) doesn't lose the warm context.
+            print(f"{type(error).__name__}: {error}", file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="shortvol", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    signals = commands.add_parser("signals", help="Volatility and momentum signals of every ETF, saved as ETF_filtered.pkl and the signal index.")
+    signals.add_argument("--workers", type=int, help="Processes reading the shared panel, general.workers by default (0 for one per CPU).")
+
+    fetch = commands.add_parser("fetch", help="Plan and send the Polygon requests of both pipelines.")
+    fetch.add_argument("--dry-run", action="store_true", help="Only print what the plan would send.")
+    fetch.add_argument("--budget", type=int, help="Requests to send in this run, general.request_budget by default.")
+
+    pnl = commands.add_parser("pnl", help="Straddle prices and P&L per ETF, saved as Portfolio_PL.pkl.")
+    pnl.add_argument("--premium-source", choices=["api", "fill", "model"], help="Overrides pricing.premium_source.")
+
+    report = commands.add_parser("report", help="Per ETF metrics, the rolling metrics and the combined portfolios.")
+    report.add_argument("--file", help="Portfolio pickle to read, the last one written by default.")
+    report.add_argument("--plot", action="store_true", help="Draw the equity curves and tables, and write the HTML report (see shortvol/render.py).")
+
+    exits = commands.add_parser("exits", help="Early exit rules of the exits section scored on every straddle, saved as Exit rules.xlsx.")
+    exits.add_argument("--file", help="Portfolio pickle to read, the last one written by default.")
+    exits.add_argument("--paths", choices=["model", "api"], help="Overrides exits.paths.")
+    exits.add_argument("--top", type=int, default=10, help="Rules printed, best total P&L first.")
+
+    regimes = commands.add_parser("regimes", help="P&L of the straddles split by regime feature, saved as Regime results.xlsx.")
+    regimes.add_argument("--file", help="Portfolio pickle to read, the last one written by default.")
+    regimes.add_argument("--features", nargs="+", help="Features to split by, regimes.features by default (e.g. TLT_trend GLD_vol).")
+    regimes.add_argument("--buckets", type=int, help="Overrides regimes.buckets.")
+
+    btc = commands.add_parser("btc", help="Day-of-week study of the crypto moves between two hours.")
+    btc.add_argument("--fetch", action="store_true", help="Bring the symbol's candles in the store up to date first.")
+    btc.add_argument("--symbol", help="Symbol of data.venue to study, data.symbol by default (e.g. ETHUSDT).")
+    btc.add_argument("--start", default="2020-01-01")
+    btc.add_argument("--end", default="2025-02-01")
+    btc.add_argument("--hours", nargs=2, type=int, default=[0, 8], metavar=("START", "END"))
+    btc.add_argument("--plot", action="store_true", help="Save the histogram of the moves.")
+    btc.add_argument("--engine", choices=("pandas", "polars"), help="Query engine of the summary, data.query_engine by default.")
+
+    commands.add_parser("shell", help="Read commands interactively, keeping loaded data between them.")
+    return parser
+
+
+HANDLERS = {"signals": run_signals, "fetch": run_fetch, "pnl": run_pnl, "report": run_report, "exits": run_exits,
+            "regimes": run_regimes, "btc": run_btc, "shell": run_shell}
+
+
+def option_values(parser):
+    """Command -> option string -> values the option takes at least (0 for flags), from the subparsers of build_parser."""
+    subparsers = next(action for action in parser._actions if isinstance(action, argparse._SubParsersAction))
+    return {command: {option: 1 if action.nargs in (None, "+") else action.nargs if isinstance(action.nargs, int) else 0
+                      for action in subparser._actions for option in action.option_strings}
+            for command, subparser in subparsers.choices.items()}
+
+
+def split_commands(argv):
+    """
+    ["signals", "pnl", "--premium-source", "model"] -> [["signals"], ["pnl", "--premium-source", "model"]].
+
+    A command name starts a new command unless it is the value of the option before it: "exits --file report"
+    reads a file called report. An option taking several values (regimes --features) ends at the next command name.
+    """
+    values = option_values(build_parser())
+    segments, pending = [], 0
+    for token in argv:
+        if pending:
+            pending -= 1
+        elif token in COMMANDS or not segments:
+            segments.append([])
+        else:
+            pending = values.get(segments[-1][0], {}).get(token, 0)
+        segments[-1].append(token)
+    return segments
+
+
+def run(argv, ctx):
+    from shortvol import instrument
+
+    parser = build_parser()
+    for args in [parser.parse_args(segment) for segment in split_commands(argv)]:  # Every stage is checked before any runs.
+        report = instrument.active()
+        if report is not None:
+            report.stage(args.command)
+        HANDLERS[args.command](ctx, args)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        build_parser().print_help()
+        return 0
+    if not os.getenv("Short_Volatility_Path"):
+        print("Set Short_Volatility_Path to the data directory (the one holding \"On ETFs\" and \"Seasonal\").", file=sys.stderr)
+        return 2
+
+    from shortvol.instrument import start_run
+    start_run("cli " + " ".join(segment[0] for segment in split_commands(argv)))
+    run(argv, Context())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+import os
+
+import yaml
+
+
+def root_path():
+    """Personal path for data storage, the same one every script reads."""
+    return os.getenv("Short_Volatility_Path")
+
+
+def subproject_path(*parts):
+    """Directory of a subproject (e.g. "On ETFs" or "Seasonal", "BTC"), with a trailing slash like the scripts use."""
+    return os.path.join(root_path(), *parts) + "/"
+
+
+def load_config(*parts):
+    """Load the config.yaml that lives in a subproject directory."""
+    with open(os.path.join(subproject_path(*parts), "config.yaml"), "r") as file:
+        return yaml.load(file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))  # libyaml's safe loader when built with it.
+
+
+def portfolio_path(config):
+    """Portfolio_PL.pkl, or "Portfolio_PL model.pkl" for model estimates so they never overwrite fetched results."""
+    name = "Portfolio_PL model.pkl" if config["pricing"]["premium_source"] == "model" else "Portfolio_PL.pkl"
+    return subproject_path("On ETFs") + name
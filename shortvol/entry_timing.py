@@ -0,0 +1,220 @@
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from shortvol import instrument
+from shortvol.config import subproject_path
+from shortvol.hedging import bar_closes
+from shortvol.polygon import aggregates_request, chain_contracts, chain_request
+
+### Entry timing
+# The Friday straddle of the seasonal study is sold on the close. To try every other minute of the Friday, and every
+# exit on the session it expires, the minute bars of SPY and of every straddle it could have sold (the strikes of
+# the Friday's range) are fetched once per Friday: one chain lookup per leg type, then one aggregates request per
+# contract over the two sessions. The bars are laid out once in arrays (Fridays x strikes x sessions x minutes),
+# saved, and the whole entry x exit grid is a few fancy-indexing operations over them: no request, no JSON.
+
+FIRST_MINUTE = 9 * 60 + 31  # Bars are stamped with their close (shortvol/hedging.py), the first one at 09:31.
+SESSION_MINUTES = 390  # 09:31 to 16:00.
+STORE_VERSION = 1
+
+
+def store_path():
+    return subproject_path("Seasonal") + "Friday minute bars.pkl"
+
+
+def minute_index(time):
+    """Column of a "HH:MM" close time in the session arrays, 0 for 09:31 and 389 for 16:00."""
+    hours, minutes = map(int, time.split(":"))
+    return hours * 60 + minutes - FIRST_MINUTE
+
+
+def minute_label(index):
+    minutes = FIRST_MINUTE + np.asarray(index)
+    return [f"{m // 60:02d}:{m % 60:02d}" for m in np.atleast_1d(minutes)]
+
+
+def grid_minutes(start, end, step=1):
+    """Session columns from `start` to `end` ("HH:MM", both included) every `step` minutes."""
+    return np.arange(minute_index(start), minute_index(end) + 1, step)
+
+
+def friday_strikes(F_SPY, padding=1):
+    """
+    Strikes whose straddles a Friday could have sold: every dollar from its rounded Low to its rounded High,
+    `padding` more on both sides.
+
+    Returns:
+      tuple: (lowest strike, number of strikes), int arrays with one value per Friday.
+    """
+    low = np.round(F_SPY["Low"].to_numpy(dtype=np.float64)).astype(np.int64) - padding
+    high = np.round(F_SPY["High"].to_numpy(dtype=np.float64)).astype(np.int64) + padding
+    return low, high - low + 1
+
+
+def session_grid(body, days):
+    """
+    Closes of an aggregates answer on the session arrays, one row per day (sessions in `days`, "YYYY-MM-DD").
+
+    A minute without a trade keeps the last close of its day, minutes before the first trade are NaN.
+    """
+    grid = np.full((len(days), SESSION_MINUTES), np.nan)
+    closes = bar_closes(body, 1, "minute")
+    if not closes.empty:
+        sessions = pd.DatetimeIndex(days).to_numpy()
+        dates = closes.index.normalize().to_numpy()
+        day = np.minimum(np.searchsorted(sessions, dates), len(days) - 1)
+        inside = sessions[day] == dates  # Bars of days in between (none for a Friday and its next session) are left out.
+        minute = (closes.index.hour * 60 + closes.index.minute - FIRST_MINUTE).to_numpy()
+        grid[day[inside], minute[inside]] = closes.to_numpy()[inside]
+    return fill_forward(grid)
+
+
+def fill_forward(grid):
+    """Last non-NaN value along the last axis."""
+    steps = np.arange(grid.shape[-1])
+    last = np.maximum.accumulate(np.where(np.isnan(grid), 0, steps), axis=-1)
+    return np.take_along_axis(grid, last, axis=-1)
+
+
+def _friday(client, date, expiration, low, count, ticker, endpoints):
+    """Session arrays of one Friday: the underlying's (2, minutes), calls' and puts' (strikes, 2, minutes)."""
+    days = [date, expiration]
+    spy = session_grid(client.get(*aggregates_request(endpoints["aggregates"], ticker, 1, "minute", date, expiration)), days)
+    # After the underlying's last bar of a session (a half day) nothing is traded, the options' last closes would be stale.
+    last = np.where(np.isnan(spy), -1, np.arange(SESSION_MINUTES)).max(axis=1)
+    spy[np.arange(SESSION_MINUTES)[None, :] > last[:, None]] = np.nan
+    legs = []
+    for contract_type in ("call", "put"):
+        contracts = chain_contracts(client.get(*chain_request(endpoints["options_contracts"], ticker, contract_type,
+                                                              expiration, low, low + count - 1)))
+        leg = np.full((count, 2, SESSION_MINUTES), np.nan)
+        for j, strike in enumerate(range(low, low + count)):
+            contract = contracts.get(strike)
+            if contract:
+                leg[j] = session_grid(client.get(*aggregates_request(endpoints["aggregates"], contract, 1, "minute", date, expiration)), days)
+        leg[:, np.isnan(spy)] = np.nan
+        legs.append(leg)
+    return spy, *legs
+
+
+def build_store(client, F_SPY, ticker, endpoints, padding=1, store=None):
+    """
+    Minute bars of every Friday in session arrays, read through the client (from the cache once the plan has run).
+
+    Fridays of `store` (a previous build) whose requests were all answered are kept as they are, so only the
+    new Fridays, and the ones a spent request budget left incomplete, are read again.
+
+    Parameters:
+      F_SPY (DataFrame): Date, Next_Date, Low, High and Next_Close of each Friday, see friday_signals.
+      padding (int): Strikes beyond the Friday's range, see friday_strikes.
+
+    Returns:
+      dict: Date, Next_Date, Next_Close, Strike_Low (one per Friday), Underlying (Fridays x 2 x minutes),
+      Call and Put (Fridays x strikes x 2 x minutes, NaN past each Friday's strikes) and Complete.
+    """
+    F_SPY = F_SPY[F_SPY["Next_Date"].notna()]
+    lows, counts = friday_strikes(F_SPY, padding)
+    kept = {}
+    if store is not None and store.get("Version") == STORE_VERSION and store.get("Padding") == padding:
+        kept = {date: i for i, date in enumerate(store["Date"]) if store["Complete"][i]}
+
+    rows = []
+    for date, expiration, low, count in zip(F_SPY["Date"], F_SPY["Next_Date"], lows, counts):
+        if date in kept:
+            i = kept[date]
+            rows.append((store["Underlying"][i], store["Call"][i][:count], store["Put"][i][:count], True))
+            continue
+        skipped = client.skipped
+        rows.append((*_friday(client, date, expiration, low, count, ticker, endpoints), client.skipped == skipped))
+    instrument.count("entry_timing.fridays_read", len(F_SPY) - sum(date in kept for date in F_SPY["Date"]))
+
+    width = int(counts.max(initial=1))
+    pad = lambda leg: np.concatenate([leg, np.full((width - len(leg), 2, SESSION_MINUTES), np.nan)])
+    return {
+        "Version": STORE_VERSION,
+        "Padding": padding,
+        "Date": F_SPY["Date"].to_numpy(dtype=object),
+        "Next_Date": F_SPY["Next_Date"].to_numpy(dtype=object),
+        "Next_Close": F_SPY["Next_Close"].to_numpy(dtype=np.float64),
+        "Strike_Low": lows,
+        "Underlying": np.stack([row[0] for row in rows]) if rows else np.empty((0, 2, SESSION_MINUTES)),
+        "Call": np.stack([pad(row[1]) for row in rows]) if rows else np.empty((0, width, 2, SESSION_MINUTES)),
+        "Put": np.stack([pad(row[2]) for row in rows]) if rows else np.empty((0, width, 2, SESSION_MINUTES)),
+        "Complete": np.array([row[3] for row in rows], dtype=bool),
+    }
+
+
+def load_store(path=None):
+    path = path or store_path()
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_store(store, path=None):
+    with open(path or store_path(), "wb") as f:
+        pickle.dump(store, f)
+
+
+def timing_pl(store, entries, exits):
+    """
+    P&L of the short straddle for every Friday, entry minute and exit, per straddle (100 shares).
+
+    The straddle sold at an entry minute is the one struck at the underlying's price then, rounded, and bought
+    back at each exit minute of the expiry session at the legs' last closes, or held to expiry (the last exit,
+    paying the straddle's payoff on Next_Close).
+
+    Parameters:
+      entries (array): Friday session columns, see grid_minutes.
+      exits (array): Expiry session columns.
+
+    Returns:
+      ndarray: Fridays x entries x (exits + 1), NaN where the underlying or a leg has no price.
+    """
+    entries, exits = np.asarray(entries), np.asarray(exits)
+    spot = store["Underlying"][:, 0, entries]
+    strike = np.round(spot)
+    k = strike - store["Strike_Low"][:, None]
+    valid = ~np.isnan(spot) & (k >= 0) & (k < store["Call"].shape[1])
+    k = np.where(valid, k, 0).astype(np.int64)
+    f = np.arange(len(spot))[:, None]
+
+    call, put = store["Call"], store["Put"]
+    premium = call[f, k, 0, entries[None, :]] + put[f, k, 0, entries[None, :]]
+    buyback = call[f[:, :, None], k[:, :, None], 1, exits[None, None, :]] + put[f[:, :, None], k[:, :, None], 1, exits[None, None, :]]
+    payoff = np.abs(store["Next_Close"][:, None] - strike)
+    pl = premium[:, :, None] - np.concatenate([buyback, payoff[:, :, None]], axis=2)
+    pl[~valid] = np.nan
+    return 100 * pl
+
+
+def timing_summary(pl, entries, exits):
+    """
+    Statistics of every (entry, exit) cell of timing_pl over the Fridays.
+
+    Returns:
+      DataFrame: Entry and Exit ("HH:MM", "expiry" for held to expiry), Trades, Mean_PL, Median_PL, Std_PL and
+      Win_Rate (percent), sorted by Mean_PL from best to worst.
+    """
+    trades = np.sum(~np.isnan(pl), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # Cells no Friday could trade.
+        mean, median, std = np.nanmean(pl, axis=0), np.nanmedian(pl, axis=0), np.nanstd(pl, axis=0)
+        wins = np.sum(pl > 0, axis=0) / trades * 100
+    exit_labels = minute_label(exits) + ["expiry"]
+    entry_labels = minute_label(entries)
+    summary = pd.DataFrame({
+        "Entry": np.repeat(entry_labels, len(exit_labels)),
+        "Exit": np.tile(exit_labels, len(entry_labels)),
+        "Trades": trades.ravel(),
+        "Mean_PL": mean.ravel(),
+        "Median_PL": median.ravel(),
+        "Std_PL": std.ravel(),
+        "Win_Rate": wins.ravel(),
+    })
+    return summary.sort_values("Mean_PL", ascending=False, ignore_index=True)
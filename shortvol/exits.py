@@ -0,0 +1,180 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from shortvol.entry_timing import fill_forward
+from shortvol.hedging import MARKET_CLOSE, gather_paths
+from shortvol.polygon import aggregates_request, find_contract
+from shortvol.pricing import straddle_price
+
+### Early exits
+# A short straddle held to expiry is one rule among many: buy it back once a share of the premium is made (profit
+# target), once the loss reaches a multiple of the premium (stop-loss), or after a number of days (time stop).
+# Every trade's path is a row of a (trades x steps) matrix of what buying the straddle back costs at each step,
+# NaN-padded after its last step, the last one being the payoff at expiry. Along each row the running max and
+# min of the P&L (as a share of the premium) never go back, so the first step reaching a target is just the number
+# of steps whose running max is still below it: a comparison and a sum for every target, stop and trade at once,
+# and every rule of the grid is one take_along_axis.
+
+
+def rule_values(rules):
+    """A target, stop or time stop list of a config, ~ (no such rule) as infinity."""
+    return np.array([np.inf if rule is None else rule for rule in rules], dtype=np.float64)
+
+
+def exit_grid(premium, values, targets, stops, time_stops):
+    """
+    P&L of every trade under every combination of profit target, stop-loss and time stop.
+
+    Parameters:
+      premium (array): Premium received per trade.
+      values (ndarray): Trades x steps, cost of buying the straddle back at each step after the sale,
+        NaN after the trade's last step (its payoff at expiry). Gaps inside a path keep the previous value.
+      targets (array): Exit once the P&L reaches this share of the premium (0.5: half the premium kept).
+      stops (array): Exit once the loss reaches this multiple of the premium.
+      time_stops (array): Exit after this many steps at the latest.
+      Infinity in any of them is no rule of that kind, the trade is held to expiry.
+
+    Returns:
+      tuple: (P&L, step of the exit), both trades x targets x stops x time stops, NaN P&L for trades without a path.
+    """
+    premium = np.asarray(premium, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    targets, stops, time_stops = (np.asarray(rules, dtype=np.float64) for rules in (targets, stops, time_stops))
+    n, m = values.shape
+    observed = ~np.isnan(values)
+    last = m - 1 - np.argmax(observed[:, ::-1], axis=1)  # Last observed step, the expiry.
+    has_path = observed.any(axis=1) & (premium > 0)
+
+    pl = premium[:, None] - fill_forward(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = pl / premium[:, None]
+    running_max = np.maximum.accumulate(np.nan_to_num(share, nan=-np.inf), axis=1)
+    running_min = np.minimum.accumulate(np.nan_to_num(share, nan=np.inf), axis=1)
+
+    target_step = np.sum(running_max[:, :, None] < targets[None, None, :], axis=1)  # m when never reached.
+    stop_step = np.sum(running_min[:, :, None] > -stops[None, None, :], axis=1)
+    time_step = np.minimum(np.where(np.isinf(time_stops), m, time_stops - 1), m).astype(np.int64)
+
+    step = np.minimum(np.minimum(target_step[:, :, None, None], stop_step[:, None, :, None]), time_step[None, None, None, :])
+    step = np.minimum(step, last[:, None, None, None])
+    exit_pl = np.take_along_axis(pl, step.reshape(n, step[0].size), axis=1).reshape(step.shape)
+    exit_pl[~has_path] = np.nan
+    return exit_pl, step
+
+
+def exit_summary(exit_pl, step, targets, stops, time_stops, steps_per_day=1):
+    """
+    One row per rule of exit_grid, sorted from the best total P&L to the worst.
+
+    Returns:
+      DataFrame: Target, Stop, Time_Stop (None for no rule), Trades, Total_PL, Mean_PL, Win_Rate (percent),
+      Worst_PL, Avg_Held (steps / steps_per_day, days for daily paths) and Vs_Hold, the total P&L over holding to expiry.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # Rules no trade could run.
+        trades = np.sum(~np.isnan(exit_pl), axis=0)
+        total = np.nansum(exit_pl, axis=0)
+        summary = pd.DataFrame({
+            "Target": np.repeat(targets, len(stops) * len(time_stops)),
+            "Stop": np.tile(np.repeat(stops, len(time_stops)), len(targets)),
+            "Time_Stop": np.tile(time_stops, len(targets) * len(stops)),
+            "Trades": trades.ravel(),
+            "Total_PL": total.ravel(),
+            "Mean_PL": np.nanmean(exit_pl, axis=0).ravel(),
+            "Win_Rate": (np.sum(exit_pl > 0, axis=0) / np.maximum(trades, 1) * 100).ravel(),
+            "Worst_PL": np.nanmin(exit_pl, axis=0).ravel(),
+            "Avg_Held": (np.nanmean(np.where(np.isnan(exit_pl), np.nan, step + 1), axis=0) / steps_per_day).ravel(),
+        })
+    # The cell without any rule is holding to expiry, what every other rule is compared with.
+    hold = (np.isinf(summary["Target"]) & np.isinf(summary["Stop"]) & np.isinf(summary["Time_Stop"])).to_numpy()
+    summary["Vs_Hold"] = summary["Total_PL"] - (summary.loc[hold, "Total_PL"].iloc[0] if hold.any() else np.nan)
+    summary[["Target", "Stop", "Time_Stop"]] = summary[["Target", "Stop", "Time_Stop"]].astype(object).where(
+        np.isfinite(summary[["Target", "Stop", "Time_Stop"]].to_numpy()), None)
+    return summary.sort_values("Total_PL", ascending=False, ignore_index=True)
+
+
+def close_out(values, payoff):
+    """Straddle values of each path with its last step replaced by the payoff held trades are settled at."""
+    values = np.array(values, dtype=np.float64)
+    observed = ~np.isnan(values)
+    has_path = observed.any(axis=1)
+    last = values.shape[1] - 1 - np.argmax(observed[:, ::-1], axis=1)
+    values[has_path, last[has_path]] = np.asarray(payoff, dtype=np.float64)[has_path]
+    return values
+
+
+def model_values(data, closes, sigma, r=0.0):
+    """
+    Daily buy-back values of an ETF's straddles priced with Black-Scholes on the ETF's closes, no request needed.
+
+    Parameters:
+      data (DataFrame): Date, Expiration, Strike and Payoff of each straddle, e.g. a ticker of Portfolio_PL.
+      closes (Series): Closes indexed by close time, daily_closes of the panel.
+      sigma (array): Annualized vol each straddle is repriced with, see pipelines.entry_vol.
+
+    Returns:
+      ndarray: Trades x days after the sale, the last one the payoff.
+    """
+    entry = pd.DatetimeIndex(data["Date"]).tz_localize(None) + MARKET_CLOSE
+    expiry = pd.DatetimeIndex(data["Expiration"]).tz_localize(None) + MARKET_CLOSE
+    prices, tau = gather_paths(closes, entry, expiry)
+    strike = data["Strike"].to_numpy(dtype=np.float64)[:, None]
+    values = straddle_price(prices, strike, tau, np.asarray(sigma, dtype=np.float64)[:, None], r)  # NaN where prices are.
+    values = close_out(values, data["Payoff"].to_numpy())
+    return values[:, 1:] if values.shape[1] > 1 else np.full((len(data), 1), np.nan)  # The first column is the sale.
+
+
+def leg_closes(body):
+    """Daily closes of an option from an aggregates answer, by "YYYY-MM-DD" (New York)."""
+    bars = (body or {}).get("results", [])
+    days = pd.to_datetime([bar["t"] for bar in bars], unit="ms", utc=True).tz_convert("America/New_York").strftime("%Y-%m-%d")
+    return dict(zip(days, (bar["c"] for bar in bars)))
+
+
+def option_values(client, ticker, data, endpoints, api_limit):
+    """
+    Daily buy-back values of an ETF's straddles from the options' own closes, read through the client
+    (the plan's "path" requests, see plan.path_requests).
+
+    Each trade's steps are the business days after the sale and before expiry, then the payoff at expiry.
+    A leg without a trade on a day keeps its previous close, starting from the premium it was sold at.
+
+    Returns:
+      ndarray: Trades x steps, like model_values.
+    """
+    dates = pd.DatetimeIndex(data["Date"]).tz_localize(None)
+    expirations = pd.DatetimeIndex(data["Expiration"]).tz_localize(None)
+    days = [pd.bdate_range(date + pd.Timedelta(days=1), expiration - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+            for date, expiration in zip(dates, expirations)]
+    values = np.full((len(data), max((len(d) for d in days), default=0) + 1), np.nan)
+    for i, (date, expiration) in enumerate(zip(dates.strftime("%Y-%m-%d"), expirations.strftime("%Y-%m-%d"))):
+        legs = []
+        for contract_type, price in (("call", "Call_Price"), ("put", "Put_Price")):
+            contract = find_contract(client, endpoints["options_contracts"], ticker, contract_type, expiration,
+                                     data["Strike"].iloc[i], api_limit)
+            closes = leg_closes(client.get(*aggregates_request(endpoints["aggregates"], contract, 1, "day", date, expiration))) if contract else {}
+            leg = np.array([closes.get(day, np.nan) for day in days[i]], dtype=np.float64)
+            legs.append(fill_forward(np.concatenate([[data[price].iloc[i]], leg]))[1:])
+        values[i, :len(days[i])] = legs[0] + legs[1]
+        values[i, len(days[i])] = data["Payoff"].iloc[i]
+    return values
+
+
+def minute_values(store, dates, strikes):
+    """
+    Buy-back values of the Friday straddles on every minute of their expiry session, from the minute store of
+    "Entry timing.py" (shortvol/entry_timing.py), NaN rows for Fridays or strikes it doesn't have.
+
+    Returns:
+      ndarray: Fridays x minutes of the expiry session, the payoff still to be set by close_out.
+    """
+    position = {date: i for i, date in enumerate(store["Date"])}
+    values = np.full((len(dates), store["Call"].shape[-1]), np.nan)
+    for row, (date, strike) in enumerate(zip(dates, strikes)):
+        i = position.get(date)
+        k = None if i is None or np.isnan(strike) else int(strike - store["Strike_Low"][i])
+        if k is not None and 0 <= k < store["Call"].shape[1]:
+            values[row] = store["Call"][i, k, 1] + store["Put"][i, k, 1]
+    return values
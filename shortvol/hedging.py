@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+from shortvol.options import straddle_payoff
+from shortvol.pricing import straddle_delta
+
+### Delta-hedged straddles
+# The plain P&L (premium minus payoff) mixes the volatility premium we sell with the direction the underlying took.
+# Here every short straddle is hedged along the path of its underlying from the signal's close to expiry: at each
+# rebalance bar we hold the straddle's Black-Scholes delta in shares, and what the shares make or lose offsets the
+# direction. All the trades are laid out as one (trades x bars) array, NaN-padded after each trade's last bar, so
+# deltas, positions and hedge P&L are a handful of array operations for the whole book.
+
+MARKET_CLOSE = pd.Timedelta(hours=16)  # Signals are taken on the close, options expire on the close (New York time).
+BAR_LENGTH = {"minute": pd.Timedelta(minutes=1), "hour": pd.Timedelta(hours=1)}
+# Calendar days one aggregates request can cover under Polygon's 50,000 bars, extended hours included.
+SPAN_DAYS = {"minute": 30, "hour": 1000}
+
+
+def hedge_spans(dates, expirations, timespan):
+    """
+    Date ranges ("YYYY-MM-DD" pairs) of underlying bars covering every trade, one aggregates request each.
+
+    Trades whose windows overlap (signals on consecutive days) share a range, as long as it stays under
+    SPAN_DAYS, so the bars of a week are fetched once and not once per signal.
+    """
+    order = np.argsort(pd.DatetimeIndex(dates).values)
+    starts = pd.DatetimeIndex(dates).tz_localize(None).normalize()[order]
+    ends = pd.DatetimeIndex(expirations).tz_localize(None).normalize()[order]
+    limit = pd.Timedelta(days=SPAN_DAYS[timespan])
+    spans = []
+    for start, end in zip(starts, ends):
+        if spans and start <= spans[-1][1] and max(end, spans[-1][1]) - spans[-1][0] <= limit:
+            spans[-1][1] = max(end, spans[-1][1])
+        else:
+            spans.append([start, end])
+    return [(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")) for start, end in spans]
+
+
+def bar_closes(body, multiplier=1, timespan="minute"):
+    """
+    Close times (New York, tz-naive) and closes of a Polygon aggregates answer, regular session only.
+
+    Bars are stamped with their start, the close time is start plus the bar length.
+    """
+    bars = (body or {}).get("results", [])
+    if not bars:
+        return pd.Series(dtype=np.float64)
+    starts = pd.to_datetime([bar["t"] for bar in bars], unit="ms", utc=True).tz_convert("America/New_York").tz_localize(None)
+    closes = pd.Series([bar["c"] for bar in bars], index=starts + multiplier * BAR_LENGTH[timespan], dtype=np.float64)
+    minutes = closes.index.hour * 60 + closes.index.minute
+    return closes[(minutes > 9 * 60 + 30) & (minutes <= 16 * 60)]  # Pre and post market bars are too thin to hedge in.
+
+
+def daily_closes(history):
+    """Daily Close series (e.g. a ticker_frame of the panel) restamped at the market close, to mix with bar_closes."""
+    closes = pd.Series(np.asarray(history, dtype=np.float64), index=pd.DatetimeIndex(history.index) + MARKET_CLOSE)
+    return closes[closes.notna()]
+
+
+def gather_paths(closes, entry, expiry):
+    """
+    Path of the underlying for every trade, from the last close at entry to the last close at expiry.
+
+    Parameters:
+      closes (Series): Closes indexed by close time, sorted (bar_closes or daily_closes).
+      entry, expiry (array of datetime64): When each straddle is sold and when it expires.
+
+    Returns:
+      tuple: (prices, years to expiry), both trades x bars and NaN after each trade's last bar. Trades the
+      closes don't cover (nothing before entry, history ending before expiry) are NaN throughout.
+    """
+    times = closes.index.to_numpy()
+    values = closes.to_numpy(dtype=np.float64)
+    entry = np.asarray(entry, dtype="datetime64[ns]")
+    expiry = np.asarray(expiry, dtype="datetime64[ns]")
+    if not len(times):
+        return np.full((len(entry), 1), np.nan), np.full((len(entry), 1), np.nan)
+    start = np.searchsorted(times, entry, side="right") - 1
+    end = np.searchsorted(times, expiry, side="right") - 1
+    # An expiry after the last close means the history stops before the trade is over.
+    covered = (start >= 0) & (end > start) & ~((end == len(times) - 1) & (times[end] < expiry))
+    length = np.where(covered, end - start + 1, 0)
+
+    steps = np.arange(max(length.max(initial=0), 1))
+    inside = steps[None, :] < length[:, None]
+    rows = np.clip(start[:, None] + steps[None, :], 0, len(times) - 1)
+    prices = np.where(inside, values[rows], np.nan)
+    remaining = (expiry[:, None] - times[rows]) / np.timedelta64(1, "D") / 365.0
+    return prices, np.where(inside, np.maximum(remaining, 0.0), np.nan)
+
+
+def simulate_hedge(paths, tau, strike, sigma, every=1, r=0.0, cost_per_share=0.0):
+    """
+    Delta hedge of one short straddle per row, rebalanced every `every` bars of its path.
+
+    At each rebalance bar the position is the straddle's delta (shares bought against the short straddle),
+    held until the next one; at the last bar the straddle expires and the shares are sold.
+
+    Parameters:
+      paths, tau (ndarray): Prices and years to expiry from gather_paths.
+      strike, sigma (array): Strike and annualized vol used for the deltas, one per trade.
+      every (int): Bars between two rebalances, 1 rebalances on every bar.
+      r (float): Rate for the deltas.
+      cost_per_share (float): Paid on every share bought or sold, unwinding included.
+
+    Returns:
+      DataFrame: Hedge_PL (what the shares made), Hedge_Cost, Rebalances and Expiry_Close per trade,
+      NaN for trades without a path.
+    """
+    n, m = paths.shape
+    length = np.sum(~np.isnan(paths), axis=1)
+    last = np.maximum(length - 1, 0)
+    steps = np.arange(m)
+    held = steps[None, :] < last[:, None]  # Bars followed by a move the position is exposed to.
+    rebalance = held & (steps[None, :] % every == 0)
+
+    # Deltas are only priced where a rebalance happens.
+    trade, bar = np.nonzero(rebalance)
+    deltas = np.zeros_like(paths)
+    deltas[trade, bar] = straddle_delta(paths[trade, bar], np.asarray(strike, dtype=float)[trade], tau[trade, bar],
+                                        np.asarray(sigma, dtype=float)[trade], r)
+    since = np.maximum.accumulate(np.where(rebalance, steps[None, :], 0), axis=1)  # Last rebalance bar at or before each bar.
+    position = np.where(held, np.take_along_axis(deltas, since, axis=1), 0.0)
+    position = np.nan_to_num(position)
+
+    moves = np.zeros_like(paths)
+    moves[:, :-1] = np.nan_to_num(paths[:, 1:] - paths[:, :-1])
+    hedge_pl = np.sum(position * moves, axis=1)
+    traded = np.sum(np.abs(np.diff(position, axis=1, prepend=0.0, append=0.0)), axis=1)
+
+    has_path = length > 1
+    return pd.DataFrame({
+        "Hedge_PL": np.where(has_path, hedge_pl, np.nan),
+        "Hedge_Cost": np.where(has_path, traded * cost_per_share, np.nan),
+        "Rebalances": rebalance.sum(axis=1),
+        "Expiry_Close": np.where(has_path, paths[np.arange(n), last], np.nan),
+    })
+
+
+def hedged_pl(data, closes, sigma, every=1, r=0.0, cost_per_share=0.0):
+    """
+    Hedge columns for the straddles of one underlying, the output of price_straddles.
+
+    Parameters:
+      data (DataFrame): Date, Expiration, Strike and Premium of each straddle.
+      closes (Series): The underlying's closes covering the trades (bar_closes or daily_closes).
+      sigma (array): Annualized vol for the deltas, one per straddle.
+
+    Returns:
+      DataFrame: simulate_hedge's columns, plus Hedged_PL: premium, minus the payoff on the path's last close,
+      plus the hedge, minus its costs. Same index as `data`.
+    """
+    entry = pd.DatetimeIndex(data["Date"]).tz_localize(None) + MARKET_CLOSE
+    expiry = pd.DatetimeIndex(data["Expiration"]).tz_localize(None) + MARKET_CLOSE
+    paths, tau = gather_paths(closes, entry, expiry)
+    hedge = simulate_hedge(paths, tau, data["Strike"].to_numpy(), sigma, every, r, cost_per_share)
+    hedge.index = data.index
+    payoff = straddle_payoff(data["Strike"].to_numpy(dtype=float), hedge["Expiry_Close"].to_numpy())
+    hedge["Hedged_PL"] = data["Premium"].to_numpy(dtype=float) - payoff + hedge["Hedge_PL"] - hedge["Hedge_Cost"]
+    return hedge
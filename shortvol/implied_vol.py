@@ -0,0 +1,135 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from shortvol.pricing import annualize_vol, black_scholes, vega, year_fraction
+
+VOL_LOW = 1e-4  # Bracket for the bisection fallback, in annualized vol.
+VOL_HIGH = 5.0
+SURFACE_KEYS = ["Ticker", "Date", "Expiration", "Strike", "Type"]
+
+
+def implied_vol(price, S, K, T, r=0.0, q=0.0, is_call=True, tol=1e-6, max_iter=20):
+    """
+    Black-Scholes implied volatility of many option prices at once.
+
+    Every row runs Newton steps together (one vectorized pricing call per step). Rows where
+    Newton misbehaves (vega too small, a step leaving the bracket, no convergence) are finished
+    by a vectorized bisection on [VOL_LOW, VOL_HIGH], which always converges for valid prices.
+
+    Parameters:
+      price (array): Option prices.
+      S, K (array): Underlying price and strike.
+      T (array): Time to expiry in years.
+      r, q (float): Rate and dividend yield.
+      is_call (bool or array): True for calls, False for puts.
+
+    Returns:
+      ndarray: Implied vols, NaN where the price is outside the no-arbitrage bounds or T <= 0.
+    """
+    price, S, K, T, is_call = np.broadcast_arrays(*(np.atleast_1d(a) for a in (price, S, K, T, is_call)))
+    price, S, K, T = (a.astype(float) for a in (price, S, K, T))
+
+    # A price below intrinsic or above the underlying (strike for puts) has no implied vol.
+    forward_disc = S * np.exp(-q * T)
+    strike_disc = K * np.exp(-r * T)
+    lower = np.where(is_call, np.maximum(forward_disc - strike_disc, 0), np.maximum(strike_disc - forward_disc, 0))
+    upper = np.where(is_call, forward_disc, strike_disc)
+    valid = np.isfinite(price) & (T > 0) & (price > lower) & (price < upper)
+
+    sigma = np.full(price.shape, 0.3)
+    done = ~valid
+    for _ in range(max_iter):
+        live = ~done
+        if not live.any():
+            break
+        diff = black_scholes(S[live], K[live], T[live], sigma[live], r, q, is_call[live]) - price[live]
+        v = vega(S[live], K[live], T[live], sigma[live], r, q)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = np.where(v > 1e-8, diff / v, np.nan)
+        new = sigma[live] - step
+        bad = ~np.isfinite(new) | (new <= VOL_LOW) | (new >= VOL_HIGH)
+        converged = ~bad & (np.abs(step) < tol)  # On the vol, a price tolerance means nothing for far OTM options.
+
+        idx = np.flatnonzero(live)
+        sigma[idx[~bad]] = new[~bad]
+        sigma[idx[bad]] = np.nan  # Handed over to the bisection.
+        done[idx[converged | bad]] = True
+
+    failed = valid & (~np.isfinite(sigma) | ~done)
+    if failed.any():
+        sigma[failed] = _bisect(price[failed], S[failed], K[failed], T[failed], r, q, is_call[failed], tol)
+    sigma[~valid] = np.nan
+    return sigma
+
+
+def _bisect(price, S, K, T, r, q, is_call, tol, max_iter=100):
+    low = np.full(price.shape, VOL_LOW)
+    high = np.full(price.shape, VOL_HIGH)
+    for _ in range(max_iter):
+        mid = 0.5 * (low + high)
+        too_high = black_scholes(S, K, T, mid, r, q, is_call) > price
+        high = np.where(too_high, mid, high)
+        low = np.where(too_high, low, mid)
+        if np.max(high - low) < tol:
+            break
+    return 0.5 * (low + high)
+
+
+def load_surface(path):
+    """Cached implied vols, an empty frame when nothing has been solved yet."""
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return pd.DataFrame(columns=SURFACE_KEYS + ["Underlying", "Price", "IV"])
+
+
+def update_surface(path, quotes, r=0.0):
+    """
+    Add new option quotes to the per-ticker, per-date implied vol cache.
+
+    Parameters:
+      path (str): Pickle holding the surface.
+      quotes (DataFrame): One row per option with SURFACE_KEYS ("call"/"put" in Type),
+        Underlying (spot at the quote) and Price.
+      r (float): Rate used when solving.
+
+    Returns:
+      DataFrame: The full surface. Only quotes whose key is not cached yet are solved.
+    """
+    surface = load_surface(path)
+    quotes = quotes[SURFACE_KEYS + ["Underlying", "Price"]]
+    known = pd.MultiIndex.from_frame(surface[SURFACE_KEYS]) if len(surface) else pd.MultiIndex.from_tuples([], names=SURFACE_KEYS)
+    new = quotes[~pd.MultiIndex.from_frame(quotes[SURFACE_KEYS]).isin(known)]
+    new = new.drop_duplicates(SURFACE_KEYS)
+
+    if len(new):
+        new = new.assign(IV=implied_vol(new["Price"], new["Underlying"], new["Strike"],
+                                        year_fraction(new["Date"], new["Expiration"]), r,
+                                        is_call=(new["Type"] == "call").to_numpy()))
+        surface = new if surface.empty else pd.concat([surface, new], ignore_index=True)
+        surface = surface.sort_values(["Ticker", "Date", "Expiration", "Strike", "Type"], ignore_index=True)
+        with open(path, "wb") as f:
+            pickle.dump(surface, f)
+    return surface
+
+
+def vrp_table(surface, realized):
+    """
+    Variance risk premium per ticker and date: straddle implied vol minus realized vol.
+
+    Parameters:
+      surface (DataFrame): Output of update_surface.
+      realized (DataFrame): Ticker, Date and Volatility (daily std of log returns, as in ETFs.py).
+
+    Returns:
+      DataFrame: Ticker, Date, IV (mean of the call and put vols), Realized_Vol (annualized) and VRP.
+    """
+    atm = surface.groupby(["Ticker", "Date"], as_index=False)["IV"].mean()
+    realized = realized[["Ticker", "Date", "Volatility"]].drop_duplicates(["Ticker", "Date"])
+    table = atm.merge(realized, on=["Ticker", "Date"], how="inner")
+    table["Realized_Vol"] = annualize_vol(table.pop("Volatility"))
+    table["VRP"] = table["IV"] - table["Realized_Vol"]
+    return table
@@ -0,0 +1,167 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from shortvol.config import root_path
+
+PROFILE_FLAG = "SHORTVOL_PROFILE"  # Set to 1 to add cProfile and tracemalloc captures to the run report.
+
+
+class RunReport:
+    """
+    Timings and counters of one script run, written as JSON to "Run reports" under the data path.
+
+    Scripts call stage() as they move from one step to the next; library code (the Polygon client,
+    the rate limiter, ...) reports through the module-level count() and add_time(), which go to
+    whichever report is active and do nothing when there is none.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = []
+        self.current = None
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.drops = defaultdict(lambda: {"before": 0, "after": 0})
+        self.lock = threading.Lock()  # Counters and timers are also updated from fetch threads.
+        self.profiler = None
+        if os.getenv(PROFILE_FLAG) == "1":
+            import cProfile
+            import tracemalloc
+
+            tracemalloc.start()
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stage(self, name):
+        """Close the running stage (if any) and start timing the next one."""
+        now = time.perf_counter()
+        if self.current is not None:
+            self.stages.append({"name": self.current[0], "seconds": now - self.current[1]})
+        self.current = None if name is None else (name, now)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.timers[name] += seconds
+
+    def dropped(self, stage, before, after):
+        """Rows going into and out of a dropna (or any filter), summed over every call for that stage."""
+        self.drops[stage]["before"] += before
+        self.drops[stage]["after"] += after
+
+    def to_dict(self):
+        wall = time.perf_counter() - self.start
+        idle = sum(seconds for name, seconds in self.timers.items() if name.endswith("wait_seconds"))
+        report = {
+            "run": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_seconds": wall,
+            "idle_seconds": idle,  # Time spent waiting on rate limits rather than working.
+            "stages": self.stages,
+            "counters": dict(self.counters),
+            "timers": dict(self.timers),
+            "dropped": {stage: {**rows, "dropped": rows["before"] - rows["after"]} for stage, rows in self.drops.items()},
+        }
+        if self.counters.get("http.requests"):
+            report["requests_per_minute"] = self.counters["http.requests"] / wall * 60
+        return report
+
+    def write(self):
+        """Close the last stage and save the report, with the profiles when SHORTVOL_PROFILE=1."""
+        self.stage(None)
+        directory = os.path.join(root_path(), "Run reports")
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{self.name} {self.started:%Y%m%d-%H%M%S}")
+        report = self.to_dict()
+
+        if self.profiler is not None:
+            import pstats
+            import tracemalloc
+
+            self.profiler.disable()
+            self.profiler.dump_stats(base + ".prof")  # Open with snakeviz or pstats for the full picture.
+            stats = pstats.Stats(self.profiler).sort_stats("cumulative")
+            report["profile_top"] = [
+                {"function": f"{file}:{line}({func})", "calls": calls, "cumulative_seconds": cumulative}
+                for (file, line, func), (_, calls, _, cumulative, _) in
+                sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:25]
+            ]
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:15]
+            report["memory"] = {
+                "current_mb": current / 1e6,
+                "peak_mb": peak / 1e6,
+                "top_allocations": [{"where": str(stat.traceback), "mb": stat.size / 1e6} for stat in top],
+            }
+            tracemalloc.stop()
+
+        with open(base + ".json", "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        return base + ".json"
+
+
+_active = None
+
+
+def start_run(name):
+    """Make a new report the active one and write it when the script exits (sys.exit included)."""
+    global _active
+    _active = RunReport(name)
+    atexit.register(_active.write)
+    return _active
+
+
+def active():
+    return _active
+
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
+
+
+def add_time(name, seconds):
+    if _active is not None:
+        _active.add_time(name, seconds)
+
+
+def dropped(stage, before, after):
+    if _active is not None:
+        _active.dropped(stage, before, after)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in a block to a timer of the active report."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+
+def endpoint_group(endpoint):
+    """
+    Endpoint without its per-request parts, to count requests per endpoint.
+
+    "/v1/open-close/O:SPY230306C00404000/2023-03-03" -> "/v1/open-close". Path segments are kept
+    until one holding a ticker (upper case or ":") shows up.
+    """
+    kept = []
+    for part in endpoint.split("/"):
+        if ":" in part or any(char.isupper() for char in part):
+            break
+        kept.append(part)
+    return "/".join(kept)
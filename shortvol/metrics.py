@@ -0,0 +1,313 @@
+import math
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+def compute_performance(df, initial_equity, periods_per_year=52):
+    """
+    Computes key performance metrics for a portfolio given an initial equity.
+
+    Parameters:
+      df (DataFrame): The trade-level dataframe (must include Date and PL columns).
+      initial_equity (float): The starting equity.
+      periods_per_year (float): Trades per year the Sharpe ratio is annualized with, 52 for weekly straddles.
+
+    Returns:
+      dict: A dictionary containing performance metrics.
+    """
+    # The original record is left untouched: the curves below are standalone Series, not columns added to a copy.
+    PL = df['PL'].astype(np.float64)
+    # Building an equity curve allows us to see how each trade influences our overall portfolio.
+    equity = initial_equity + PL.cumsum()
+
+    # Our final equity is the sum of the starting capital and the total profit/loss.
+    # This leads us naturally to calculate the total return and the ROI.
+    final_equity = equity.iloc[-1]
+    total_return = final_equity - initial_equity
+    ROI = total_return / initial_equity
+
+    # To measure our strategy's annualized performance, we compute the Compound Annual Growth Rate (CAGR).
+    # This metric smooths out the journey, providing a yearly rate that’s comparable to other investments.
+    start_date = df["Date"].iloc[0]
+    end_date = df["Date"].iloc[-1]
+    years = (end_date - start_date).days / 365.25
+    CAGR = (final_equity / initial_equity) ** (1 / years) - 1 if years > 0 else np.nan
+
+    # Trade-level statistics reveal the underlying mechanics of our performance.
+    # We separate winning trades from losing ones, calculate the win rate, and assess the average gains and losses.
+    wins = PL[PL > 0]
+    losses = PL[PL < 0]
+    win_rate = len(wins) / len(PL) if len(PL) > 0 else np.nan
+    avg_win = wins.mean() if not wins.empty else 0
+    avg_loss = losses.mean() if not losses.empty else 0
+    # The profit factor summarizes the risk/reward ratio by comparing total gains to total losses.
+    profit_factor = wins.sum() / abs(losses.sum()) if losses.sum() != 0 else np.nan
+
+    # Maximum drawdown tells the story of the worst period in our portfolio,
+    # quantifying the largest drop from a peak to a subsequent trough.
+    roll_max = equity.cummax()
+    max_drawdown = ((equity - roll_max) / roll_max).min()
+
+    # To understand risk-adjusted returns, we approximate the Sharpe Ratio.
+    # By examining the volatility of trade-to-trade returns, we gauge whether our gains justify the risk taken.
+    trade_return = equity.pct_change()
+    if trade_return.std() != 0 and len(PL) > 1:
+        sharpe_ratio = (trade_return.mean() / trade_return.std()) * np.sqrt(periods_per_year)
+    else:
+        sharpe_ratio = np.nan
+
+    # Our performance dictionary encapsulates the entire narrative of our trading journey.
+    return {
+        "Final Equity": final_equity,
+        "Total Return ($)": total_return,
+        "ROI": ROI,
+        "CAGR": CAGR,
+        "Win Rate": win_rate,
+        "Average Win": avg_win,
+        "Average Loss": avg_loss,
+        "Profit Factor": profit_factor,
+        "Max Drawdown": max_drawdown,
+        "Sharpe Ratio": sharpe_ratio,
+        "Number of Trades": len(PL)
+    }
+
+
+### Streaming metrics
+# Every class below takes one observation at a time through update() and does O(1) amortized work,
+# by keeping running sums over the window instead of recomputing it. The same objects can replay a
+# whole backtest or be pickled and fed new trades as they close, and they give the same numbers.
+# window=None means an expanding window (everything seen so far).
+
+class RollingMoments:
+    """
+    Running count, mean and standard deviation (ddof=0, like np.std) over the last `window` values.
+
+    Welford updates, run backwards to take a value out: no sum of squares to cancel out, and a value that
+    leaves the window leaves nothing behind. Values that are not finite are left out.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.values = deque()
+        self.n = 0
+        self._mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations from the mean.
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self._mean
+        self._mean += delta / self.n
+        self.m2 += delta * (x - self._mean)
+
+    def remove(self, x):
+        if self.n <= 1:
+            self.n, self._mean, self.m2 = 0, 0.0, 0.0
+            return
+        self.n -= 1
+        delta = x - self._mean
+        self._mean -= delta / self.n
+        self.m2 -= delta * (x - self._mean)
+
+    def update(self, x):
+        if not math.isfinite(x):
+            return self.mean, self.std
+        self.add(x)
+        if self.window:
+            self.values.append(x)
+            if self.n > self.window:
+                self.remove(self.values.popleft())
+        return self.mean, self.std
+
+    @property
+    def mean(self):
+        return self._mean if self.n else math.nan
+
+    @property
+    def std(self):
+        if not self.n:
+            return math.nan
+        return math.sqrt(max(self.m2 / self.n, 0.0))  # Rounding can leave a tiny negative when the window is flat.
+
+
+class RollingSharpe:
+    """Mean over std of returns in the window, optionally annualized by sqrt(periods_per_year)."""
+
+    def __init__(self, window=None, periods_per_year=None):
+        self.moments = RollingMoments(window)
+        self.scale = math.sqrt(periods_per_year) if periods_per_year else 1.0
+
+    def update(self, ret):
+        if not math.isfinite(ret):
+            return math.nan  # Left out of the window, see StrategyMonitor.
+        mean, std = self.moments.update(ret)
+        return mean / std * self.scale if std > 0 else math.nan
+
+
+class RollingSortino:
+    """Mean of returns over the std of the negative returns in the window, as in "PL analysis.py"."""
+
+    def __init__(self, window=None, periods_per_year=None):
+        self.window = window
+        self.moments = RollingMoments(window)
+        self.downside = RollingMoments()  # Fed through add/remove, values leave it when they leave the window.
+        self.values = deque()
+        self.scale = math.sqrt(periods_per_year) if periods_per_year else 1.0
+
+    def update(self, ret):
+        if not math.isfinite(ret):
+            return math.nan  # Left out of the window, see StrategyMonitor.
+        mean, _ = self.moments.update(ret)
+        if self.window:
+            self.values.append(ret)
+            if len(self.values) > self.window:
+                old = self.values.popleft()
+                if old < 0:
+                    self.downside.remove(old)
+        if ret < 0:
+            self.downside.add(ret)
+        std = self.downside.std
+        return mean / std * self.scale if std > 0 else math.nan
+
+
+class DrawdownTracker:
+    """
+    Running drawdown of an equity curve and how long it has lasted.
+
+    With window=None the peak is the all-time high, as in compute_performance. With a window the
+    peak is the highest equity of the last `window` observations, kept in a monotonic deque, so
+    an old peak stops counting once it leaves the window.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.peaks = deque()  # (index, equity) with decreasing equity, the front is the window peak.
+        self.i = 0
+        self.peak = -math.inf
+        self.peak_index = 0
+        self.drawdown = 0.0
+        self.duration = 0
+        self.max_drawdown = 0.0
+        self.max_duration = 0
+
+    def update(self, equity):
+        if self.window:
+            while self.peaks and self.peaks[-1][1] <= equity:
+                self.peaks.pop()
+            self.peaks.append((self.i, equity))
+            if self.peaks[0][0] <= self.i - self.window:
+                self.peaks.popleft()
+            self.peak_index, self.peak = self.peaks[0]
+        elif equity >= self.peak:
+            self.peak, self.peak_index = equity, self.i
+
+        self.drawdown = (equity - self.peak) / self.peak  # Negative or zero, same sign as compute_performance.
+        self.duration = self.i - self.peak_index  # Periods spent below the peak.
+        self.max_drawdown = min(self.max_drawdown, self.drawdown)
+        self.max_duration = max(self.max_duration, self.duration)
+        self.i += 1
+        return self.drawdown, self.duration
+
+
+class RollingWinRate:
+    """Share of positive trades among the last `window` trades."""
+
+    def __init__(self, window=None):
+        self.window = window
+        self.outcomes = deque()
+        self.n = 0
+        self.wins = 0
+
+    def update(self, pl):
+        win = pl > 0
+        if self.window:
+            self.outcomes.append(win)
+        self.n += 1
+        self.wins += win
+        if self.window and self.n > self.window:
+            self.wins -= self.outcomes.popleft()
+            self.n -= 1
+        return self.wins / self.n
+
+
+class StrategyMonitor:
+    """
+    All streaming metrics of one strategy, fed trade by trade.
+
+    Parameters:
+      initial_equity (float): Starting equity of the equity curve.
+      window (int): Trades per rolling window, None for expanding metrics.
+      periods_per_year (float): Annualization for Sharpe and Sortino, None to leave them per trade.
+
+    Use run() on a P&L series to replay a backtest, then keep calling update() as new trades close.
+    Returns are log returns of the equity curve, as in "PL analysis.py": NaN once the equity is at or below 0,
+    and left out of Sharpe and Sortino. A P&L that is not finite is skipped, its row repeats the previous one.
+    """
+
+    def __init__(self, initial_equity, window=None, periods_per_year=None):
+        self.equity = initial_equity
+        self.sharpe = RollingSharpe(window, periods_per_year)
+        self.sortino = RollingSortino(window, periods_per_year)
+        self.drawdown = DrawdownTracker()  # Drawdown is always measured from the all-time high.
+        self.win_rate = RollingWinRate(window)
+        self.drawdown.update(initial_equity)
+        self.last = {"Equity": initial_equity, "Rolling_Sharpe": math.nan, "Rolling_Sortino": math.nan,
+                     "Drawdown": 0.0, "Drawdown_Duration": 0, "Rolling_Win_Rate": math.nan}
+
+    def update(self, pl):
+        if not math.isfinite(pl):
+            return dict(self.last)
+        previous = self.equity
+        self.equity += pl
+        ret = math.log(self.equity / previous) if previous > 0 and self.equity > 0 else math.nan  # np.log's NaN, a blown-up book.
+        drawdown, duration = self.drawdown.update(self.equity)
+        self.last = {
+            "Equity": self.equity,
+            "Rolling_Sharpe": self.sharpe.update(ret),
+            "Rolling_Sortino": self.sortino.update(ret),
+            "Drawdown": drawdown,
+            "Drawdown_Duration": duration,
+            "Rolling_Win_Rate": self.win_rate.update(pl),
+        }
+        return dict(self.last)
+
+    def run(self, pl, index=None):
+        """Feed a whole P&L sequence, returning one row of metrics per trade."""
+        rows = [self.update(float(x)) for x in pl]
+        return pd.DataFrame(rows, index=index)
+
+
+def etf_results(Portfolio_PL, initial_equity, window=None, min_trades=10):
+    """
+    Full-period metrics of every ETF in Portfolio_PL, the table of "PL analysis.py", plus the rolling replay.
+
+    Sharpe and Sortino are per trade, on the log returns of each ETF's own equity curve; drawdown and
+    return are in basis points. ETFs with fewer than `min_trades` trades are left out.
+
+    Returns:
+      tuple: (DataFrame with ETF, Sharpe_ratio, Sortino_ratio, Max_drawdown and Overall_return,
+      dict ETF -> StrategyMonitor.run output).
+    """
+    individual_results = []
+    rolling_results = {}
+    for etf, data in Portfolio_PL.items():
+        if len(data) < min_trades:
+            continue
+        equity_curve = initial_equity + np.concatenate([[0.0], np.cumsum(data['PL'].to_numpy(dtype=float))])
+        log_returns = np.log(equity_curve[1:] / equity_curve[:-1])
+        downside_returns = log_returns[log_returns < 0]
+        running_max = np.maximum.accumulate(equity_curve)
+        drawdowns = ((running_max - equity_curve) / running_max) * 100 * 100
+
+        individual_results.append({
+            "ETF": etf,
+            "Sharpe_ratio": np.mean(log_returns) / np.std(log_returns),
+            "Sortino_ratio": np.mean(log_returns) / np.std(downside_returns) if len(downside_returns) > 0 else np.nan,
+            "Max_drawdown": np.max(drawdowns),
+            "Overall_return": ((equity_curve[-1] - equity_curve[0]) / equity_curve[0]) * 100 * 100,
+        })
+        # To see when the edge decays we also replay the trades through the streaming metrics.
+        rolling_results[etf] = StrategyMonitor(initial_equity, window=window).run(data['PL'], index=data['Date'])
+    return pd.DataFrame(individual_results, columns=["ETF", "Sharpe_ratio", "Sortino_ratio", "Max_drawdown", "Overall_return"]), rolling_results
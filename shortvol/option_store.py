@@ -0,0 +1,256 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from shortvol import instrument
+from shortvol.config import root_path
+from shortvol.polygon import daily_close, find_contract
+from shortvol.schema import to_epoch
+
+### Option store
+# Option contracts and their daily closes as integers and typed arrays instead of OCC strings, JSON answers and
+# object columns. Every OCC symbol is interned once into a contract table, its id being its row: underlying (a code
+# into the list of roots), expiry and signal dates as days since the epoch, call or put, strike in thousandths of a
+# dollar. The table's four fields pack into one int64 key, sorted once, so finding the contracts of any number of
+# straddle legs is a single searchsorted. Closes and volumes sit in a long table sorted by (contract id, day), its
+# key being contract_id * 2^32 + day: the premiums of every signal are one more searchsorted, and a million
+# contract-days take about 32 MB. The store lives at the root of the data path next to the Polygon cache, filled
+# from the cache the first time a leg is priced, and shared by both subprojects.
+
+NO_CONTRACT = -1  # Id of a leg without a contract, and of contracts not in the store.
+NS_PER_DAY = 86_400 * 10 ** 9
+CONTRACT_TYPES = {"call": 0, "put": 1}
+
+
+def store_path():
+    return os.path.join(root_path(), "Option store.pkl")
+
+
+def day_numbers(dates):
+    """Days since the epoch of "YYYY-MM-DD" strings, datetimes or int64 epochs, as int32."""
+    dates = np.asarray(dates)
+    epoch = dates.astype(np.int64) if np.issubdtype(dates.dtype, np.integer) else to_epoch(pd.to_datetime(dates))
+    return (epoch // NS_PER_DAY).astype(np.int32)
+
+
+def parse_occ(symbol):
+    """(root, expiry "YYYY-MM-DD", "call" or "put", strike in thousandths) of an OCC symbol like O:SPY230217C00410000."""
+    body = symbol[2:] if symbol.startswith("O:") else symbol
+    root, expiry, kind, strike = body[:-15], body[-15:-9], body[-9], body[-8:]
+    return root, f"20{expiry[:2]}-{expiry[2:4]}-{expiry[4:]}", "call" if kind == "C" else "put", int(strike)
+
+
+def contract_keys(underlying, expiry, kind, strike):
+    """int64 key of (underlying code, expiry day, type, strike in thousandths): 15, 16, 1 and 31 bits."""
+    underlying, expiry, kind, strike = (np.asarray(values, dtype=np.int64) for values in (underlying, expiry, kind, strike))
+    return (((underlying << 16 | expiry) << 1 | kind) << 31) | strike
+
+
+def price_keys(ids, days):
+    """int64 key of (contract id, day), the order of the price table."""
+    return np.asarray(ids, dtype=np.int64) << 32 | np.asarray(days, dtype=np.int64)
+
+
+class OptionStore:
+    """
+    Interned option contracts and their daily closes.
+
+    Attributes:
+      roots (list): Underlying of each code, e.g. "SPY".
+      symbols (list): OCC symbol of each contract id.
+      contracts (dict): Underlying (int16 code), Expiry (int32 day), Type (uint8, 0 call, 1 put) and Strike
+        (int64 thousandths), one row per contract id.
+      prices (dict): Contract (int32), Day (int32), Close (float64, the premiums exactly as Polygon sends them)
+        and Volume (int64, -1 when unknown), sorted by contract then day.
+    """
+
+    def __init__(self):
+        self.roots = []
+        self.symbols = []
+        self.contracts = {"Underlying": np.empty(0, np.int16), "Expiry": np.empty(0, np.int32),
+                          "Type": np.empty(0, np.uint8), "Strike": np.empty(0, np.int64)}
+        self.prices = {"Contract": np.empty(0, np.int32), "Day": np.empty(0, np.int32),
+                       "Close": np.empty(0, np.float64), "Volume": np.empty(0, np.int64)}
+        self._reset()
+
+    def _reset(self):
+        self._ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._codes = {root: i for i, root in enumerate(self.roots)}
+        keys = contract_keys(*self.contracts.values())
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+        self._price_keys = price_keys(self.prices["Contract"], self.prices["Day"])
+
+    def __getstate__(self):
+        return {"roots": self.roots, "symbols": self.symbols, "contracts": self.contracts, "prices": self.prices}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def __len__(self):
+        """Contract-days with a close."""
+        return len(self.prices["Day"])
+
+    def intern(self, symbols):
+        """
+        Ids of OCC symbols, the new ones added to the contract table.
+
+        Parameters:
+          symbols (iterable): OCC symbols, None for legs without a contract.
+
+        Returns:
+          ndarray: int32 ids, NO_CONTRACT for None.
+        """
+        symbols = list(symbols)
+        new = list(dict.fromkeys(s for s in symbols if s is not None and s not in self._ids))
+        if new:
+            parsed = [parse_occ(symbol) for symbol in new]
+            for root, *_ in parsed:
+                if root not in self._codes:
+                    self._codes[root] = len(self.roots)
+                    self.roots.append(root)
+            added = {
+                "Underlying": np.array([self._codes[root] for root, *_ in parsed], dtype=np.int16),
+                "Expiry": day_numbers([expiry for _, expiry, _, _ in parsed]),
+                "Type": np.array([CONTRACT_TYPES[kind] for _, _, kind, _ in parsed], dtype=np.uint8),
+                "Strike": np.array([strike for *_, strike in parsed], dtype=np.int64),
+            }
+            self.contracts = {column: np.concatenate([values, added[column]]) for column, values in self.contracts.items()}
+            self.symbols += new
+            self._reset()
+            instrument.count("option_store.contracts_added", len(new))
+        return np.array([NO_CONTRACT if s is None else self._ids[s] for s in symbols], dtype=np.int32)
+
+    def find(self, underlying, expirations, contract_type, strikes):
+        """
+        Ids of the standard contracts of straddle legs, NO_CONTRACT for the ones not in the store.
+
+        Parameters:
+          underlying (str): Root of the contracts, e.g. "SPY". Adjusted contracts (other roots) aren't found this way.
+          expirations (array): Expiry of each leg, see day_numbers.
+          contract_type (str): "call" or "put".
+          strikes (array): Strike of each leg in dollars.
+        """
+        code = self._codes.get(underlying)
+        n = len(expirations)
+        if code is None or not len(self._keys):
+            return np.full(n, NO_CONTRACT, dtype=np.int32)
+        strikes = np.asarray(strikes, dtype=np.float64)
+        valid = np.isfinite(strikes)
+        keys = contract_keys(np.full(n, code), day_numbers(expirations), np.full(n, CONTRACT_TYPES[contract_type]),
+                             np.round(np.where(valid, strikes, 0) * 1000))
+        position = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = valid & (self._keys[position] == keys)
+        return np.where(found, self._order[position], NO_CONTRACT).astype(np.int32)
+
+    def add_prices(self, ids, dates, closes, volumes=None):
+        """
+        Closes (and volumes) of contracts on dates, replacing what the store had for the same contract and day.
+        Legs without a contract or a close are skipped.
+        """
+        ids = np.asarray(ids, dtype=np.int32)
+        closes = np.asarray(closes, dtype=np.float64)
+        volumes = np.full(len(ids), -1) if volumes is None else np.asarray(volumes, dtype=np.float64)
+        keep = (ids != NO_CONTRACT) & ~np.isnan(closes)
+        if not keep.any():
+            return
+        added = {"Contract": ids[keep], "Day": day_numbers(dates)[keep], "Close": closes[keep],
+                 "Volume": np.where(np.isnan(volumes[keep]), -1, volumes[keep]).astype(np.int64)}
+        merged = {column: np.concatenate([values, added[column]]) for column, values in self.prices.items()}
+        keys = price_keys(merged["Contract"], merged["Day"])
+        order = np.argsort(keys, kind="stable")  # The added rows come after the stored ones with the same key.
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        self.prices = {column: values[order][last] for column, values in merged.items()}
+        self._price_keys = keys[last]
+        instrument.count("option_store.prices_added", int(keep.sum()))
+
+    def closes(self, ids, dates):
+        """
+        Close and volume of each (contract id, date), NaN where the store has none.
+
+        Returns:
+          tuple: (close, volume), float64 arrays.
+        """
+        ids = np.asarray(ids, dtype=np.int32)
+        keys = price_keys(ids, day_numbers(dates))
+        stored = self._price_keys
+        close, volume = np.full(len(ids), np.nan), np.full(len(ids), np.nan)
+        if not len(stored):
+            return close, volume
+        position = np.minimum(np.searchsorted(stored, keys), len(stored) - 1)
+        found = (ids != NO_CONTRACT) & (stored[position] == keys)
+        close[found] = self.prices["Close"][position[found]]
+        known = found & (self.prices["Volume"][position] >= 0)
+        volume[known] = self.prices["Volume"][position[known]]
+        return close, volume
+
+    def symbol(self, ids):
+        """OCC symbols of ids, None for NO_CONTRACT."""
+        return [None if i == NO_CONTRACT else self.symbols[i] for i in np.asarray(ids)]
+
+
+def load_option_store(path=None):
+    """The store saved at `path` (store_path() by default), an empty one when there is none."""
+    path = path or store_path()
+    if not os.path.exists(path):
+        return OptionStore()
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_option_store(store, path=None):
+    with open(path or store_path(), "wb") as f:
+        pickle.dump(store, f)
+
+
+def lookup_contracts(store, client, endpoint, underlying, contract_type, expirations, strikes, limit):
+    """
+    Contract ids of straddle legs: from the store, the others looked up through the client (find_contract,
+    the cache once the plan has run) and interned.
+
+    Parameters:
+      expirations (array): "YYYY-MM-DD" expiry of each leg.
+      strikes (array): Strike of each leg.
+
+    Returns:
+      ndarray: int32 ids, NO_CONTRACT where there is no contract.
+    """
+    expirations = np.asarray(expirations, dtype=object)
+    strikes = np.asarray(strikes, dtype=np.float64)
+    ids = store.find(underlying, expirations, contract_type, strikes)
+    missing = np.flatnonzero(ids == NO_CONTRACT)
+    instrument.count("option_store.contract_hits", len(ids) - len(missing))
+    if len(missing):
+        found = [find_contract(client, endpoint, underlying, contract_type, expirations[i], strikes[i], limit) for i in missing]
+        ids[missing] = store.intern(found)
+    return ids
+
+
+def lookup_closes(store, client, endpoint, ids, dates):
+    """
+    Close and volume of each leg on its date: from the store, the others read through the client (daily_close)
+    and added to it. Legs without a contract have neither.
+
+    Parameters:
+      ids (array): Contract ids, see lookup_contracts.
+      dates (array): "YYYY-MM-DD" date of each leg.
+
+    Returns:
+      tuple: (close, volume), float64 arrays with NaN where there is no close.
+    """
+    ids = np.asarray(ids, dtype=np.int32)
+    dates = np.asarray(dates, dtype=object)
+    close, volume = store.closes(ids, dates)
+    # Closes stored without their volume (e.g. from the Friday lists pickled before the store) are read again.
+    missing = np.flatnonzero((np.isnan(close) | np.isnan(volume)) & (ids != NO_CONTRACT))
+    instrument.count("option_store.price_hits", int(np.sum(ids != NO_CONTRACT)) - len(missing))
+    if len(missing):
+        answers = [daily_close(client, endpoint, store.symbols[ids[i]], dates[i]) for i in missing]
+        store.add_prices(ids[missing], dates[missing], [np.nan if c is None else c for c, _ in answers],
+                         [np.nan if v is None else v for _, v in answers])
+        close, volume = store.closes(ids, dates)
+    return close, volume
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+
+def expiration_dates(signal_dates, friday_expiration):
+    """
+    Expiration of the straddle sold on each signal date, vectorized version of the rule in "Polygon data.py".
+
+    Friday-expiration ETFs: a Monday signal uses that week's Friday (+4 days), any other day
+    uses next week's Friday. Every other ETF expires 7 days after the signal.
+
+    Parameters:
+      signal_dates (Series or DatetimeIndex): Dates of the signals.
+      friday_expiration (bool): Whether the ETF is in expiration_rules.friday_expiration_etfs.
+
+    Returns:
+      DatetimeIndex: One expiration per signal.
+    """
+    dates = pd.DatetimeIndex(signal_dates)
+    if friday_expiration:
+        weekday = dates.dayofweek  # Monday = 0, Sunday = 6
+        days = np.where(weekday == 0, 4, (4 - weekday) % 7 + 7)
+    else:
+        days = np.full(len(dates), 7)
+    return dates + pd.to_timedelta(days, unit="D")
+
+
+def straddle_payoff(strike, underlying):
+    """Payoff of a long straddle at expiry, |S - K|, written as call plus put like the scripts do."""
+    return np.maximum(underlying - strike, 0) + np.maximum(strike - underlying, 0)
+
+
+def straddle_pl(data):
+    """
+    Premium, Payoff and PL columns of short straddles held to Future_Close.
+
+    Parameters:
+      data (DataFrame): With Call_Price, Put_Price, Strike and Future_Close.
+
+    Returns:
+      DataFrame: The same frame, with Premium (received), Payoff (paid at expiry) and PL added.
+    """
+    data['Premium'] = data['Call_Price'] + data['Put_Price']
+    data['Payoff'] = straddle_payoff(data['Strike'], data['Future_Close'])
+    data['PL'] = data['Premium'] - data['Payoff']
+    return data
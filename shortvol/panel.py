@@ -0,0 +1,88 @@
+import os
+import pickle
+
+import pandas as pd
+
+from shortvol import instrument
+from shortvol.schema import PRICE_DTYPE, compact_panel, from_epoch
+from shortvol.validation import check, validate_panel
+
+# Columns kept from yfinance. "Capital Gains" only shows up for some funds, so it's left out to keep the panel rectangular.
+PANEL_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume", "Dividends", "Stock Splits"]
+
+
+def fetch_history(ticker, start_date, end_date):
+    """Daily history for one ticker, with the same yfinance settings as ETFs.py."""
+    import yfinance as yf  # Only needed when the cache is missing tickers.
+
+    data = yf.Ticker(ticker).history(start=start_date, end=end_date, actions=True, auto_adjust=False)
+    data = data.reindex(columns=PANEL_COLUMNS)
+    if getattr(data.index, "tz", None) is not None:
+        data.index = data.index.tz_localize(None)  # Plain dates, the exchange timezone adds nothing for daily bars.
+    data.index.name = "Date"
+    data = data.reset_index()
+    data.insert(0, "Ticker", ticker)
+    return data
+
+
+def load_panel(tickers, start_date, end_date, cache_path, columns=None, checks=None):
+    """
+    Long-format daily panel (one row per Ticker and Date) for a list of tickers.
+
+    The panel is cached in a pickle, only tickers that are not in the cache yet are downloaded,
+    so running the seasonal and ETF scripts one after the other hits yfinance once.
+    Both the cache and the result use the compact schema of shortvol/schema.py.
+    Downloaded tickers go through validate_panel before they are cached, rows with an error never reach the cache.
+
+    Parameters:
+      tickers (list): Tickers to return, in the order they should appear.
+      start_date, end_date (str): Date range, as in the config files.
+      cache_path (str): Pickle holding the cached panel.
+      columns (list): PANEL_COLUMNS to return, all of them by default. The cache always keeps every column.
+      checks (dict): Thresholds for validate_panel (max_move, stale_days), its defaults when None.
+
+    Returns:
+      DataFrame: Ticker (categorical), Date (int64 epoch) and the columns, sorted by Ticker then Date.
+    """
+    cached = None
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached.attrs.get("start_date") != start_date or cached.attrs.get("end_date") != end_date:
+            cached = None  # Different date range, the cache can't be trusted.
+        elif (cached.dtypes == PRICE_DTYPE).any():
+            cached = None  # Written with float32 prices, their lost digits can't be cast back: downloaded again.
+
+    have = set() if cached is None else set(cached["Ticker"].unique())
+    missing = [ticker for ticker in tickers if ticker not in have]
+    instrument.count("panel.cache_hits", len(tickers) - len(missing))
+    instrument.count("panel.cache_misses", len(missing))
+    if missing:
+        with instrument.timed("panel.download_seconds"):
+            fetched = [compact_panel(fetch_history(ticker, start_date, end_date)) for ticker in missing]
+        fetched = [check("ETF panel", pd.concat(fetched, ignore_index=True), validate_panel, **(checks or {}))]
+        frames = fetched if cached is None else [compact_panel(cached)] + fetched
+        cached = compact_panel(pd.concat(frames, ignore_index=True))  # concat turns differing categories back into strings.
+        cached.attrs = {"start_date": start_date, "end_date": end_date}
+        with open(cache_path, "wb") as f:
+            pickle.dump(cached, f)
+
+    cached = compact_panel(cached, columns)  # Caches written before the compact schema are converted here.
+    panel = cached[cached["Ticker"].isin(tickers)]
+    order = {ticker: i for i, ticker in enumerate(tickers)}
+    panel = panel.sort_values(["Ticker", "Date"], key=lambda col: col.map(order).astype(int) if col.name == "Ticker" else col)
+    panel = panel.reset_index(drop=True)
+    panel["Ticker"] = panel["Ticker"].cat.set_categories(tickers)  # Unused categories out, codes in config order.
+    return panel
+
+
+def ticker_frame(panel, ticker):
+    """
+    Single ticker slice of the panel, indexed by Date (datetime) like a yfinance history frame.
+
+    Built straight from the selected rows of each column, one copy and no link back to the panel.
+    """
+    rows = (panel["Ticker"] == ticker).to_numpy()
+    index = pd.Index(from_epoch(panel["Date"].to_numpy()[rows]), name="Date")
+    return pd.DataFrame({column: panel[column].to_numpy()[rows] for column in panel.columns if column not in ("Ticker", "Date")},
+                        index=index)
@@ -0,0 +1,352 @@
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from shortvol import instrument
+from shortvol.config import load_config, portfolio_path, subproject_path
+from shortvol.exits import exit_grid, exit_summary, model_values, option_values, rule_values
+from shortvol.hedging import bar_closes, daily_closes, hedge_spans, hedged_pl
+from shortvol.implied_vol import implied_vol
+from shortvol.option_store import NO_CONTRACT, OptionStore, lookup_closes, lookup_contracts
+from shortvol.options import expiration_dates, straddle_pl
+from shortvol.panel import load_panel, ticker_frame
+from shortvol.plan import build_plan, friday_requests, hedge_requests, path_requests, signal_requests, timing_requests
+from shortvol.polygon import PolygonClient, aggregates_request, shared_cache
+from shortvol.signal_index import date_slice, load_index, signal_params
+from shortvol.pricing import annualize_vol, calibrate_multipliers, model_straddle, year_fraction
+from shortvol.query import scan_csv
+from shortvol.regimes import regime_table
+from shortvol.validation import check, option_checks, panel_checks, validate_options
+
+# What "On ETFs/Polygon data.py" keeps per ETF: the P&L, and what the pricing model needs to calibrate on it.
+PORTFOLIO_COLUMNS = ['Date', 'Premium', 'Payoff', 'PL', 'Close', 'Strike', 'Expiration',
+                     'Volatility', 'Call_Price', 'Put_Price', 'Premium_Source', 'Hedge_PL', 'Hedge_Cost', 'Hedged_PL']
+# The columns of those each exits.paths mode reads: frames saved before they were kept have no exit paths.
+EXIT_COLUMNS = {
+    "model": {'Date', 'Expiration', 'Strike', 'Close', 'Volatility', 'Call_Price', 'Put_Price', 'Premium', 'Payoff', 'PL'},
+    "api": {'Date', 'Expiration', 'Strike', 'Call_Price', 'Put_Price', 'Premium', 'Payoff', 'PL'},
+}
+
+
+def polygon_client(config, cache, budget=None):
+    """Client with the API settings of a subproject config, the key coming from POLYGON_API_KEY."""
+    return PolygonClient(config["api"]["base_url"], os.getenv("POLYGON_API_KEY"), config["api"]["rate_limit_per_minute"], cache, budget)
+
+
+def etf_signals(config, ETF_filtered=None, index=None):
+    """
+    The ETF signals the straddle backtest prices: the signal index (or ETF_filtered.pkl) from ETFs.py,
+    from general.filter_start_date onwards, for the first general.max_etfs ETFs.
+
+    The signal index built with the config's parameters answers with a binary search per ETF;
+    ETF_filtered.pkl is only read when there is none (ETFs.py not run since the index exists).
+
+    Parameters:
+      ETF_filtered (dict): Already in memory (see shortvol/cli.py), instead of reading the pickle.
+      index (SignalIndex): Already in memory, instead of reading "Signal index.pkl".
+
+    Returns:
+      dict: Ticker -> DataFrame with Date as a column.
+    """
+    start = config["general"]["filter_start_date"]
+    if ETF_filtered is None and index is None:
+        index = load_index(signal_params(config))
+    if index is not None:
+        # reset_index makes the one copy the backtest adds its columns to, the query itself is views into the index.
+        return {ticker: df.reset_index()
+                for ticker, df in index.query(index.selected[:config["general"]["max_etfs"]], start=start).items()}
+
+    if ETF_filtered is None:
+        with open(subproject_path("On ETFs") + "ETF_filtered.pkl", 'rb') as f:
+            ETF_filtered = pickle.load(f)
+
+    selected = {}
+    for ticker, df in list(ETF_filtered.items())[:config["general"]["max_etfs"]]:
+        # Rows are selected first, then reset_index makes the one copy the backtest adds its columns to
+        # (Date becomes a column, easier to manipulate), instead of copying the whole history along the way.
+        selected[ticker] = date_slice(df, start, column=None).reset_index()
+    return selected
+
+
+def friday_signals(config):
+    """The Fridays of "Friday SPY data" the seasonal straddle study prices, from general.filter_start_date."""
+    # The dates are sorted: a binary search on them, only the selected rows are copied (general.query_engine runs it).
+    return (scan_csv(subproject_path("Seasonal") + "Friday SPY data", sorted_by="Date")
+            .filter("Date", ">=", config["general"]["filter_start_date"]).collect(config["general"]["query_engine"]))
+
+
+def shared_plan(cache, budget=None, ETF_filtered=None, index=None):
+    """
+    One plan for the requests of both Polygon scripts.
+
+    Whichever script runs first fetches what the other needs too, so a contract or price
+    both pipelines ask for is sent once, and the second script finds it in the cache.
+    Pipelines whose input file doesn't exist yet are left out. ETF_filtered or the signal index
+    can be passed when already in memory, see etf_signals.
+    """
+    etf_config = load_config("On ETFs")
+    seasonal_config = load_config("Seasonal")
+    endpoints = etf_config["api"]["endpoints"]
+
+    requests = []
+    if ETF_filtered is not None or index is not None or os.path.exists(subproject_path("On ETFs") + "ETF_filtered.pkl"):
+        signals = etf_signals(etf_config, ETF_filtered, index)
+        friday_etfs = etf_config["expiration_rules"]["friday_expiration_etfs"]
+        requests.append(signal_requests(signals, friday_etfs, endpoints, etf_config["general"]["api_result_limit"]))
+        hedging = etf_config["hedging"]
+        if hedging["enabled"] and hedging["bars"] != "day":  # Daily paths come from the panel, not from Polygon.
+            requests.append(hedge_requests(signals, friday_etfs, endpoints, hedging["bars"]))
+        exits = etf_config["exits"]
+        if exits["enabled"] and exits["paths"] == "api":  # Model paths are priced on the panel, no request.
+            requests.append(path_requests(signals, friday_etfs, endpoints, etf_config["general"]["api_result_limit"]))
+    if os.path.exists(subproject_path("Seasonal") + "Friday SPY data"):
+        ticker = seasonal_config["ETFs"][0]  # "Friday SPY data" holds a single underlying.
+        F_SPY = friday_signals(seasonal_config)
+        requests.append(friday_requests(F_SPY, ticker, endpoints, seasonal_config["general"]["api_result_limit"]))
+        timing = seasonal_config["entry_timing"]
+        if timing["enabled"]:  # Minute bars of the entry timing grid, after the premiums of the study itself.
+            requests.append(timing_requests(F_SPY, ticker, endpoints, timing["strike_padding"]))
+    return build_plan(pd.concat(requests, ignore_index=True), cache, endpoints, budget)
+
+
+def premium_multipliers(config, Portfolio_PL=None):
+    """
+    Realized vol understates what options cost, the gap being the premium we sell. This calibrates
+    that gap per ETF on the premiums fetched in earlier runs (Portfolio_PL.pkl unless given).
+
+    Returns:
+      tuple: (dict Ticker -> multiplier, fallback multiplier for ETFs never fetched).
+    """
+    multipliers = {}
+    path = subproject_path("On ETFs") + "Portfolio_PL.pkl"
+    if Portfolio_PL is None and config["pricing"]["premium_source"] != "api" and os.path.exists(path):
+        with open(path, 'rb') as f:
+            Portfolio_PL = pickle.load(f)
+    if Portfolio_PL is not None:
+        multipliers = calibrate_multipliers(Portfolio_PL, config["pricing"]["risk_free_rate"])
+    default = float(np.median(list(multipliers.values()))) if multipliers else config["pricing"]["vol_multiplier"]
+    return multipliers, default
+
+
+def price_straddles(ticker, data, config, client=None, multiplier=None, store=None):
+    """
+    Straddle prices and P&L for the signals of one ETF, the loop body of "On ETFs/Polygon data.py".
+
+    With pricing.premium_source "api" the premiums are read through the client (from the cache once
+    the plan has run) and rows Polygon can't price are dropped; "fill" prices those rows with
+    Black-Scholes instead, and "model" prices every row without the API.
+
+    Parameters:
+      ticker (str): The ETF.
+      data (DataFrame): Its signals from etf_signals, modified in place.
+      client (PolygonClient): Not needed in model mode.
+      multiplier (float): Vol multiplier of the ETF, see premium_multipliers.
+      store (OptionStore): Contracts and closes already read, the rest is read through the client and added to it
+        (shortvol/option_store.py). A new one when None, the caller saves it.
+
+    Returns:
+      DataFrame: The signals that could be scored, with Expiration, Strike, leg prices, Premium, Payoff and PL.
+    """
+    premium_source = config["pricing"]["premium_source"]
+    risk_free_rate = config["pricing"]["risk_free_rate"]
+    endpoints = config["api"]["endpoints"]
+
+    # Expirations follow the rule in shortvol/options.py, the same one the plan used.
+    data['Expiration'] = expiration_dates(data['Date'], ticker in config['expiration_rules']['friday_expiration_etfs'])
+    # We round the Close price to the nearest integer because option strikes are typically
+    # set at whole numbers. This ensures we're working with realistic, tradable strikes.
+    data['Strike'] = data['Close'].round()
+
+    if premium_source == "model":
+        # Fast estimate: no API calls, every signal's straddle is priced at once with Black-Scholes,
+        # on realized vol scaled by the multiplier calibrated from the premiums we already fetched.
+        call, put = model_straddle(data['Close'], data['Strike'], year_fraction(data['Date'], data['Expiration']),
+                                   annualize_vol(data['Volatility']), multiplier, risk_free_rate)
+        data['Call_Price'] = call
+        data['Put_Price'] = put
+        data['Premium_Source'] = "model"
+    else:
+        expirations = data['Expiration'].dt.strftime('%Y-%m-%d')
+        dates = data['Date'].dt.strftime('%Y-%m-%d')
+        api_limit = config["general"]["api_result_limit"]
+
+        # Contract ids for both legs (nullable, <NA> without a contract), from the option store or the cache filled by the plan.
+        store = OptionStore() if store is None else store
+        for leg, contract_type in (('Call_Contract', "call"), ('Put_Contract', "put")):
+            ids = lookup_contracts(store, client, endpoints["options_contracts"], ticker, contract_type, expirations,
+                                   data['Strike'], api_limit)
+            data[leg] = pd.array(np.where(ids == NO_CONTRACT, None, ids), dtype="Int32")
+
+        # Drop rows with missing values.
+        # We use inplace=True to modify the DataFrame directly instead of creating a new one.
+        # When filling gaps with the model, rows without a contract are kept and priced below instead.
+        if premium_source != "fill":
+            rows = len(data)
+            data.dropna(inplace=True)
+            instrument.dropped("missing contracts dropna", rows, len(data))
+            dates = dates.loc[data.index]
+
+        # Close price and Volume of each leg on the signal date, one search in the store for every row at once.
+        # Rows kept without a contract (fill mode) have nothing to look up.
+        for leg, price, volume in (('Call_Contract', 'Call_Price', 'Call_Volume'), ('Put_Contract', 'Put_Price', 'Put_Volume')):
+            data[price], data[volume] = lookup_closes(store, client, endpoints["daily_oc"],
+                                                      data[leg].to_numpy(dtype=np.int32, na_value=NO_CONTRACT), dates)
+        data['Premium_Source'] = "api"
+
+    if premium_source == "fill":
+        # Instead of dropping the rows Polygon had nothing for, we price them with Black-Scholes.
+        # Volumes stay empty for those rows, so they are easy to tell apart (and Premium_Source says "model").
+        missing = (data['Call_Price'].isna() | data['Put_Price'].isna()).to_numpy()
+        if missing.any():
+            est = data[missing]
+            call, put = model_straddle(est['Close'], est['Strike'], year_fraction(est['Date'], est['Expiration']),
+                                       annualize_vol(est['Volatility']), multiplier, risk_free_rate)
+            data.loc[missing, 'Call_Price'] = call
+            data.loc[missing, 'Put_Price'] = put
+            data.loc[missing, 'Premium_Source'] = "model"
+            print(f"{ticker}: {missing.sum()} of {len(data)} premiums filled by the model.")
+
+    # Signals too recent to have a Future_Close, or still without a premium, can't be scored.
+    rows = len(data)
+    data.dropna(subset=['Future_Close', 'Call_Price', 'Put_Price'], inplace=True)
+    instrument.dropped("unscored signals dropna", rows, len(data))
+
+    # Zero-volume or stale closes, strikes far from the Close (or a split apart) are quarantined before any P&L (shortvol/validation.py).
+    rows = len(data)
+    data = check("Option prices", data, validate_options, **option_checks(config)).copy()
+    instrument.dropped("option prices quarantined", rows, len(data))
+
+    # Premium received, payoff at expiry and the P&L of each position (shortvol/options.py).
+    return straddle_pl(data)
+
+
+def hedge_panel(config):
+    """Close of every ETF from the cached yfinance panel of ETFs.py, the paths of hedging.bars "day"."""
+    general = config["general"]
+    return load_panel(config["tickers"], general["start_date"], general["end_date"],
+                      subproject_path("On ETFs") + "ETF panel.pkl", columns=["Close"], checks=panel_checks(config))
+
+
+def underlying_closes(ticker, data, config, client=None, panel=None):
+    """
+    Closes of an ETF covering its straddles, for the delta hedge.
+
+    With hedging.bars "day" they come from the panel (see hedge_panel), otherwise from the Polygon
+    aggregates the plan fetched, read through the client. Pass the signals before price_straddles
+    drops any, so the ranges asked for are the ones the plan sent (see shortvol.hedging.hedge_spans).
+    """
+    timespan = config["hedging"]["bars"]
+    if timespan == "day":
+        return daily_closes(ticker_frame(panel, ticker)["Close"])
+    dates = pd.DatetimeIndex(data["Date"])
+    expirations = expiration_dates(dates, ticker in config['expiration_rules']['friday_expiration_etfs'])
+    closes = [bar_closes(client.get(*aggregates_request(config["api"]["endpoints"]["aggregates"], ticker, 1, timespan, start, end)),
+                         1, timespan)
+              for start, end in hedge_spans(dates, expirations, timespan)]
+    closes = pd.concat([c for c in closes if not c.empty] or [pd.Series(dtype=np.float64)])
+    return closes[~closes.index.duplicated()].sort_index()
+
+
+def entry_vol(data, r, multiplier):
+    """
+    Vol of each straddle at the sale: the implied vol of its premium (call and put averaged),
+    or the model's vol (realized vol times the multiplier) where the premium has none.
+    """
+    T = year_fraction(data['Date'], data['Expiration'])
+    legs = [implied_vol(data[column], data['Close'], data['Strike'], T, r, is_call=is_call)
+            for column, is_call in (('Call_Price', True), ('Put_Price', False))]
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # All-NaN rows, filled by the model below.
+        sigma = np.nanmean(np.vstack(legs), axis=0)
+    return np.where(np.isfinite(sigma), sigma, annualize_vol(data['Volatility']) * multiplier)
+
+
+def hedge_straddles(data, closes, config, multiplier):
+    """
+    Delta-hedged P&L of the straddles priced by price_straddles (see shortvol/hedging.py).
+
+    Deltas use the straddle's vol at entry, see entry_vol.
+
+    Returns:
+      DataFrame: `data` with Hedge_PL, Hedge_Cost and Hedged_PL added.
+    """
+    hedging = config["hedging"]
+    r = config["pricing"]["risk_free_rate"]
+    sigma = entry_vol(data, r, multiplier)
+    hedge = hedged_pl(data, closes, sigma, hedging["every"], r, hedging["cost_per_share"])
+    data[['Hedge_PL', 'Hedge_Cost', 'Hedged_PL']] = hedge[['Hedge_PL', 'Hedge_Cost', 'Hedged_PL']]
+    return data
+
+
+def exit_rules(Portfolio_PL, config, client=None, panel=None, multipliers=None):
+    """
+    Every rule of the exits section (profit targets, stop-losses, time stops) scored on every straddle of the book
+    at once (shortvol/exits.py).
+
+    With exits.paths "model" each straddle is repriced with Black-Scholes on its ETF's daily closes (the panel, see
+    hedge_panel) at its vol at the sale; with "api" the options' own daily closes are read through the client,
+    from the cache the plan's path requests filled.
+
+    Parameters:
+      Portfolio_PL (dict): Ticker -> priced straddles, as "On ETFs/Polygon data.py" saves them.
+      multipliers (tuple): premium_multipliers for the model's vol where a premium has no implied vol.
+
+    Returns:
+      DataFrame: exit_summary of the whole book, one row per rule.
+    """
+    exits = config["exits"]
+    r = config["pricing"]["risk_free_rate"]
+    by_ticker, default = multipliers or premium_multipliers(config, Portfolio_PL)
+    needed = EXIT_COLUMNS[exits["paths"]]
+    premiums, paths, skipped, missing = [], [], [], set()
+    for ticker, data in Portfolio_PL.items():
+        if not needed.issubset(data.columns):
+            skipped.append(ticker)
+            missing |= needed.difference(data.columns)  # Saved before the contract and pricing columns were kept, like calibrate_multipliers skips.
+            continue
+        data = data.dropna(subset=["PL"])
+        if data.empty:
+            continue
+        if exits["paths"] == "model":
+            closes = daily_closes(ticker_frame(panel, ticker)["Close"])
+            values = model_values(data, closes, entry_vol(data, r, by_ticker.get(ticker, default)), r)
+        else:
+            values = option_values(client, ticker, data, config["api"]["endpoints"], config["general"]["api_result_limit"])
+        premiums.append(data["Premium"].to_numpy(dtype=np.float64))
+        paths.append(values)
+
+    if skipped:
+        message = (f"the straddles of {', '.join(skipped)} have no {', '.join(sorted(missing))} column, "
+                   f"run \"On ETFs/Polygon data.py\" (or shortvol pnl) again to regenerate Portfolio_PL.")
+        if not paths:
+            raise ValueError(f"No exit paths: {message}")
+        print(f"Exit rules skip {message}")
+
+    # Paths of every ETF side by side in one matrix, NaN-padded to the longest.
+    width = max((values.shape[1] for values in paths), default=1)
+    values = np.vstack([np.pad(v, ((0, 0), (0, width - v.shape[1])), constant_values=np.nan) for v in paths] or [np.empty((0, width))])
+    rules = [rule_values(exits[kind]) for kind in ("targets", "stops", "time_stops")]
+    exit_pl, step = exit_grid(np.concatenate(premiums or [np.empty(0)]), values, *rules)
+    instrument.count("exits.trades", len(values))
+    instrument.count("exits.rules", exit_pl[0].size if len(exit_pl) else 0)
+    return exit_summary(exit_pl, step, *rules)
+
+
+def regime_results(Portfolio_PL, config, features, names=None):
+    """
+    P&L of every straddle of the book, the ETFs pooled, split by the regime of its signal date (shortvol/regimes.py).
+
+    Parameters:
+      features (dict): Regime features, see regimes.update_features.
+      names (list): Features to split by, regimes.features of the config by default.
+
+    Returns:
+      DataFrame: regime_table of the book, one row per feature and bucket.
+    """
+    trades = pd.concat([data[["Date", "PL"]] for data in Portfolio_PL.values()] or [pd.DataFrame(columns=["Date", "PL"])],
+                       ignore_index=True)
+    regimes = config["regimes"]
+    return regime_table(trades, features, names or regimes["features"], regimes["buckets"], until=regimes["buckets_until"])
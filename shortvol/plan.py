@@ -0,0 +1,299 @@
+import math
+
+import pandas as pd
+
+from shortvol.entry_timing import friday_strikes
+from shortvol.hedging import hedge_spans
+from shortvol.options import expiration_dates
+from shortvol.polygon import (aggregates_request, chain_contracts, chain_request, contract_request, daily_oc_request,
+                              occ_strike, occ_symbol, request_key)
+
+PLAN_COLUMNS = ["Source", "Ticker", "Date", "Type", "Stage", "Endpoint", "Params", "Key", "Contract", "Contract_Key"]
+
+
+def straddle_requests(source, ticker, dates, expirations, strikes, endpoints, api_limit):
+    """
+    Every Polygon request needed to price a list of straddles on one underlying, in the order they are needed.
+
+    Per straddle: the call contract lookup, the call's daily close, then the same for the put.
+    Price requests use the predicted OCC symbol (see shortvol.polygon.occ_symbol) and point
+    to the contract lookup they depend on through Contract_Key.
+
+    Parameters:
+      source (str): Which pipeline needs them ("On ETFs", "Seasonal"), kept for reporting.
+      ticker (str): Underlying.
+      dates, expirations (list): Signal dates and expiration dates as "YYYY-MM-DD" strings.
+      strikes (list): Strikes.
+      endpoints (dict): config["api"]["endpoints"].
+      api_limit (int): general.api_result_limit, part of the request so it must match across pipelines.
+
+    Returns:
+      list: One tuple per request, in PLAN_COLUMNS order.
+    """
+    rows = []
+    for date, expiration, strike in zip(dates, expirations, strikes):
+        for contract_type in ("call", "put"):
+            endpoint, params = contract_request(endpoints["options_contracts"], ticker, contract_type, expiration, strike, api_limit)
+            contract_key = request_key(endpoint, params)
+            rows.append((source, ticker, date, contract_type, "contract", endpoint, params, contract_key, None, None))
+
+            symbol = occ_symbol(ticker, expiration, contract_type, strike)
+            endpoint, params = daily_oc_request(endpoints["daily_oc"], symbol, date)
+            rows.append((source, ticker, date, contract_type, "price", endpoint, params, request_key(endpoint, params), symbol, contract_key))
+    return rows
+
+
+def signal_requests(signals, friday_etfs, endpoints, api_limit):
+    """
+    Requests of the ETF straddle backtest ("On ETFs/Polygon data.py").
+
+    Parameters:
+      signals (dict): Ticker -> DataFrame with Date and Close, like ETF_filtered_2023.
+      friday_etfs (list): expiration_rules.friday_expiration_etfs.
+
+    Returns:
+      DataFrame: One row per request with PLAN_COLUMNS, duplicates included.
+    """
+    rows = []
+    for ticker, data in signals.items():
+        dates = pd.DatetimeIndex(data["Date"])
+        expirations = expiration_dates(dates, ticker in friday_etfs).strftime("%Y-%m-%d")
+        rows += straddle_requests("On ETFs", ticker, dates.strftime("%Y-%m-%d"), expirations, data["Close"].round(), endpoints, api_limit)
+    return pd.DataFrame(rows, columns=PLAN_COLUMNS)
+
+
+def friday_requests(F_SPY, ticker, endpoints, api_limit):
+    """Requests of the Friday straddle study ("Seasonal/Polygon data.py"), expiring on the next session."""
+    rows = straddle_requests("Seasonal", ticker, F_SPY["Date"], F_SPY["Next_Date"], F_SPY["Strike_Close"], endpoints, api_limit)
+    return pd.DataFrame(rows, columns=PLAN_COLUMNS)
+
+
+def hedge_requests(signals, friday_etfs, endpoints, timespan):
+    """
+    Bars of the underlyings the delta hedge replays (hedging.bars "minute" or "hour"), after the premiums.
+
+    One aggregates request per span of overlapping trades (see shortvol.hedging.hedge_spans).
+    """
+    rows = []
+    for ticker, data in signals.items():
+        dates = pd.DatetimeIndex(data["Date"])
+        for start, end in hedge_spans(dates, expiration_dates(dates, ticker in friday_etfs), timespan):
+            endpoint, params = aggregates_request(endpoints["aggregates"], ticker, 1, timespan, start, end)
+            rows.append(("On ETFs", ticker, start, "underlying", "bars", endpoint, params, request_key(endpoint, params), None, None))
+    return pd.DataFrame(rows, columns=PLAN_COLUMNS)
+
+
+def path_requests(signals, friday_etfs, endpoints, api_limit):
+    """
+    Daily closes of both legs of every ETF straddle from the sale to expiry, the paths of the early exit rules
+    (exits.paths "api", see shortvol/exits.py). One aggregates request per leg, pointing to its contract lookup.
+    """
+    rows = []
+    for ticker, data in signals.items():
+        dates = pd.DatetimeIndex(data["Date"])
+        expirations = expiration_dates(dates, ticker in friday_etfs).strftime("%Y-%m-%d")
+        for date, expiration, strike in zip(dates.strftime("%Y-%m-%d"), expirations, data["Close"].round()):
+            for contract_type in ("call", "put"):
+                endpoint, params = contract_request(endpoints["options_contracts"], ticker, contract_type, expiration, strike, api_limit)
+                contract_key = request_key(endpoint, params)
+                symbol = occ_symbol(ticker, expiration, contract_type, strike)
+                endpoint, params = aggregates_request(endpoints["aggregates"], symbol, 1, "day", date, expiration)
+                rows.append(("On ETFs", ticker, date, contract_type, "path", endpoint, params, request_key(endpoint, params), symbol, contract_key))
+    return pd.DataFrame(rows, columns=PLAN_COLUMNS)
+
+
+def timing_requests(F_SPY, ticker, endpoints, padding):
+    """
+    Minute bars of the Friday straddle study's entry timing grid (shortvol/entry_timing.py).
+
+    Per Friday: the underlying's bars from the Friday to the expiry session, one chain lookup per leg type
+    covering the strikes of the Friday's range, then the bars of every contract over the same two sessions.
+    Bars requests carry the predicted symbol and point to their chain lookup through Contract_Key.
+    """
+    F_SPY = F_SPY[F_SPY["Next_Date"].notna()]  # The last Friday of the file has no expiry session yet.
+    lows, counts = friday_strikes(F_SPY, padding)
+    rows = []
+    for date, expiration, low, count in zip(F_SPY["Date"], F_SPY["Next_Date"], lows, counts):
+        endpoint, params = aggregates_request(endpoints["aggregates"], ticker, 1, "minute", date, expiration)
+        rows.append(("Seasonal", ticker, date, "underlying", "bars", endpoint, params, request_key(endpoint, params), None, None))
+        for contract_type in ("call", "put"):
+            endpoint, params = chain_request(endpoints["options_contracts"], ticker, contract_type, expiration, low, low + count - 1)
+            chain_key = request_key(endpoint, params)
+            rows.append(("Seasonal", ticker, date, contract_type, "chain", endpoint, params, chain_key, None, None))
+            for strike in range(low, low + count):
+                symbol = occ_symbol(ticker, expiration, contract_type, strike)
+                endpoint, params = aggregates_request(endpoints["aggregates"], symbol, 1, "minute", date, expiration)
+                rows.append(("Seasonal", ticker, date, contract_type, "option bars", endpoint, params,
+                             request_key(endpoint, params), symbol, chain_key))
+    return pd.DataFrame(rows, columns=PLAN_COLUMNS)
+
+
+def linked_contract(cache, stage, contract_key, predicted):
+    """
+    Contract a price or bars request is for, from its cached lookup: the lookup's first contract,
+    or the chain's contract at the predicted symbol's strike. None when the lookup found nothing.
+    """
+    if stage == "option bars":
+        return chain_contracts(cache.get(contract_key)).get(occ_strike(predicted))
+    return returned_contract(cache, contract_key)
+
+
+def resolve_contracts(requests, cache):
+    """
+    Swap predicted symbols for the contracts Polygon returned, where the lookup is already cached.
+
+    Price, option bars and path requests whose lookup came back empty are dropped, there is nothing to price.
+    """
+    prices = requests["Stage"].isin(["price", "option bars", "path"])
+    lookups = {key for key in requests.loc[prices, "Contract_Key"].unique() if key in cache}
+
+    empty = []
+    requests = requests.copy()
+    for i, row in requests[prices].iterrows():
+        if row["Contract_Key"] not in lookups:
+            continue
+        actual = linked_contract(cache, row["Stage"], row["Contract_Key"], row["Contract"])
+        if actual is None:
+            empty.append(i)
+            continue
+        if actual != row["Contract"]:
+            endpoint = row["Endpoint"].replace(row["Contract"], actual)
+            requests.at[i, "Endpoint"] = endpoint
+            requests.at[i, "Key"] = request_key(endpoint, row["Params"])
+            requests.at[i, "Contract"] = actual
+    return requests.drop(index=empty)
+
+
+def batch_prices(plan, endpoints):
+    """
+    Replace uncached price requests of the same contract on several dates by one aggregates request.
+
+    A daily aggregates range over the contract's dates answers every daily close at once;
+    execute_plan fans the bars back out into the cache under each daily close request,
+    so the code reading prices doesn't know the difference. The batch is the same aggregates_request the
+    hedge and path requests make, so a path request over the same range is folded into it.
+    """
+    pending = (plan["Stage"] == "price") & ~plan["Cached"]
+    counts = plan.loc[pending, "Contract"].value_counts()
+    shared = pending & plan["Contract"].isin(counts.index[counts > 1])
+    if not shared.any():
+        return plan
+
+    batches = []
+    for contract, group in plan[shared].groupby("Contract", sort=False):
+        dates = sorted(group["Date"])
+        endpoint, params = aggregates_request(endpoints["aggregates"], contract, 1, "day", dates[0], dates[-1])
+        first = group.iloc[0]
+        batches.append({
+            **first.to_dict(),
+            "Date": dates, "Stage": "batch", "Endpoint": endpoint, "Params": params,
+            "Key": request_key(endpoint, params), "Consumers": group["Consumers"].sum(),
+            "Order": first["Order"],
+        })
+    batches = pd.DataFrame(batches)
+    same = ~shared & plan["Key"].isin(batches["Key"])  # Sent once, as the batch: it is the one fanned out.
+    batches["Consumers"] += batches["Key"].map(plan[same].groupby("Key")["Consumers"].sum()).fillna(0).astype(int)
+    plan = pd.concat([plan[~shared & ~same], batches], ignore_index=True)
+    return plan.sort_values("Order", kind="stable", ignore_index=True)
+
+
+def build_plan(requests, cache, endpoints, budget=None):
+    """
+    Deduplicate the requests of every pipeline, mark what the local cache already answers,
+    and batch the daily closes of contracts needed on several dates.
+
+    Parameters:
+      requests (DataFrame): Concatenated output of signal_requests / friday_requests.
+      cache (ResponseCache): The cache shared by both subprojects.
+      endpoints (dict): config["api"]["endpoints"].
+      budget (int): Requests per run, to split the plan in chunks.
+
+    Returns:
+      DataFrame: One row per request to make in priority order, with Consumers (how many
+      requests it answers), Cached, and for the ones still to send Priority and Chunk
+      (which budgeted run will send it, 0 being the next one). Batch rows hold their list
+      of dates in Date.
+    """
+    requests = resolve_contracts(requests, cache)
+    cached_keys = cache.keys()
+    consumers = requests.groupby("Key", sort=False).size()
+    plan = requests.drop_duplicates("Key").reset_index(drop=True)
+    plan["Consumers"] = plan["Key"].map(consumers).to_numpy()
+    plan["Cached"] = plan["Key"].isin(cached_keys)
+    plan["Order"] = range(len(plan))
+    plan = batch_prices(plan, endpoints).drop(columns="Order")
+
+    to_send = ~plan["Cached"]
+    plan["Priority"] = pd.Series(range(to_send.sum()), index=plan.index[to_send])
+    plan["Chunk"] = plan["Priority"] // budget if budget else 0
+    plan.loc[~to_send, "Chunk"] = None
+    return plan
+
+
+def plan_summary(plan, rate_limit, budget=None):
+    """Request counts and the wall time they cost under the rate limit."""
+    total = int(plan["Consumers"].sum())
+    cached = int(plan.loc[plan["Cached"], "Consumers"].sum())
+    to_send = int((~plan["Cached"]).sum())
+    return {
+        "Requests needed": total,
+        "Answered by the cache": cached,
+        "Batched daily closes": int(plan.loc[plan["Stage"] == "batch", "Consumers"].sum()),
+        "To send": to_send,
+        "Calls saved": total - to_send,
+        "Wall time (hours)": to_send / rate_limit / 60,
+        "Wall time without plan (hours)": total / rate_limit / 60,
+        "Chunks": math.ceil(to_send / budget) if budget else 1,
+    }
+
+
+def returned_contract(cache, contract_key):
+    """Ticker the cached contract lookup returned, None if it found nothing or isn't cached."""
+    if contract_key not in cache:
+        return None
+    results = (cache.get(contract_key) or {}).get("results", [])
+    return results[0]["ticker"] if results else None
+
+
+def execute_plan(client, plan, endpoints):
+    """
+    Send the uncached requests of a plan in priority order until the client's budget runs out.
+
+    Price, option bars and path requests are sent for the contract Polygon actually returned, which can differ from
+    the predicted symbol, and skipped when the contract lookup found nothing (or isn't done yet).
+    Each batch's daily bars are written back to the cache as the daily closes they replace, once Polygon answered it
+    (a 404 included, no bars being no trades); a batch that failed leaves them uncached for the next run.
+    """
+    todo = plan[~plan["Cached"]]
+    for row in todo.itertuples(index=False):
+        if client.budget is not None and client.sent >= client.budget:
+            break
+        if row.Stage in ("contract", "chain", "bars"):
+            client.get(row.Endpoint, row.Params)
+            continue
+
+        if row.Contract_Key not in client.cache:
+            continue
+        contract = linked_contract(client.cache, row.Stage, row.Contract_Key, row.Contract)
+        if contract is None:
+            continue
+        if row.Stage == "price":
+            client.get(*daily_oc_request(endpoints["daily_oc"], contract, row.Date))
+            continue
+        if row.Stage in ("option bars", "path"):
+            client.get(row.Endpoint.replace(row.Contract, contract), row.Params)
+            continue
+
+        endpoint = row.Endpoint.replace(row.Contract, contract)
+        body = client.get(endpoint, row.Params)
+        if body is None and request_key(endpoint, row.Params) not in client.cache:
+            continue  # An error or the budget, not an answer: the daily closes stay missing and are asked again next run.
+        bars = (body or {}).get("results", [])
+        days = pd.to_datetime([bar["t"] for bar in bars], unit="ms", utc=True).tz_convert("America/New_York").strftime("%Y-%m-%d")
+        by_day = dict(zip(days, bars))
+        for date in row.Date:
+            key = request_key(*daily_oc_request(endpoints["daily_oc"], contract, date))
+            bar = by_day.get(date)
+            # Same fields as the daily open/close answer, a missing bar means no trades, like its 404.
+            client.cache.put(key, {"symbol": contract, "from": date, "open": bar["o"], "high": bar["h"], "low": bar["l"],
+                                   "close": bar["c"], "volume": bar["v"]} if bar else None)
@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from collections import deque
+
+from shortvol import instrument
+from shortvol.config import root_path
+
+
+def number(value):
+    """Strikes as Polygon prints them: 410 rather than 410.0, so equal requests get equal cache keys."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def request_key(endpoint, params=None):
+    """Canonical text of a request, the same whatever order the params were written in."""
+    return endpoint + "?" + json.dumps(params or {}, sort_keys=True, default=str)
+
+
+def contract_request(endpoint, underlying, contract_type, expiration_date, strike, limit):
+    """Endpoint and params of the option contract lookup used by both Polygon scripts."""
+    params = {
+        "underlying_ticker": underlying,
+        "contract_type": contract_type,
+        "expiration_date": expiration_date,
+        "strike_price": number(strike),
+        "expired": "true",  # Include expired contracts.
+        "limit": limit,
+        "sort": "expiration_date",
+    }
+    return endpoint, params
+
+
+def chain_request(endpoint, underlying, contract_type, expiration_date, low, high):
+    """
+    Endpoint and params of one lookup returning every contract of a type and expiration from strike `low` to `high`.
+
+    One request instead of one contract_request per strike, for the entry timing grid (shortvol/entry_timing.py).
+    """
+    params = {
+        "underlying_ticker": underlying,
+        "contract_type": contract_type,
+        "expiration_date": expiration_date,
+        "strike_price.gte": number(low),
+        "strike_price.lte": number(high),
+        "expired": "true",
+        "limit": 1000,  # Polygon's most, a day's strikes are far fewer.
+        "sort": "strike_price",
+    }
+    return endpoint, params
+
+
+def chain_contracts(body):
+    """Strike -> ticker of a chain lookup's answer, the first contract listed for each strike."""
+    contracts = {}
+    for result in (body or {}).get("results", []):
+        contracts.setdefault(number(result["strike_price"]), result["ticker"])
+    return contracts
+
+
+def daily_oc_request(endpoint, option_ticker, date):
+    """Endpoint and params of the daily open/close of one option on one date."""
+    return f"{endpoint}{option_ticker}/{date}", {"adjusted": True}
+
+
+def aggregates_request(endpoint, ticker, multiplier, timespan, start, end):
+    """Endpoint and params of the bars of a ticker between two "YYYY-MM-DD" dates, e.g. 1 minute or 1 hour bars."""
+    return f"{endpoint}{ticker}/range/{multiplier}/{timespan}/{start}/{end}", {"adjusted": "true", "sort": "asc", "limit": 50000}
+
+
+def occ_strike(symbol):
+    """Strike of an OCC symbol, the last eight digits in thousandths of a dollar."""
+    return number(int(symbol[-8:]) / 1000)
+
+
+def occ_symbol(underlying, expiration_date, contract_type, strike):
+    """
+    Polygon's ticker for a standard contract, e.g. O:SPY230217C00410000.
+
+    Used to predict the price requests before the contract lookups have run. Adjusted contracts
+    (after splits or special dividends) get other symbols, so this is an estimate for planning.
+    """
+    expiry = expiration_date.replace("-", "")[2:]
+    return f"O:{underlying}{expiry}{contract_type[0].upper()}{round(float(strike) * 1000):08d}"
+
+
+class ResponseCache:
+    """
+    Polygon responses on disk, keyed by request_key().
+
+    A small sqlite file: lookups are indexed and every response is committed as it arrives,
+    so an interrupted run keeps everything it already paid for.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body TEXT)")
+
+    def __contains__(self, key):
+        return self.connection.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+
+    def keys(self):
+        return {row[0] for row in self.connection.execute("SELECT key FROM responses")}
+
+    def get(self, key):
+        row = self.connection.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, key, body):
+        self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?)", (key, json.dumps(body)))
+        self.connection.commit()
+
+
+def shared_cache():
+    """The Polygon response cache both subprojects read and write, at the root of the data path."""
+    return ResponseCache(os.path.join(root_path(), "Polygon cache.sqlite"))
+
+
+class RateLimiter:
+    """
+    At most `per_minute` calls in any window of `period` seconds (60 by default).
+
+    Unlike sleeping 60 seconds after every batch, it only waits for the oldest call
+    of the window to expire, so time spent parsing responses counts towards the wait.
+    Threads sharing a limiter (the symbols of a venue, see shortvol/candles.py) take turns.
+    """
+
+    def __init__(self, per_minute, period=60.0, sleep=time.sleep):
+        self.per_minute = per_minute
+        self.period = period
+        self.sleep = sleep
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            if len(self.calls) == self.per_minute:
+                pause = self.calls[0] + self.period - now
+                if pause > 0:
+                    self.sleep(pause)
+                    instrument.add_time("rate_limiter.wait_seconds", pause)
+                self.calls.popleft()
+            self.calls.append(time.monotonic())
+
+
+class PolygonClient:
+    """
+    Every Polygon request goes through here: the cache first, then the rate limited API.
+
+    Parameters:
+      base_url (str): config["api"]["base_url"].
+      api_key (str): POLYGON_API_KEY.
+      rate_limit (int): Requests per minute.
+      cache (ResponseCache): Where responses are kept between runs.
+      budget (int): Requests that may be sent in this run, None for no limit. Once spent,
+        uncached requests return None as if Polygon had no data, and are counted in `skipped`.
+      session: Anything with the get() of a requests.Session, one is opened on the first request when None.
+      timeout (float): Seconds to wait for Polygon before the request counts as failed.
+    """
+
+    def __init__(self, base_url, api_key, rate_limit, cache, budget=None, session=None, timeout=30):
+        self.base_url = base_url
+        self.headers = {"Authorization": f"{api_key}"}
+        self.limiter = RateLimiter(rate_limit)
+        self.cache = cache
+        self.budget = budget
+        self.session = session
+        self.timeout = timeout
+        self.sent = 0
+        self.skipped = 0
+
+    def cached(self, endpoint, params=None):
+        return request_key(endpoint, params) in self.cache
+
+    def get(self, endpoint, params=None):
+        """JSON body of a request, None when Polygon has no data (or the request was not sent)."""
+        key = request_key(endpoint, params)
+        if key in self.cache:
+            instrument.count("cache.hits")
+            return self.cache.get(key)
+        instrument.count("cache.misses")
+        if self.budget is not None and self.sent >= self.budget:
+            self.skipped += 1
+            instrument.count("http.skipped")
+            return None
+
+        import requests  # Deferred to the first request, cache-only runs never need it.
+        if self.session is None:
+            self.session = requests.Session()
+        self.limiter.wait()
+        self.sent += 1
+        instrument.count("http.requests")
+        instrument.count("http.requests." + instrument.endpoint_group(endpoint))
+        try:
+            with instrument.timed("http.seconds"):
+                response = self.session.get(self.base_url + endpoint, headers=self.headers, params=params,
+                                            timeout=self.timeout)
+        except requests.RequestException as error:
+            instrument.count("http.errors")
+            print(f"Error in request {endpoint}: {error}")
+            return None  # Not cached, like the errors below: a dropped connection or a timeout is asked again next run.
+        if response.status_code != 200:
+            instrument.count(f"http.status.{response.status_code}")
+        if response.status_code == 200:
+            body = response.json()
+        elif response.status_code == 404:
+            body = None  # "Not found" is an answer too, no need to ask again.
+        else:
+            print(f"Error in request {endpoint}: {response.status_code} - {response.text}")  # Log API errors.
+            return None  # Not cached, rate limits and server errors are worth retrying next run.
+        self.cache.put(key, body)
+        return body
+
+
+def find_contract(client, endpoint, underlying, contract_type, expiration_date, strike, limit):
+    """Ticker of the first contract matching the straddle leg, None if there is none."""
+    endpoint, params = contract_request(endpoint, underlying, contract_type, expiration_date, strike, limit)
+    response = client.get(endpoint, params)
+    results = (response or {}).get("results", [])
+    if results:
+        return results[0]['ticker']  # Get the first matching option ticker.
+    print(f"No results for {contract_type.capitalize()}: {params}")  # Log if no results are found.
+    return None
+
+
+def daily_close(client, endpoint, option_ticker, date):
+    """Close price and Volume of an option on a date, (None, None) when there is no data."""
+    endpoint, params = daily_oc_request(endpoint, option_ticker, date)
+    response = client.get(endpoint, params)
+    if response:
+        return response.get("close"), response.get("volume")
+    print(f"No results for {option_ticker}: {date}")  # Log if no results are found.
+    return None, None
@@ -0,0 +1,281 @@
+import numpy as np
+import pandas as pd
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+from shortvol.metrics import compute_performance
+
+### Combining the ETFs into one book
+# Every ETF's straddle P&L goes on a common grid of business days (one column per ticker, booked on the day the
+# straddle expires, when the P&L is realized), so the whole universe is a single matrix. Covariances are taken over
+# a trailing window at every rebalance date in one batched product (once, for every method), weights are built from them for all rebalance
+# dates at once. A straddle is sized when it is sold: it takes the last set of weights estimated on or before its sale
+# Date, from P&L realized by then, and that weighted P&L is booked on its Expiration like the rest of the matrix.
+# Weights sum to 1 and are scaled by the number of tickers, so equal weight is one straddle per signal, the book
+# the per-ETF backtests run.
+
+METHODS = ("equal", "inverse_vol", "risk_parity", "cluster_cap")
+
+
+def book_trades(Portfolio_PL, on="Expiration"):
+    """
+    Every trade with a P&L of the book as flat arrays, placed on the grid of pl_matrix.
+
+    Parameters:
+      Portfolio_PL (dict): ETF -> trades with PL and the `on` date column (Portfolio_PL.pkl).
+      on (str): Date the P&L is booked on, Expiration (realized) by default, Date for the day the straddle is sold.
+        Books saved before Expiration was kept are booked on Date.
+
+    Returns:
+      dict: ETFs (the ones with trades), Grid (business days), Row (grid row each trade is booked on),
+      Column (its ETF), Sold (its sale Date, on the grid's clock) and PL. None when no trade has a P&L.
+    """
+    etfs, booked, sold, PL = [], [], [], []
+    for etf, data in Portfolio_PL.items():
+        values = data["PL"].to_numpy(dtype=np.float64)
+        keep = ~np.isnan(values)
+        if not keep.any():
+            continue
+        etfs.append(etf)
+        booked.append(pd.to_datetime(data[on if on in data else "Date"]).to_numpy()[keep])
+        sold.append(pd.to_datetime(data["Date"]).to_numpy()[keep])
+        PL.append(values[keep])
+    if not etfs:
+        return None
+    dates = pd.DatetimeIndex(np.concatenate(booked))
+    grid = pd.bdate_range(dates.min(), dates.max())
+    grid = grid.union(dates.unique()).rename("Date")  # Keeps any trade that lands on a weekend or holiday.
+    return {"ETFs": etfs, "Grid": grid, "Row": grid.get_indexer(dates),
+            "Column": np.repeat(np.arange(len(etfs)), [len(values) for values in PL]),
+            "Sold": pd.DatetimeIndex(np.concatenate(sold)), "PL": np.concatenate(PL)}
+
+
+def pl_matrix(Portfolio_PL, on="Expiration", trades=None):
+    """
+    Trade P&L of every ETF on one grid of business days (see book_trades for the parameters).
+    `trades` is the book_trades of Portfolio_PL when already built.
+
+    Returns:
+      DataFrame: Business days x ETFs, the P&L realized that day summed over the ETF's trades, 0 when none.
+      ETFs without any trade are left out.
+    """
+    trades = trades or book_trades(Portfolio_PL, on)
+    if trades is None:
+        return pd.DataFrame(dtype=np.float64)
+    matrix = np.zeros((len(trades["Grid"]), len(trades["ETFs"])))
+    np.add.at(matrix, (trades["Row"], trades["Column"]), trades["PL"])  # Trades of one ETF expiring the same day add up.
+    return pd.DataFrame(matrix, index=trades["Grid"], columns=trades["ETFs"])
+
+
+def rolling_cov(matrix, window, step=1):
+    """
+    Sample covariance over the trailing `window` rows, at every `step`-th row from the first full window.
+
+    One strided view of the matrix and one batched product, no loop over dates.
+
+    Returns:
+      tuple: (DatetimeIndex of the last row of each window, array rebalances x ETFs x ETFs).
+    """
+    values = np.asarray(matrix, dtype=np.float64)
+    ends = np.arange(window - 1, len(values), step)
+    if len(ends) == 0:
+        return matrix.index[:0], np.empty((0, values.shape[1], values.shape[1]))
+    windows = sliding_window_view(values, window, axis=0)[ends - window + 1]  # rebalances x ETFs x window
+    windows = windows - windows.mean(axis=2, keepdims=True)
+    cov = windows @ windows.transpose(0, 2, 1) / (window - 1)
+    return matrix.index[ends], cov
+
+
+def cov_to_corr(cov):
+    """Correlations from covariances, 0 wherever an ETF has no variance in the window."""
+    std = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+    scale = np.einsum("rn,rm->rnm", std, std)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(scale > 0, cov / scale, 0.0)
+
+
+def shrink(cov, amount):
+    """
+    Covariances pulled towards their diagonal by `amount` (0 to 1).
+
+    With more ETFs than days in the window the sample covariance is singular and risk parity has no solution,
+    any amount above 0 makes it positive definite again.
+    """
+    diagonal = np.diagonal(cov, axis1=1, axis2=2)
+    shrunk = cov * (1 - amount)
+    shrunk[:, np.arange(cov.shape[1]), np.arange(cov.shape[1])] = diagonal
+    return shrunk
+
+
+def _normalize(weights):
+    total = weights.sum(axis=1, keepdims=True)
+    n = weights.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total > 0, weights / total, 1.0 / n)  # Nothing to weigh on: back to equal weight.
+
+
+def inverse_vol_weights(cov):
+    """Weights proportional to 1 / volatility, 0 for ETFs with no variance in the window."""
+    var = np.diagonal(cov, axis1=1, axis2=2)
+    with np.errstate(divide="ignore"):
+        inverse = np.where(var > 0, 1.0 / np.sqrt(var), 0.0)
+    return _normalize(inverse)
+
+
+def risk_parity_weights(cov, iterations=100, tol=1e-10):
+    """
+    Equal risk contribution weights, w_i * (cov @ w)_i the same for every ETF with variance in the window.
+
+    Cyclical coordinate descent on the convex formulation (each coordinate has a closed form), run on every
+    rebalance date at once. ETFs with no variance in the window get no weight.
+    """
+    cov = cov.copy()
+    var = np.diagonal(cov, axis1=1, axis2=2).copy()
+    active = var > 0
+    # Inactive ETFs: unit variance and no covariance, with a zero budget their coordinate solves to 0.
+    cov[~active[:, :, None] | ~active[:, None, :]] = 0.0
+    diag = np.where(active, var, 1.0)
+    cov[:, np.arange(cov.shape[1]), np.arange(cov.shape[1])] = diag
+    budget = active / np.maximum(active.sum(axis=1, keepdims=True), 1)
+
+    y = inverse_vol_weights(cov) * active
+    for _ in range(iterations):
+        previous = y.copy()
+        for i in range(cov.shape[1]):
+            c = np.einsum("rn,rn->r", cov[:, i, :], y) - diag[:, i] * y[:, i]
+            y[:, i] = (-c + np.sqrt(c * c + 4 * diag[:, i] * budget[:, i])) / (2 * diag[:, i])
+        if np.max(np.abs(y - previous)) < tol:
+            break
+    return _normalize(y)
+
+
+def correlation_clusters(corr, threshold):
+    """
+    Cluster label of every ETF on every rebalance date: ETFs linked by correlations above `threshold`, directly
+    or through other ETFs, share a cluster (single linkage). The label is the lowest column index in the cluster.
+    """
+    linked = (corr > threshold) | np.eye(corr.shape[1], dtype=bool)
+    # Transitive closure by repeated squaring, at most log2(n) products.
+    for _ in range(int(np.ceil(np.log2(max(corr.shape[1], 2)))) + 1):
+        paths = linked.astype(np.float64)
+        closure = paths @ paths > 0
+        if np.array_equal(closure, linked):
+            break
+        linked = closure
+    return linked.argmax(axis=2)
+
+
+def cluster_cap_weights(cov, threshold=0.7, cap=0.25):
+    """
+    Inverse-vol weights with the total of each correlation cluster capped at `cap`.
+
+    What a capped cluster gives up goes to the clusters under the cap, in proportion to their weight, until none
+    is over it. When every cluster is capped the remainder is left unallocated, the weights then sum to less than 1.
+    """
+    weights = inverse_vol_weights(cov)
+    labels = correlation_clusters(cov_to_corr(cov), threshold)
+    n = cov.shape[1]
+    members = labels[:, :, None] == np.arange(n)[None, None, :]  # rebalances x ETFs x clusters
+    capped = np.zeros((len(cov), n), dtype=bool)  # per cluster
+    for _ in range(n):
+        totals = np.einsum("rn,rnc->rc", weights, members)
+        over = (totals > cap * (1 + 1e-12)) & ~capped
+        if not over.any():
+            break
+        capped |= over
+        scale = np.where(capped & (totals > 0), cap / np.where(totals > 0, totals, 1.0), 1.0)
+        weights = weights * np.einsum("rnc,rc->rn", members, scale)
+        free = ~np.einsum("rnc,rc->rn", members, capped).astype(bool)
+        room = 1.0 - weights.sum(axis=1, keepdims=True)
+        free_total = (weights * free).sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = np.where(free & (free_total > 0), weights * (1 + room / free_total), weights)
+    return weights
+
+
+def estimate_weights(cov, method, threshold=0.7, cap=0.25, shrinkage=0.2):
+    """Weights of one method (see METHODS) on every rebalance date, from the covariances of rolling_cov."""
+    if method == "equal":
+        return np.full(cov.shape[:2], 1.0 / cov.shape[1])
+    if method == "inverse_vol":
+        return inverse_vol_weights(cov)
+    if method == "risk_parity":
+        return risk_parity_weights(shrink(cov, shrinkage))
+    if method == "cluster_cap":
+        return cluster_cap_weights(cov, threshold, cap)
+    raise ValueError(f"Unknown weighting method {method!r}, expected one of {METHODS}.")
+
+
+def hold_weights(matrix, dates, estimated):
+    """
+    Daily weights from the ones estimated on `dates`, each set held until the next one.
+
+    A straddle sold on a day takes that day's row: the weights estimated on a window ending on or before it.
+    Before the first full window the book is equally weighted.
+
+    Returns:
+      DataFrame: Same shape as `matrix`, the weight of each ETF on each day.
+    """
+    n = matrix.shape[1]
+    weights = np.full(matrix.shape, np.nan)
+    weights[matrix.index.get_indexer(dates)] = estimated
+    return pd.DataFrame(weights, index=matrix.index, columns=matrix.columns).ffill().fillna(1.0 / n)
+
+
+def portfolio_pl(Portfolio_PL, weights, trades=None):
+    """
+    Daily P&L of the weighted book, weights scaled by the number of ETFs (equal weight = one straddle each).
+
+    Each trade is sized by the weights of its sale Date (see hold_weights), sales before the grid are equally
+    weighted, and booked on the grid of pl_matrix.
+
+    Parameters:
+      trades (dict): book_trades of Portfolio_PL, when already built.
+    """
+    trades = trades or book_trades(Portfolio_PL)
+    n = weights.shape[1]
+    held = weights[trades["ETFs"]].to_numpy()
+    row = weights.index.searchsorted(trades["Sold"], side="right") - 1
+    sized = np.where(row >= 0, held[np.maximum(row, 0), trades["Column"]], 1.0 / n) * n
+    daily = np.zeros(len(trades["Grid"]))
+    np.add.at(daily, trades["Row"], trades["PL"] * sized)
+    return pd.Series(daily, index=trades["Grid"])
+
+
+def periods_per_year(dates):
+    """Book "trades" per year over the span of `dates`, what the book's Sharpe ratio is annualized with."""
+    dates = pd.DatetimeIndex(dates)
+    years = (dates[-1] - dates[0]).days / 365.25 if len(dates) > 1 else 0
+    return (len(dates) - 1) / years if years > 0 else np.nan
+
+
+def portfolio_results(Portfolio_PL, initial_equity, window=63, step=21, threshold=0.7, cap=0.25, shrinkage=0.2,
+                      methods=METHODS):
+    """
+    Equal-weight and optimized books side by side, scored like a single ETF (compute_performance).
+
+    Parameters:
+      Portfolio_PL (dict): ETF -> trades (Portfolio_PL.pkl).
+      initial_equity (float): general.initial_equity.
+      window, step (int): Business days per covariance window and between rebalances (portfolio section of the config).
+      threshold, cap (float): Correlation linking two ETFs into a cluster, and the most weight a cluster can have.
+      shrinkage (float): Share of the covariances pulled towards the diagonal (see shrink).
+      methods (iterable): Weighting methods to build, out of METHODS.
+
+    Returns:
+      tuple: (DataFrame with one row per method, dict method -> daily weights DataFrame).
+    """
+    trades = book_trades(Portfolio_PL)
+    results, weights = [], {}
+    if trades is None:
+        return pd.DataFrame(results), weights
+    matrix = pl_matrix(Portfolio_PL, trades=trades)
+    dates, cov = rolling_cov(matrix, window, step)  # Shared by every method.
+    for method in methods:
+        weights[method] = hold_weights(matrix, dates, estimate_weights(cov, method, threshold, cap, shrinkage))
+        daily = portfolio_pl(Portfolio_PL, weights[method], trades)
+        daily = daily[matrix.ne(0).any(axis=1)]  # Days something expired, one "trade" of the book.
+        performance = compute_performance(pd.DataFrame({"Date": daily.index, "PL": daily.to_numpy()}), initial_equity,
+                                          periods_per_year(daily.index))
+        results.append({"Method": method, **performance})
+    return pd.DataFrame(results), weights
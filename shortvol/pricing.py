@@ -0,0 +1,167 @@
+import functools
+import math
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252  # To annualize the daily Volatility column from ETFs.py.
+
+
+@functools.cache
+def _ndtr():
+    """scipy's normal CDF, imported on the first price: importing scipy.special costs more than pandas."""
+    try:
+        from scipy.special import ndtr
+    except ImportError:  # scipy is optional, math.erf gives the same numbers, just slower.
+        erf = np.vectorize(math.erf, otypes=[float])
+
+        def ndtr(x):
+            return 0.5 * (1.0 + erf(np.asarray(x, dtype=float) / math.sqrt(2.0)))
+    return ndtr
+
+
+def norm_cdf(x):
+    return _ndtr()(x)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * np.square(x)) / math.sqrt(2.0 * math.pi)
+
+
+def _d1_d2(F, K, T, sigma):
+    """d1 and d2 written on the forward, shared by Black-Scholes and Black-76."""
+    vol_sqrt_t = sigma * np.sqrt(T)
+    d1 = (np.log(F / K) + 0.5 * vol_sqrt_t ** 2) / vol_sqrt_t
+    return d1, d1 - vol_sqrt_t
+
+
+def black76(F, K, T, sigma, r=0.0, is_call=True):
+    """
+    Black-76 price of a European option on a forward, vectorized over every argument.
+
+    Parameters:
+      F, K (array): Forward and strike.
+      T (array): Time to expiry in years.
+      sigma (array): Annualized volatility.
+      r (float or array): Continuously compounded rate used for discounting.
+      is_call (bool or array): True for calls, False for puts.
+
+    Returns:
+      ndarray: Option prices. Rows with T or sigma at zero get their intrinsic value.
+    """
+    F, K, T, sigma = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (F, K, T, sigma)))
+    discount = np.exp(-np.asarray(r, dtype=float) * T)
+    live = (T > 0) & (sigma > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1, d2 = _d1_d2(F, K, np.where(live, T, 1.0), np.where(live, sigma, 1.0))
+    call = discount * (F * norm_cdf(d1) - K * norm_cdf(d2))
+    put = discount * (K * norm_cdf(-d2) - F * norm_cdf(-d1))
+    price = np.where(is_call, call, put)
+    intrinsic = discount * np.where(is_call, np.maximum(F - K, 0), np.maximum(K - F, 0))
+    return np.where(live, price, intrinsic)
+
+
+def black_scholes(S, K, T, sigma, r=0.0, q=0.0, is_call=True):
+    """Black-Scholes price on a spot with dividend yield q, through the forward S * exp((r - q) T)."""
+    T = np.asarray(T, dtype=float)
+    F = np.asarray(S, dtype=float) * np.exp((r - q) * T)
+    return black76(F, K, T, sigma, r, is_call)
+
+
+def straddle_price(S, K, T, sigma, r=0.0, q=0.0):
+    """Call plus put at the same strike, what we collect when selling the straddle."""
+    return black_scholes(S, K, T, sigma, r, q, True) + black_scholes(S, K, T, sigma, r, q, False)
+
+
+def vega(S, K, T, sigma, r=0.0, q=0.0):
+    """Black-Scholes vega (price change per unit of sigma), the same for calls and puts."""
+    S, K, T, sigma = (np.asarray(a, dtype=float) for a in (S, K, T, sigma))
+    F = S * np.exp((r - q) * T)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1, _ = _d1_d2(F, K, T, sigma)
+        return np.nan_to_num(S * np.exp(-q * T) * norm_pdf(d1) * np.sqrt(T))
+
+
+def delta(S, K, T, sigma, r=0.0, q=0.0, is_call=True):
+    """
+    Black-Scholes delta (price change per unit of S), vectorized over every argument.
+
+    Rows with T or sigma at zero get the delta of their intrinsic value: 1 or 0 for calls, -1 or 0 for puts.
+    """
+    S, K, T, sigma = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (S, K, T, sigma)))
+    live = (T > 0) & (sigma > 0)
+    F = S * np.exp((r - q) * T)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1, _ = _d1_d2(F, K, np.where(live, T, 1.0), np.where(live, sigma, 1.0))
+    carry = np.exp(-q * T)
+    call = np.where(live, carry * norm_cdf(d1), (S > K).astype(float))
+    return np.where(is_call, call, call - np.where(live, carry, 1.0))
+
+
+def straddle_delta(S, K, T, sigma, r=0.0, q=0.0):
+    """Delta of a long straddle, call delta plus put delta: from -1 deep below the strike to 1 deep above."""
+    # The put delta is the call delta minus the carry, so the call's is all there is to compute.
+    T = np.asarray(T, dtype=float)
+    live = (T > 0) & (np.asarray(sigma, dtype=float) > 0)
+    return 2 * delta(S, K, T, sigma, r, q, True) - np.where(live, np.exp(-q * T), 1.0)
+
+
+def annualize_vol(daily_vol, periods=TRADING_DAYS):
+    return np.asarray(daily_vol, dtype=float) * math.sqrt(periods)
+
+
+def _plain_days(dates):
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)  # Keep the wall-clock date, yfinance dates carry the exchange timezone.
+    return dates.values.astype("datetime64[D]")
+
+
+def year_fraction(signal_dates, expiration_dates):
+    """Calendar time between signal and expiry in years, the convention option prices are quoted on."""
+    days = _plain_days(expiration_dates) - _plain_days(signal_dates)
+    return days.astype(float) / 365.0
+
+
+def vol_multiplier(premium, S, K, T, realized_vol, r=0.0):
+    """
+    How much richer market straddles are than Black-Scholes at realized vol, calibrated on cached premiums.
+
+    Near the money a straddle is almost linear in sigma, so the median ratio of observed to model
+    premium is a good scale for realized vol. It carries the variance risk premium we are selling.
+
+    Returns:
+      float: The median ratio, NaN when there is nothing to calibrate on.
+    """
+    model = straddle_price(S, K, T, realized_vol, r)
+    ratio = np.asarray(premium, dtype=float) / model
+    ratio = ratio[np.isfinite(ratio) & (ratio > 0)]
+    return float(np.median(ratio)) if len(ratio) else math.nan
+
+
+def model_straddle(S, K, T, realized_vol, multiplier=1.0, r=0.0):
+    """Call and put estimates for every signal at once, with realized vol scaled by the calibrated multiplier."""
+    sigma = np.asarray(realized_vol, dtype=float) * multiplier
+    return black_scholes(S, K, T, sigma, r, is_call=True), black_scholes(S, K, T, sigma, r, is_call=False)
+
+
+def calibrate_multipliers(portfolio, r=0.0):
+    """
+    Per-ticker vol multipliers from a cached Portfolio_PL dictionary (ticker -> DataFrame).
+
+    Only rows priced from the API are used, so model-filled gaps never calibrate themselves.
+    Frames saved before the Strike/Close/Volatility columns were kept are skipped.
+    """
+    needed = {"Date", "Close", "Strike", "Expiration", "Volatility", "Call_Price", "Put_Price"}
+    multipliers = {}
+    for ticker, df in portfolio.items():
+        if not needed.issubset(df.columns):
+            continue
+        if "Premium_Source" in df.columns:
+            df = df[df["Premium_Source"] == "api"]
+        T = year_fraction(df["Date"], df["Expiration"])
+        value = vol_multiplier(df["Call_Price"] + df["Put_Price"], df["Close"], df["Strike"], T,
+                               annualize_vol(df["Volatility"]), r)
+        if not math.isnan(value):
+            multipliers[ticker] = value
+    return multipliers
@@ -0,0 +1,179 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from shortvol import instrument
+
+### Candle pyramid
+# The hourly Bitget candles rolled up once into coarser bars (4h, 8h, daily, weekly...), each level anchored at any
+# hour: daily bars from 08:00 UTC to 08:00 UTC line up with Deribit's expiries. Every level is a set of arrays
+# (bar start, OHLC, hours in the bar), so move statistics over a horizon read a few thousand bars instead of
+# filtering and merging the 45k+ hourly rows. New candles only touch the end of each level: the last bar is
+# completed with them and the bars after it are appended.
+
+HOUR_MS = 3_600_000
+MONDAY_MS = 4 * 24 * HOUR_MS  # 1970-01-05, the first Monday after the epoch. Weeks start on it, the other levels don't care.
+UNIT_HOURS = {"h": 1, "d": 24, "w": 168}
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+BAR_COLUMNS = ["Start", "Open_Time", "Open", "High", "Low", "Close", "Hours"]
+
+
+def parse_level(spec):
+    """
+    Width and anchor of a level written as "<n><h|d|w>[@[weekday]HH]".
+
+    "4h" are bars of 4 hours from midnight UTC, "1d@08" days from 08:00 to 08:00 UTC, "1w@fri08" weeks from
+    Friday 08:00 (Deribit's weekly expiry).
+
+    Returns:
+      tuple: (hours per bar, hours from Monday 00:00 UTC to the start of a bar).
+    """
+    size, _, anchor = spec.partition("@")
+    hours = int(size[:-1]) * UNIT_HOURS[size[-1]]
+    day = 0
+    if anchor[:3].lower() in WEEKDAYS:
+        day, anchor = WEEKDAYS.index(anchor[:3].lower()), anchor[3:]
+    return hours, day * 24 + int(anchor or 0)
+
+
+def candle_times(time):
+    """Unix milliseconds of a Time column, as Bitget sends it (strings or integers) or as datetimes."""
+    if pd.api.types.is_datetime64_any_dtype(time):
+        return pd.DatetimeIndex(time).as_unit("ms").asi8
+    return pd.to_numeric(time).to_numpy(dtype=np.int64)
+
+
+def roll_up(times, open_, high, low, close, hours, anchor):
+    """
+    Bars of `hours` anchored `anchor` hours after Monday 00:00 UTC, from hourly candles sorted by time.
+
+    One pass of reduceat per column. A bar is made of the candles it has: Hours tells how many, and Open_Time
+    when the first one opened, so bars missing their first or any candle can be told apart.
+
+    Returns:
+      dict: BAR_COLUMNS -> array, Start and Open_Time in Unix milliseconds.
+    """
+    if not len(times):
+        return {column: np.empty(0, dtype=np.int64 if column in ("Start", "Open_Time", "Hours") else np.float64)
+                for column in BAR_COLUMNS}
+    width, origin = hours * HOUR_MS, MONDAY_MS + anchor * HOUR_MS
+    bar = (times - origin) // width
+    starts = np.flatnonzero(np.diff(bar, prepend=bar[0] - 1))
+    ends = np.append(starts[1:], len(times)) - 1
+    return {
+        "Start": bar[starts] * width + origin,
+        "Open_Time": times[starts],
+        "Open": open_[starts],
+        "High": np.maximum.reduceat(high, starts),
+        "Low": np.minimum.reduceat(low, starts),
+        "Close": close[ends],
+        "Hours": ends - starts + 1,
+    }
+
+
+class CandlePyramid:
+    """
+    Hourly candles rolled up into several levels, kept up to date one batch of new candles at a time.
+
+    Attributes:
+      levels (dict): Level spec -> (hours, anchor), see parse_level.
+      bars (dict): Level spec -> BAR_COLUMNS arrays.
+      last_time (int): Open time (Unix milliseconds) of the last candle rolled up, None before the first.
+    """
+
+    def __init__(self, levels):
+        self.levels = {spec: parse_level(spec) for spec in levels}
+        self.bars = {spec: roll_up(np.empty(0, np.int64), *[np.empty(0)] * 4, *parsed) for spec, parsed in self.levels.items()}
+        self.last_time = None
+
+    def update(self, candles):
+        """
+        Roll up the candles opened after last_time, the ones already in the pyramid are skipped.
+
+        Parameters:
+          candles (DataFrame): Hourly Time, Open, High, Low and Close, e.g. the saved Bitget history.
+
+        Returns:
+          int: Number of candles added.
+        """
+        times = candle_times(candles["Time"])
+        order = np.argsort(times, kind="stable")
+        times = times[order]
+        new = np.ones(len(times), dtype=bool) if self.last_time is None else times > self.last_time
+        new[1:] &= times[1:] != times[:-1]  # One candle per hour, overlapping pages send some twice.
+        times = times[new]
+        instrument.count("pyramid.new_candles", len(times))
+        if not len(times):
+            return 0
+        prices = [candles[column].to_numpy(dtype=np.float64)[order][new] for column in ("Open", "High", "Low", "Close")]
+
+        for spec, (hours, anchor) in self.levels.items():
+            stored, added = self.bars[spec], roll_up(times, *prices, hours, anchor)
+            if len(stored["Start"]) and added["Start"][0] == stored["Start"][-1]:
+                # The last stored bar was still open: it keeps its Open, the new candles finish it.
+                last = {column: values[-1] for column, values in stored.items()}
+                added["Open_Time"][0], added["Open"][0] = last["Open_Time"], last["Open"]
+                added["High"][0] = max(added["High"][0], last["High"])
+                added["Low"][0] = min(added["Low"][0], last["Low"])
+                added["Hours"][0] += last["Hours"]
+                stored = {column: values[:-1] for column, values in stored.items()}
+            self.bars[spec] = {column: np.concatenate([stored[column], added[column]]) for column in BAR_COLUMNS}
+        self.last_time = int(times[-1])
+        return len(times)
+
+    def frame(self, spec):
+        """The bars of a level, Start and Open_Time as datetimes (UTC, tz-naive like the candle files)."""
+        bars = self.bars[spec]
+        frame = pd.DataFrame(bars)
+        for column in ("Start", "Open_Time"):
+            frame[column] = pd.to_datetime(bars[column], unit="ms")
+        return frame
+
+    def moves(self, spec, start_hour=None):
+        """
+        Move from the open of each bar to the open of the next one, for bars that both open on time.
+
+        The same move as hour_window_moves (shortvol/btc.py) between the two anchor hours, e.g. "8h@00" with
+        start_hour=0 is the 00:00 to 08:00 study and "1d@08" the 08:00 to 08:00 one.
+
+        Parameters:
+          spec (str): Level of the pyramid.
+          start_hour (int): Only the bars starting at that hour (UTC), all of them when None.
+
+        Returns:
+          DataFrame: Start, Open, Next_Open, Return (absolute move in percent), Log_Return and DayOfWeek.
+        """
+        bars = self.bars[spec]
+        width = self.levels[spec][0] * HOUR_MS
+        start, open_ = bars["Start"], bars["Open"]
+        on_time = bars["Open_Time"] == start
+        keep = on_time[:-1] & on_time[1:] & (start[1:] - start[:-1] == width)
+        if start_hour is not None:
+            keep &= (start[:-1] // HOUR_MS) % 24 == start_hour
+        first, following = open_[:-1][keep], open_[1:][keep]
+        dates = pd.to_datetime(start[:-1][keep], unit="ms")
+        return pd.DataFrame({
+            "Start": dates,
+            "Open": first,
+            "Next_Open": following,
+            "Return": np.abs((following - first) / first * 100),
+            "Log_Return": np.log(following / first),
+            "DayOfWeek": dates.day_name(),
+        })
+
+
+def load_pyramid(path, levels):
+    """The pyramid saved at `path`, or an empty one when there is none or it was built with other levels."""
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            pyramid = pickle.load(f)
+        if list(pyramid.levels) == list(levels):
+            return pyramid
+    return CandlePyramid(levels)
+
+
+def save_pyramid(pyramid, path):
+    with open(path, "wb") as f:
+        pickle.dump(pyramid, f)
@@ -0,0 +1,183 @@
+import operator
+
+import numpy as np
+import pandas as pd
+
+from shortvol.signal_index import date_slice
+
+try:
+    import polars as pl
+except ImportError:  # polars is optional, the pandas engine gives the same tables.
+    pl = None
+
+### Lazy queries
+# The analysis scripts read a file or take a frame, keep some rows, then summarize a column per group. Written as a
+# Query, nothing runs until collect(): the steps are first gathered into one plan, so a CSV is read with only the
+# columns some step uses, every filter is fused into a single mask (or, on a column the rows are sorted by, a
+# binary search instead of a mask), and the group-by runs on what is left. The same plan runs on pandas, or on polars
+# when it is installed and asked for: a lazy frame polars optimizes and executes on all cores, the result handed
+# back as the pandas table the pandas engine builds, so scripts pick an engine with a config key and nothing else.
+
+ENGINES = ("pandas", "polars")
+SUMMARY_STATS = ("mean", "std", "median", "count")
+OPERATORS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt,
+             ">=": operator.ge}
+BOUNDS = {">=": "start", "<=": "end"}  # Filters on a sorted column date_slice can answer.
+
+
+class Query:
+    """
+    Steps over a CSV file or a frame, run when collected.
+
+    Attributes:
+      source (str or DataFrame): Path of a CSV (read like pd.read_csv with no other options) or a frame.
+      sorted_by (str): Column the source's rows are sorted by, if any, so range filters on it are binary searches.
+      filters (tuple): (column, operator, value), operator one of OPERATORS.
+      columns (tuple): Columns kept, all of them when None.
+      group (tuple): (keys, column, stats) of a group-by, None for rows.
+    """
+
+    def __init__(self, source, sorted_by=None, filters=(), columns=None, group=None):
+        self.source = source
+        self.sorted_by = sorted_by
+        self.filters = tuple(filters)
+        self.columns = columns
+        self.group = group
+
+    def _with(self, **changes):
+        steps = {"sorted_by": self.sorted_by, "filters": self.filters, "columns": self.columns, "group": self.group}
+        return Query(self.source, **{**steps, **changes})
+
+    def filter(self, column, op, value):
+        """Rows where `column op value`, e.g. filter("Date", ">=", "2023-03-01")."""
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator {op!r}, expected one of {list(OPERATORS)}.")
+        return self._with(filters=self.filters + ((column, op, value),))
+
+    def select(self, *columns):
+        return self._with(columns=tuple(columns))
+
+    def group_by(self, keys, column, stats=SUMMARY_STATS):
+        """
+        `stats` of `column` per group of `keys`, like frame.groupby(keys)[column].agg(list(stats)):
+        one row per group sorted by the keys, one column per stat (NaN values left out of each).
+        """
+        keys = (keys,) if isinstance(keys, str) else tuple(keys)
+        return self._with(group=(keys, column, tuple(stats)))
+
+    def plan(self):
+        """
+        The optimized plan collect() runs.
+
+        Returns:
+          dict: read (columns read from the source, None for all), sorted_by, start and end (its bounds,
+          answered by binary search), predicates (the other filters, fused into one mask), columns and group.
+        """
+        start = end = None
+        predicates = []
+        for column, op, value in self.filters:
+            if column == self.sorted_by and op in BOUNDS:
+                if op == ">=":
+                    start = value if start is None else max(start, value)
+                else:
+                    end = value if end is None else min(end, value)
+            else:
+                predicates.append((column, op, value))
+        read = None
+        if self.group is not None or self.columns is not None:
+            keys, column, _ = self.group or ((), None, ())
+            used = [c for c, _, _ in self.filters] + list(self.columns or ()) + list(keys) + ([column] if column else [])
+            read = list(dict.fromkeys(used))
+        return {"read": read, "sorted_by": self.sorted_by, "start": start, "end": end, "predicates": predicates,
+                "columns": self.columns, "group": self.group}
+
+    def collect(self, engine=None):
+        """
+        Run the plan.
+
+        Parameters:
+          engine (str): "pandas" (the default) or "polars", see ENGINES.
+
+        Returns:
+          DataFrame: The rows kept, with the source's index, or the group-by table indexed by its keys.
+        """
+        engine = engine or "pandas"
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown query engine {engine!r}, expected one of {list(ENGINES)}.")
+        if engine == "polars" and pl is None:
+            raise ImportError("The polars query engine needs polars installed, use the pandas engine.")
+        plan = self.plan()
+        return (_collect_pandas if engine == "pandas" else _collect_polars)(self.source, plan)
+
+
+def scan_csv(path, sorted_by=None):
+    """A query over a CSV file, nothing is read until it is collected."""
+    return Query(path, sorted_by=sorted_by)
+
+
+def query(frame, sorted_by=None):
+    """A query over a frame already in memory."""
+    return Query(frame, sorted_by=sorted_by)
+
+
+def _collect_pandas(source, plan):
+    if isinstance(source, pd.DataFrame):
+        frame = source if plan["read"] is None else source[plan["read"]]
+    else:
+        # Floats parsed exactly (pandas' default parser can be a unit in the last place off), as polars reads them.
+        frame = pd.read_csv(source, usecols=plan["read"], float_precision="round_trip")
+        if plan["read"] is not None:
+            frame = frame[plan["read"]]  # usecols keeps the file's order.
+    if plan["start"] is not None or plan["end"] is not None:
+        frame = date_slice(frame, plan["start"], plan["end"], column=plan["sorted_by"])
+    if plan["predicates"]:
+        frame = frame[np.logical_and.reduce([OPERATORS[op](frame[column].to_numpy(), value)
+                                             for column, op, value in plan["predicates"]])]
+    if plan["columns"] is not None:
+        frame = frame[list(plan["columns"])]
+    if plan["group"] is None:
+        return frame
+    keys, column, stats = plan["group"]
+    return frame.groupby(list(keys) if len(keys) > 1 else keys[0])[column].agg(list(stats))
+
+
+def _collect_polars(source, plan):
+    if isinstance(source, pd.DataFrame):
+        read = plan["read"] or list(source.columns)
+        lazy = pl.DataFrame({column: source[column].to_numpy() for column in read}).lazy()
+        index = source.index.to_numpy()
+    else:
+        lazy = pl.scan_csv(source)
+        # pandas names a header left empty (the index of a saved frame) "Unnamed: <position>".
+        names = lazy.collect_schema().names()
+        lazy = lazy.rename({name: f"Unnamed: {i}" for i, name in enumerate(names) if name == ""})
+        if plan["read"] is not None:
+            lazy = lazy.select(plan["read"])
+        index = None
+    lazy = lazy.with_row_index("__row")
+    sorted_by = plan["sorted_by"]
+    if sorted_by is not None:
+        lazy = lazy.set_sorted(sorted_by)
+    bounds = [(sorted_by, ">=", plan["start"]), (sorted_by, "<=", plan["end"])]
+    conditions = [OPERATORS[op](pl.col(column), value) for column, op, value in bounds + plan["predicates"]
+                  if value is not None]
+    if conditions:
+        lazy = lazy.filter(pl.all_horizontal(conditions))
+    if plan["columns"] is not None:
+        lazy = lazy.select(["__row", *plan["columns"]])
+
+    if plan["group"] is None:
+        result = lazy.collect()
+        rows = result["__row"].to_numpy().astype(np.int64)
+        return pd.DataFrame({column: result[column].to_numpy() for column in result.columns if column != "__row"},
+                            index=rows if index is None else index[rows])
+
+    keys, column, stats = plan["group"]
+    value = pl.col(column).fill_nan(None) if lazy.collect_schema()[column].is_float() else pl.col(column)
+    aggregations = {"mean": value.mean(), "std": value.std(ddof=1), "median": value.median(),
+                    "count": value.count().cast(pl.Int64), "sum": value.sum(), "min": value.min(), "max": value.max()}
+    result = (lazy.filter(pl.all_horizontal([pl.col(key).is_not_null() for key in keys]))
+              .group_by(list(keys)).agg([aggregations[stat].alias(stat) for stat in stats])
+              .sort(list(keys)).collect())
+    table = pd.DataFrame({name: result[name].to_numpy() for name in result.columns})
+    return table.set_index(list(keys) if len(keys) > 1 else keys[0])
@@ -0,0 +1,258 @@
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from shortvol import instrument
+from shortvol.config import root_path
+from shortvol.pricing import annualize_vol
+from shortvol.schema import PRICE_DTYPE, from_epoch, to_epoch
+
+### Regime features
+# The market backdrop of every trading day of the panel, computed once and kept in one file: realized vol, trend and
+# roll of any ticker, cross-asset vol and dispersion, the drag of UVXY over VIXY (what vol of vol costs a leveraged
+# long vol fund), and calendar flags. Every feature is one float32 array over the panel's dates, so the P&L of any
+# pipeline is joined to it with a searchsorted on the trade dates, and "how did the straddle do when VIXY was high"
+# is one group-by over (feature, bucket) for every feature at once. A run only computes the features the file
+# doesn't have yet; when the panel only gained sessions, the cached ones compute just the new rows (after a warm-up
+# long enough for their windows), and they are rebuilt when the tickers, the windows or the past sessions change.
+# Buckets are quantiles of the feature's whole history by default, sessions after a trade included: say where the
+# history ends (buckets_until) to cut them with only what was known by then.
+
+FEATURES_VERSION = 1
+CATEGORICAL = ("Weekday", "Month_end", "Opex", "Holiday_next")  # Bucketed by value, the others by quantile.
+MAX_GAP = pd.Timedelta(days=4).value  # A trade takes the last session's features at most this long before it (a long weekend).
+
+
+def features_path():
+    return os.path.join(root_path(), "Regime features.pkl")
+
+
+def wide_closes(panel):
+    """
+    Closes of a long panel (shortvol/panel.py) as one frame, a row per date any ticker traded, a column per ticker.
+
+    Returns:
+      DataFrame: float64, indexed by int64 epoch dates, NaN where a ticker has no close.
+    """
+    dates, row = np.unique(panel["Date"].to_numpy(dtype=np.int64), return_inverse=True)
+    tickers = panel["Ticker"].astype("category")
+    closes = np.full((len(dates), len(tickers.cat.categories)), np.nan)
+    closes[row, tickers.cat.codes.to_numpy()] = panel["Close"].to_numpy(dtype=np.float64)
+    return pd.DataFrame(closes, index=dates, columns=list(tickers.cat.categories))
+
+
+def _log_returns(closes):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log(closes / closes.shift(1))
+
+
+def realized_vol(closes, window):
+    """Annualized std of the daily log returns over `window` days, of every column."""
+    return pd.DataFrame(annualize_vol(_log_returns(closes).rolling(window).std()), index=closes.index, columns=closes.columns)
+
+
+def trend(closes, window):
+    """Close over its `window` day mean, minus one: above 0 in an uptrend."""
+    return closes / closes.rolling(window).mean() - 1
+
+
+def roll(closes, window):
+    """Log return over `window` days. On VIXY or VXX, negative while the VIX futures are in contango."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log(closes / closes.shift(window))
+
+
+def cross_vol(closes, window):
+    """Median realized vol of every ticker of the panel."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # Days before any ticker has a full window.
+        return np.nanmedian(realized_vol(closes, window).to_numpy(), axis=1)
+
+
+def dispersion(closes, window):
+    """Cross-sectional std of the daily returns, averaged over `window` days: high when tickers go their own ways."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        daily = np.nanstd(_log_returns(closes).to_numpy(), axis=1)
+    return pd.Series(daily, index=closes.index).rolling(window, min_periods=1).mean().to_numpy()
+
+
+def uvxy_drag(closes, window):
+    """
+    UVXY's log return over `window` days minus its leverage times VIXY's: what vol of vol costs the leveraged fund.
+    The leverage is the rolling beta of UVXY's daily returns on VIXY's, it went from 2 to 1.5 in 2018.
+    """
+    if not {"UVXY", "VIXY"}.issubset(closes.columns):
+        return np.full(len(closes), np.nan)
+    returns = _log_returns(closes[["UVXY", "VIXY"]])
+    beta = returns["UVXY"].rolling(window).cov(returns["VIXY"]) / returns["VIXY"].rolling(window).var()
+    return (returns["UVXY"] - beta * returns["VIXY"]).rolling(window).sum().to_numpy()
+
+
+def calendar(dates):
+    """Weekday (0 Monday), Month_end (last session of its month), Opex (third Friday) and Holiday_next
+    (a weekday without a session before the next one) of sorted session dates."""
+    dates = from_epoch(dates)
+    following = dates[1:].append(dates[-1:] + pd.offsets.BDay(1))  # The last session is taken to be followed by the next weekday.
+    return {
+        "Weekday": dates.dayofweek.to_numpy(),
+        "Month_end": following.month != dates.month,
+        "Opex": (dates.dayofweek == 4) & (dates.day >= 15) & (dates.day <= 21),
+        "Holiday_next": np.busday_count(dates.values.astype("datetime64[D]"), following.values.astype("datetime64[D]")) > 1,
+    }
+
+
+MARKET_FEATURES = {"Cross_vol": cross_vol, "Dispersion": dispersion, "UVXY_drag": uvxy_drag}  # Name -> f(closes, window).
+TICKER_KINDS = {"vol": realized_vol, "trend": trend, "roll": roll}  # "<TICKER>_<kind>", e.g. VIXY_vol, TLT_trend.
+
+
+def compute_feature(name, closes, window, trend_window):
+    """
+    One feature over the dates of wide_closes.
+
+    Parameters:
+      name (str): One of MARKET_FEATURES or CATEGORICAL, or "<TICKER>_<kind>" for a kind of TICKER_KINDS.
+      window (int): Days of the vol, roll and market features.
+      trend_window (int): Days of the mean the trend is measured against.
+
+    Returns:
+      ndarray: float32, NaN where it can't be computed yet (or the ticker has no close).
+    """
+    if name in CATEGORICAL:
+        values = calendar(closes.index.to_numpy())[name]
+    elif name in MARKET_FEATURES:
+        values = MARKET_FEATURES[name](closes, window)
+    else:
+        ticker, _, kind = name.rpartition("_")
+        if kind not in TICKER_KINDS or ticker not in closes.columns:
+            raise ValueError(f"Unknown regime feature {name!r}: expected one of {list(MARKET_FEATURES) + list(CATEGORICAL)} "
+                             f"or <ticker of the panel>_<{'|'.join(TICKER_KINDS)}>.")
+        column = closes[[ticker]]
+        values = TICKER_KINDS[kind](column, trend_window if kind == "trend" else window)[ticker]
+    return np.asarray(values, dtype=PRICE_DTYPE)
+
+
+def extend_feature(name, closes, values, window, trend_window):
+    """
+    A cached feature over the first len(values) dates of wide_closes, brought up to all of them.
+
+    Only the new rows are computed, plus the last cached one (Month_end and Holiday_next of the last session depend
+    on the session after it), on a slice starting early enough for every window to be full.
+    """
+    start = len(values) - 1
+    warm_up = 2 * max(window, trend_window) + 1  # UVXY_drag sums `window` days of returns on a `window` day beta.
+    first = max(start - warm_up, 0)
+    tail = compute_feature(name, closes.iloc[first:], window, trend_window)
+    return np.concatenate([values[:start], tail[start - first:]])
+
+
+def update_features(cache, panel, names, window, trend_window):
+    """
+    Regime features of a panel, computing only the ones `cache` (a previous result for the same tickers and
+    windows) doesn't hold. When the panel's dates extend the cached ones, the cached features only compute the
+    new rows (see extend_feature).
+
+    Returns:
+      dict: Version, Dates (int64 epochs), Tickers, Window, Trend_Window and Features (name -> float32 array).
+    """
+    closes = wide_closes(panel)
+    dates = closes.index.to_numpy()
+    same = (cache is not None and cache.get("Version") == FEATURES_VERSION and cache["Window"] == window
+            and cache["Trend_Window"] == trend_window and cache["Tickers"] == list(closes.columns))
+    old = cache["Dates"] if same else dates[:0]
+    features = {}
+    if same and np.array_equal(old, dates):
+        features = dict(cache["Features"])
+    elif same and 0 < len(old) < len(dates) and np.array_equal(old, dates[:len(old)]):
+        features = {name: extend_feature(name, closes, values, window, trend_window)
+                    for name, values in cache["Features"].items()}
+        instrument.count("regimes.features_extended", len(features))
+        instrument.count("regimes.sessions_added", len(dates) - len(old))
+    missing = [name for name in names if name not in features]
+    for name in missing:
+        features[name] = compute_feature(name, closes, window, trend_window)
+    instrument.count("regimes.features_computed", len(missing))
+    instrument.count("regimes.features_reused", len(names) - len(missing))
+    return {"Version": FEATURES_VERSION, "Dates": dates, "Tickers": list(closes.columns), "Window": window,
+            "Trend_Window": trend_window, "Features": features}
+
+
+def load_features(path=None):
+    """The features saved at `path` (features_path() by default), None before ETFs.py has built them."""
+    path = path or features_path()
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_features(features, path=None):
+    with open(path or features_path(), "wb") as f:
+        pickle.dump(features, f)
+
+
+def bucket_edges(history, buckets):
+    """The buckets - 1 quantiles cutting a feature's finite values in `buckets` buckets of the same size."""
+    history = np.asarray(history, dtype=np.float64)
+    finite = history[np.isfinite(history)]
+    return np.quantile(finite, np.linspace(0, 1, buckets + 1)[1:-1]) if len(finite) else np.full(buckets - 1, np.nan)
+
+
+def regime_table(trades, features, names=None, buckets=3, value="PL", until=None):
+    """
+    P&L of the trades in every regime: each trade takes the features of its date (the last session on or before it,
+    see MAX_GAP), continuous features are cut in quantile buckets, calendar ones keep their values.
+
+    The quantiles are taken over the feature's whole history by default, sessions after the trades included:
+    "high VIXY vol" is high for the full sample, not for what was known on the trade date.
+
+    Parameters:
+      trades (DataFrame): Date and `value` of each trade, any pipeline's (Portfolio_PL frames, the Friday P&L).
+      features (dict): update_features output.
+      names (list): Features to bucket by, all the cached ones by default.
+      buckets (int): Quantile buckets of the continuous features (3: low, middle and high).
+      until (str): Last date of the history the quantiles are taken over (e.g. the first trade's, for buckets
+        known before the backtest), None for all of it.
+
+    Returns:
+      DataFrame: Feature, Bucket (the quantile bucket, or the calendar value), Lower and Upper (the feature's values
+      the bucket spans, NaN at the ends and for calendar features), Trades, Total_PL, Mean_PL and Win_Rate (percent).
+    """
+    names = [name for name in (names or features["Features"]) if name in features["Features"]]
+    dates = pd.DatetimeIndex(trades["Date"])
+    dates = dates.tz_localize(None) if dates.tz is not None else dates  # The wall-clock date, like the panel's.
+    epoch = to_epoch(dates.normalize())
+    row = np.searchsorted(features["Dates"], epoch, side="right") - 1
+    known = (row >= 0) & (epoch - features["Dates"][np.maximum(row, 0)] <= MAX_GAP)  # Trades past the panel have none.
+    pl = trades[value].to_numpy(dtype=np.float64)
+    known_by = len(features["Dates"]) if until is None else np.searchsorted(features["Dates"], to_epoch([pd.Timestamp(until)])[0], side="right")
+
+    codes, lower, upper = [], {}, {}
+    for name in names:
+        history = features["Features"][name]
+        values = np.where(known, history[np.maximum(row, 0)], np.nan)
+        if name in CATEGORICAL:
+            codes.append(np.where(np.isnan(values), -1, values).astype(np.int64))
+            continue
+        edges = bucket_edges(history[:known_by], buckets)
+        bounds = np.concatenate([[np.nan], edges, [np.nan]])
+        codes.append(np.where(np.isnan(values), -1, np.searchsorted(edges, values, side="right")))
+        lower[name], upper[name] = bounds[:-1], bounds[1:]
+
+    # Every (trade, feature) pair in one long frame, a single group-by for all the features.
+    long = pd.DataFrame({
+        "Feature": pd.Categorical(np.repeat(names, len(pl)), categories=names),
+        "Bucket": np.concatenate(codes) if codes else np.empty(0, np.int64),
+        "PL": np.tile(pl, len(names)),
+    })
+    long = long[(long["Bucket"] >= 0) & long["PL"].notna()]
+    long["Win"] = (long["PL"] > 0) * 100.0
+    table = long.groupby(["Feature", "Bucket"], observed=True).agg(
+        Trades=("PL", "count"), Total_PL=("PL", "sum"), Mean_PL=("PL", "mean"), Win_Rate=("Win", "mean")).reset_index()
+    table.insert(2, "Lower", [lower[f][b] if f in lower else np.nan for f, b in zip(table["Feature"], table["Bucket"])])
+    table.insert(3, "Upper", [upper[f][b] if f in upper else np.nan for f, b in zip(table["Feature"], table["Bucket"])])
+    table["Feature"] = table["Feature"].astype(str)
+    return table
@@ -0,0 +1,216 @@
+import hashlib
+import html
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from shortvol import instrument
+from shortvol.portfolio import portfolio_pl
+
+### Offscreen report
+# Every figure of the report (equity and drawdown of each ETF and of each weighting of the book, the metrics table
+# image) is described by a job: plain arrays and labels, no matplotlib object. A job's hash covers everything drawn,
+# so a figure whose data did not change since the last report is not drawn again. The others are drawn with the Agg
+# backend (nothing is shown, nothing waits on a window) in a pool of processes, and an index.html puts the
+# figures and the metrics tables together in one static folder.
+
+RENDER_VERSION = 1  # Part of every hash, bumped when the drawing code changes so every figure is redrawn once.
+
+
+def _plain_dates(dates):
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)  # Wall-clock dates, the P&L of the API runs carries the exchange timezone.
+    return dates.to_numpy(dtype="datetime64[ns]")
+
+
+def equity_job(name, title, dates, PL, initial_equity):
+    """Equity and drawdown of one P&L sequence (trades of an ETF, or days of the book), in date order."""
+    dates = _plain_dates(dates)
+    order = np.argsort(dates, kind="stable")
+    equity = initial_equity + np.cumsum(np.asarray(PL, dtype=np.float64)[order])
+    return {"kind": "equity", "name": name, "title": title, "dates": dates[order], "series": {title: equity}}
+
+
+def book_job(name, title, daily, initial_equity):
+    """Equity and drawdown of every weighting of the book on one figure, daily is method -> daily P&L Series."""
+    dates = _plain_dates(next(iter(daily.values())).index)
+    return {"kind": "equity", "name": name, "title": title, "dates": dates,
+            "series": {method: initial_equity + np.cumsum(values.to_numpy(dtype=np.float64)) for method, values in daily.items()}}
+
+
+def table_job(name, title, table, path, dpi=300):
+    """Image of a metrics table, the picture "PL analysis.py" always saved next to its Excel file."""
+    return {"kind": "table", "name": name, "title": title, "path": path, "dpi": dpi,
+            "columns": [str(column) for column in table.columns], "cells": table.round(2).astype(str).values.tolist()}
+
+
+def job_hash(job, dpi):
+    """Hash of everything a job draws: data, labels, resolution and RENDER_VERSION."""
+    digest = hashlib.sha1(f"{RENDER_VERSION}|{dpi}|{job['kind']}|{job['title']}|{job.get('dpi')}".encode())
+    if job["kind"] == "equity":
+        digest.update(job["dates"].view(np.int64).tobytes())
+        for label, values in job["series"].items():
+            digest.update(label.encode())
+            digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    else:
+        digest.update(json.dumps([job["columns"], job["cells"]]).encode())
+    return digest.hexdigest()
+
+
+def _use_agg():
+    import matplotlib
+    matplotlib.use("Agg")  # Workers never open a window, whatever backend the parent process has.
+
+
+def draw(job, path, dpi):
+    """Draw one job to a PNG, in whichever process runs it."""
+    _use_agg()
+    import matplotlib.pyplot as plt
+
+    if job["kind"] == "table":
+        fig, ax = plt.subplots(figsize=(8, 4))
+        ax.axis("tight")
+        ax.axis("off")
+        table = ax.table(cellText=job["cells"], colLabels=job["columns"], cellLoc="center", loc="center")
+        table.auto_set_font_size(False)
+        table.set_fontsize(10)
+        table.auto_set_column_width(list(range(len(job["columns"]))))
+        fig.savefig(path, dpi=job["dpi"], bbox_inches="tight")
+    else:
+        fig, (top, bottom) = plt.subplots(2, 1, figsize=(9, 5), sharex=True, gridspec_kw={"height_ratios": [3, 1]})
+        for label, equity in job["series"].items():
+            drawdown = (equity / np.maximum.accumulate(equity) - 1) * 100
+            top.plot(job["dates"], equity, linewidth=1, label=label)
+            bottom.plot(job["dates"], drawdown, linewidth=1)
+        top.set_title(job["title"])
+        top.set_ylabel("Equity ($)")
+        bottom.set_ylabel("Drawdown (%)")
+        if len(job["series"]) > 1:
+            top.legend(loc="upper left", fontsize=8)
+        # Fixed margins: tight_layout draws the figure a second time to measure it, the date ticks being most of the cost.
+        fig.subplots_adjust(left=0.1, right=0.97, top=0.93, bottom=0.08, hspace=0.08)
+        fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+    return path
+
+
+def _draw(args):
+    return draw(*args)
+
+
+def report_jobs(Portfolio_PL, initial_equity, portfolio_weights=None):
+    """Equity jobs of every ETF with trades and, given the weights of portfolio_results, of the book."""
+    jobs = []
+    for etf, data in Portfolio_PL.items():
+        data = data.dropna(subset=["PL"])
+        if len(data):
+            jobs.append(equity_job(f"equity {etf}", etf, data["Date"], data["PL"].to_numpy(), initial_equity))
+    if portfolio_weights:
+        daily = {method: portfolio_pl(Portfolio_PL, weights) for method, weights in portfolio_weights.items()}
+        jobs.append(book_job("equity portfolio", "Portfolio", daily, initial_equity))
+    return jobs
+
+
+def _table_html(table):
+    return table.to_html(index=False, float_format=lambda value: f"{value:,.2f}", border=0, classes="metrics")
+
+
+def write_index(folder, figures, tables, title):
+    """
+    index.html of the bundle: the tables, then every figure.
+
+    Parameters:
+      figures (list): (heading, file name, hash, DataFrame or None) per figure, the frame shown under it.
+      tables (dict): Heading -> DataFrame, shown first.
+    """
+    parts = [f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title>",
+             "<style>body{font-family:sans-serif;margin:2em}table.metrics{border-collapse:collapse;font-size:13px}"
+             "table.metrics td,table.metrics th{padding:2px 8px;text-align:right}img{max-width:100%}</style>",
+             f"</head><body><h1>{html.escape(title)}</h1>"]
+    for heading, table in tables.items():
+        parts.append(f"<h2>{html.escape(heading)}</h2>{_table_html(table)}")
+    for heading, file, digest, table in figures:
+        # The hash in the link makes a browser reload the figures that changed, and only those.
+        parts.append(f"<h2>{html.escape(heading)}</h2><img src='{quote(file)}?{digest[:12]}' alt='{html.escape(heading)}'>")
+        if table is not None and not table.empty:
+            parts.append(_table_html(table))
+    parts.append("</body></html>")
+    path = os.path.join(folder, "index.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(parts))
+    return path
+
+
+def render_report(jobs, folder, tables=None, details=None, title="Report", workers=None, dpi=100):
+    """
+    Draw the figures that changed since the last report and write the bundle's index.html.
+
+    Parameters:
+      jobs (list): From report_jobs, equity_job, book_job or table_job.
+      folder (str): The bundle, created when missing. Figures go in it, table jobs to their own path.
+      tables (dict): Heading -> DataFrame at the top of index.html.
+      details (dict): Job name -> DataFrame shown under its figure (e.g. the ETF's row of the metrics table).
+      workers (int): Processes drawing the figures, one per CPU when None, 1 draws in this process.
+      dpi (int): Resolution of the figures in the bundle.
+
+    Returns:
+      str: Path of index.html.
+    """
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    paths = {job["name"]: job.get("path") or os.path.join(folder, job["name"] + ".png") for job in jobs}
+    digests = {job["name"]: job_hash(job, dpi) for job in jobs}
+    stale = [job for job in jobs if manifest.get(job["name"]) != digests[job["name"]] or not os.path.exists(paths[job["name"]])]
+    instrument.count("report.figures_skipped", len(jobs) - len(stale))
+    instrument.count("report.figures_drawn", len(stale))
+
+    work = [(job, paths[job["name"]], dpi) for job in stale]
+    with instrument.timed("report.draw_seconds"):
+        if workers == 1 or len(work) <= 1:
+            for args in work:
+                draw(*args)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_use_agg) as pool:
+                list(pool.map(_draw, work, chunksize=max(len(work) // (4 * (workers or os.cpu_count() or 1)), 1)))
+
+    manifest.update(digests)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    details = details or {}
+    figures = [(job["title"], os.path.basename(paths[job["name"]]), digests[job["name"]], details.get(job["name"]))
+               for job in jobs if job["kind"] == "equity"]
+    return write_index(folder, figures, tables or {}, title)
+
+
+def etf_report(Portfolio_PL, initial_equity, individual_results, portfolio_table, portfolio_weights, directory, config):
+    """
+    The report of "PL analysis.py" and "shortvol report --plot": every ETF and the book, their metrics tables,
+    and the metrics table image (individual_results.png) next to the Excel file.
+
+    Parameters:
+      directory (str): "On ETFs" under the data path, the bundle goes in its report.folder.
+      config (dict): The ETF config, its report section.
+
+    Returns:
+      str: Path of index.html.
+    """
+    jobs = report_jobs(Portfolio_PL, initial_equity, portfolio_weights)
+    jobs.append(table_job("individual results", "Individual results", individual_results,
+                          os.path.join(directory, "individual_results.png")))
+    details = {f"equity {etf}": individual_results[individual_results["ETF"] == etf] for etf in individual_results["ETF"]}
+    details["equity portfolio"] = portfolio_table
+    return render_report(jobs, os.path.join(directory, config["report"]["folder"]),
+                         {"Individual results": individual_results, "Portfolio results": portfolio_table}, details,
+                         "Short straddles on ETFs", config["report"]["workers"], config["report"]["dpi"])
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+### Compact in-memory schema
+# What is stored per ticker from the prices (signal frames, regime features) is float32: 7 significant digits, a tenth
+# of a cent on a $10,000 price, well below what any of the backtests resolve. The panel itself keeps the downloaded
+# prices in float64: the signals compare a rolling vol with its own quantile, and closes rounded to float32 can move a
+# day across that threshold. So every calculation runs in float64 on the panel's closes, only its outputs are stored
+# as float32. Tickers are categoricals (one small integer code per row), dates are int64 nanoseconds since the epoch
+# (the same bits as datetime64, but a plain numeric column), and boolean signals are packed as bit flags in a single
+# uint8 column.
+
+PRICE_DTYPE = np.float32
+
+# Bit of each signal in the uint8 "Signals" column written by shortvol.signals.add_signals.
+SIGNAL_FLAGS = {"Signal_vol": 1, "Signal_mom_1": 2, "Signal_1": 4}
+
+
+def to_epoch(dates):
+    """int64 nanoseconds since the epoch, tz-aware dates are taken in UTC."""
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        dates = dates.tz_convert(None)
+    return dates.as_unit("ns").asi8
+
+
+def from_epoch(epoch):
+    """DatetimeIndex (tz-naive) back from to_epoch's int64 values."""
+    return pd.DatetimeIndex(np.asarray(epoch, dtype=np.int64).view("datetime64[ns]"))
+
+
+def compact_panel(panel, columns=None):
+    """
+    Long panel (Ticker, Date and price columns) in the compact schema, keeping only `columns`.
+
+    Idempotent: a panel that is already compact is returned with only the column selection applied.
+    Prices stay float64 (see above) and Volume int64, there are days with more shares traded than float32 counts exactly.
+    """
+    keep = ["Ticker", "Date"] + [column for column in (columns or panel.columns) if column not in ("Ticker", "Date")]
+    compact = {}
+    for column in keep:
+        values = panel[column]
+        if column == "Ticker":
+            values = values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype("category")
+        elif column == "Date":
+            values = values if values.dtype == np.int64 else pd.Series(to_epoch(values), index=values.index)
+        elif column == "Volume":
+            values = values.astype(np.int64)
+        elif pd.api.types.is_float_dtype(values):
+            values = values.astype(np.float64, copy=False)
+        compact[column] = values
+    result = pd.DataFrame(compact)
+    result.attrs = dict(panel.attrs)
+    return result
+
+
+def pack_flags(**masks):
+    """uint8 column with the bit of each SIGNAL_FLAGS name set where its mask is True."""
+    packed = None
+    for name, mask in masks.items():
+        bits = np.where(np.asarray(mask, dtype=bool), SIGNAL_FLAGS[name], 0).astype(np.uint8)
+        packed = bits if packed is None else packed | bits
+    return packed
+
+
+def flag(data, name="Signal_1"):
+    """Boolean mask of one signal, from the packed Signals column."""
+    return (data["Signals"].to_numpy() & SIGNAL_FLAGS[name]) != 0
+
+
+def frame_bytes(frames):
+    """Memory of a dict of frames, index and strings included, to track the budget per ticker."""
+    return {name: int(frame.memory_usage(deep=True).sum()) for name, frame in frames.items()}
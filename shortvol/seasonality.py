@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MOVES = ["Close_Close", "Overnight", "Intraday"]
+
+
+def weekday_moves(panel, horizons):
+    """
+    Every (entry day, holding length) move of every ticker, in percent.
+
+    For an entry at the Close of day t held for h sessions:
+      Close_Close: Close[t] to Close[t+h], the move a straddle sold at the close is exposed to.
+      Overnight:   Close[t] to Open[t+h], everything up to the opening bell of the exit day.
+      Intraday:    Open[t+h] to Close[t+h], the exit session alone.
+    With h = 1 on a Friday this is the weekend move of "SPY Friday.py" split into the gap and Monday's session.
+
+    Parameters:
+      panel (DataFrame): Long panel from shortvol.panel.load_panel, sorted by Ticker then Date.
+      horizons (list): Holding lengths in trading sessions.
+
+    Returns:
+      DataFrame: Ticker, Date, Weekday, Horizon and one column per entry in MOVES.
+    """
+    close = panel["Close"].to_numpy(dtype=float)
+    open_ = panel["Open"].to_numpy(dtype=float)
+    tickers = panel["Ticker"].to_numpy()
+    codes = pd.factorize(tickers)[0]
+    dates = panel["Date"].to_numpy()
+    weekday = pd.Categorical.from_codes(pd.DatetimeIndex(dates).dayofweek, WEEKDAYS)
+    n = len(panel)
+
+    frames = []
+    for h in horizons:
+        # Entry rows whose exit row is h rows down and still belongs to the same ticker.
+        entry = np.flatnonzero(codes[: n - h] == codes[h:])
+        exit_ = entry + h
+        frames.append(pd.DataFrame({
+            "Ticker": tickers[entry],
+            "Date": dates[entry],
+            "Weekday": weekday[entry],
+            "Horizon": np.full(len(entry), h, dtype=np.int8),
+            "Close_Close": (close[exit_] / close[entry] - 1) * 100,
+            "Overnight": (open_[exit_] / close[entry] - 1) * 100,
+            "Intraday": (close[exit_] / open_[exit_] - 1) * 100,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def seasonality_table(panel, horizons):
+    """
+    Move distributions for every ticker, entry weekday and holding length, from one grouped pass.
+
+    Returns:
+      DataFrame: Indexed by (Ticker, Weekday, Horizon), with Count plus mean, std, median and
+      mean absolute move (Abs_mean, the number a straddle seller cares about) for each of MOVES.
+      Stats are stored as float32, which is plenty for percentages and halves the table size.
+    """
+    moves = weekday_moves(panel, horizons)
+    for move in MOVES:
+        moves[f"Abs_{move}"] = moves[move].abs()
+    moves["Ticker"] = moves["Ticker"].astype("category")
+
+    grouped = moves.groupby(["Ticker", "Weekday", "Horizon"], observed=True)
+    stats = grouped[MOVES].agg(["mean", "std", "median"])
+    stats.columns = [f"{move}_{stat}" for move, stat in stats.columns]
+    abs_mean = grouped[[f"Abs_{move}" for move in MOVES]].mean()
+    abs_mean.columns = [f"{move}_abs_mean" for move in MOVES]
+
+    table = pd.concat([stats, abs_mean], axis=1).astype(np.float32)
+    table.insert(0, "Count", grouped.size().astype(np.int32))
+    ordered = ["Count"] + [f"{move}_{stat}" for move in MOVES for stat in ("mean", "std", "median", "abs_mean")]
+    return table[ordered]
+
+
+def weekend_screen(table, move="Close_Close", horizon=1, weekday="Friday"):
+    """
+    Rank tickers by how much bigger the move after `weekday` is than after the other weekdays.
+
+    A Ratio well above 1 on Friday means the weekend carries more movement than a normal night,
+    which is what the SPY Friday straddle is betting against.
+
+    Returns:
+      DataFrame: One row per ticker with the weekday's mean absolute move, the other weekdays'
+      average, their Ratio and the weekday's Count, sorted by Ratio.
+    """
+    column = f"{move}_abs_mean"
+    level = table.xs(horizon, level="Horizon")[[column, "Count"]].reset_index()
+    is_day = level["Weekday"] == weekday
+    target = level[is_day].set_index("Ticker")
+    others = level[~is_day].groupby("Ticker", observed=True)[column].mean()
+
+    screen = pd.DataFrame({
+        "Weekday_abs_mean": target[column],
+        "Others_abs_mean": others.reindex(target.index),
+        "Count": target["Count"],
+    })
+    screen["Ratio"] = screen["Weekday_abs_mean"] / screen["Others_abs_mean"]
+    return screen.sort_values("Ratio", ascending=False)
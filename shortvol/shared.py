@@ -0,0 +1,151 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from shortvol.signal_index import SignalIndex
+
+### Shared panel
+# A pool over the universe (the signals of every ETF, sweeps over the signal parameters, bootstraps, per ticker
+# backtests) would pickle each ticker's frame into the worker running it, and every worker would hold its own copy.
+# Instead the panel is copied once into a block of shared memory, laid out like the signal index (rows of a ticker
+# contiguous, per-ticker offsets, int64 dates, one array per column). Workers only receive a descriptor (the block's
+# name, tickers, offsets and where each column sits in the block), attach the block by name and read read-only
+# numpy views of it, so adding workers adds neither copies nor pickling.
+
+ALIGN = 64  # Every column starts on a cache line.
+
+_attached = {}  # Block name -> (SharedMemory, SignalIndex of views), one attachment per process.
+
+
+def _open(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+, the creator alone unlinks the block.
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _views(buffer, spec):
+    """Arrays of a descriptor's columns over a buffer, Date first."""
+    return {column: np.ndarray((length,), dtype=np.dtype(dtype), buffer=buffer, offset=offset)
+            for column, (dtype, offset, length) in spec["columns"].items()}
+
+
+class SharedPanel:
+    """
+    Columns of a long panel (or of a signal index) in one block of shared memory, owned by the process creating it.
+
+    Use it as a context manager, or call close(): the block is unlinked when the owner is done with it. Views
+    handed out in this process keep the memory mapped until they are gone.
+
+    Attributes:
+      spec (dict): Picklable descriptor workers attach with: name, tickers, offsets and column -> (dtype, offset, length).
+      tickers (list): In the order of the rows.
+    """
+
+    def __init__(self, tickers, offsets, dates, columns):
+        arrays = {"Date": np.ascontiguousarray(dates, dtype=np.int64),
+                  **{column: np.ascontiguousarray(values) for column, values in columns.items()}}
+        layout, size = {}, 0
+        for column, values in arrays.items():
+            layout[column] = (values.dtype.str, size, len(values))
+            size += -(-values.nbytes // ALIGN) * ALIGN
+        self._block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.tickers = list(tickers)
+        self.spec = {"name": self._block.name, "tickers": self.tickers,
+                     "offsets": np.asarray(offsets, dtype=np.int64).tolist(), "columns": layout}
+        for column, view in _views(self._block.buf, self.spec).items():
+            view[:] = arrays[column]
+        del view  # No export of the buffer left behind, or the block could not be closed.
+        self._view = None
+
+    @classmethod
+    def from_panel(cls, panel, columns=None):
+        """
+        Block of a panel from load_panel: categorical Ticker, int64 Date, sorted by Ticker then Date.
+
+        Parameters:
+          columns (list): Columns to share, every one but Ticker and Date by default.
+        """
+        tickers = list(panel["Ticker"].cat.categories)
+        counts = np.bincount(panel["Ticker"].cat.codes.to_numpy(), minlength=len(tickers))
+        columns = columns or [column for column in panel.columns if column not in ("Ticker", "Date")]
+        return cls(tickers, np.concatenate([[0], np.cumsum(counts)]), panel["Date"].to_numpy(),
+                   {column: panel[column].to_numpy() for column in columns})
+
+    @classmethod
+    def from_index(cls, index):
+        """Block of a SignalIndex, e.g. for a bootstrap over the signal days of every ETF."""
+        return cls(index.tickers, index.offsets, index.dates, index.columns)
+
+    def view(self):
+        """The shared columns as a SignalIndex of views, frame(ticker) being a ticker_frame that copies nothing."""
+        if self._view is None:
+            self._view = _index(self._block.buf, self.spec)
+        return self._view
+
+    def close(self):
+        self._view = None
+        try:
+            self._block.close()
+        except BufferError:
+            pass  # Frames of this process still point into the block, its memory goes with them.
+        self._block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _index(buffer, spec):
+    views = _views(buffer, spec)
+    return SignalIndex(spec["tickers"], spec["offsets"], views.pop("Date"), views)
+
+
+def attach(spec):
+    """
+    The shared columns of a descriptor as a SignalIndex of read-only views, in any process.
+
+    The block is opened once per process and stays open until the process ends, the pool initializer of map_tickers.
+    """
+    name = spec["name"]
+    if name not in _attached:
+        block = _open(name)
+        _attached[name] = (block, _index(block.buf, spec))
+    return _attached[name][1]
+
+
+def _run(args):
+    func, name, ticker = args
+    return func(_attached[name][1].frame(ticker))
+
+
+def map_tickers(func, shared, tickers=None, workers=None):
+    """
+    func(frame) for every ticker, the frame being its rows of the shared panel indexed by Date.
+
+    Frames are read-only views into the block: func must copy before writing in place (add_signals builds a new
+    frame). func and its results are pickled, the frames never are.
+
+    Parameters:
+      func (callable): Picklable, a module level function or a functools.partial of one.
+      shared (SharedPanel): The panel the workers attach.
+      tickers (list): Tickers to run, every ticker of the panel by default.
+      workers (int): Processes, one per CPU when None, 1 runs in this process.
+
+    Returns:
+      dict: Ticker -> result of func, in the order of `tickers`.
+    """
+    tickers = shared.tickers if tickers is None else list(tickers)
+    if workers == 1 or len(tickers) <= 1:
+        view = shared.view()
+        return {ticker: func(view.frame(ticker)) for ticker in tickers}
+    workers = workers or os.cpu_count() or 1
+    name = shared.spec["name"]
+    with ProcessPoolExecutor(max_workers=workers, initializer=attach, initargs=(shared.spec,)) as pool:
+        results = pool.map(_run, [(func, name, ticker) for ticker in tickers], chunksize=max(len(tickers) // (4 * workers), 1))
+        return dict(zip(tickers, results))
@@ -0,0 +1,155 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from shortvol.config import subproject_path
+from shortvol.schema import flag, from_epoch, to_epoch
+
+### Signal index
+# The signal days of every ETF, for one parameter set, in a single columnar table: the rows of each ticker are
+# contiguous and sorted by date, `offsets` says where each ticker starts, and the dates are an int64 array next to
+# the columns. A (tickers, date range) query is two binary searches per ticker and a slice of every column, so what
+# comes back are read-only views into the table, no mask over a full history and no copy.
+# The index is saved next to ETF_filtered.pkl, one entry per parameter set (the signal windows and thresholds),
+# so a consumer running with other parameters finds out instead of reading stale signals.
+
+INDEX_COLUMNS = ["Close", "Volatility", "Future_Close", "Forecast_Move"]
+
+
+def index_path():
+    return subproject_path("On ETFs") + "Signal index.pkl"
+
+
+def signal_params(config, name="Signal_1"):
+    """Parameter set the signals of an ETF config are built with, the key of the index in its file."""
+    general = config["general"]
+    return (("flag", name), ("vol_window", general["vol_window"]), ("mom_window", general["mom_window"]),
+            ("for_window", general["for_window"]), ("mom_1", general["mom_1"]))
+
+
+def _epoch(date):
+    """int64 epoch of one date, None and epochs already converted pass through."""
+    if date is None or isinstance(date, (int, np.integer)):
+        return date
+    return to_epoch([date])[0]
+
+
+class SignalIndex:
+    """
+    Signal days of every ticker as one columnar table with per-ticker offsets.
+
+    Attributes:
+      tickers (list): In the order they were added, the order of the config.
+      offsets (ndarray): Rows of tickers[i] are offsets[i]:offsets[i + 1].
+      dates (ndarray): int64 epoch (shortvol/schema.py), sorted within each ticker.
+      columns (dict): Column name -> array over all rows, read-only.
+      params (tuple): Parameter set of the signals, see signal_params.
+      excluded (tuple): Tickers left out of the backtest (mean forecast move over general.mean_threshold).
+    """
+
+    def __init__(self, tickers, offsets, dates, columns, params=None, excluded=()):
+        self.tickers = list(tickers)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.columns = dict(columns)
+        self.params = params
+        self.excluded = tuple(excluded)
+        self._position = {ticker: i for i, ticker in enumerate(self.tickers)}
+        for values in (self.dates, *self.columns.values()):
+            values.flags.writeable = False  # Queries hand out views, nobody writes through them into the index.
+
+    def __getstate__(self):
+        return {key: value for key, value in self.__dict__.items() if key != "_position"}
+
+    def __setstate__(self, state):
+        self.__init__(**{key: state[key] for key in ("tickers", "offsets", "dates", "columns", "params", "excluded")})
+
+    @classmethod
+    def from_signals(cls, signals, params=None, name="Signal_1", columns=INDEX_COLUMNS):
+        """
+        Index of the `name` days of every ticker.
+
+        Parameters:
+          signals (dict): Ticker -> output of add_signals (Date index, packed Signals).
+          params (tuple): signal_params of the config the signals were built with.
+          columns (list): Columns kept in the table.
+        """
+        rows = {ticker: flag(data, name) for ticker, data in signals.items()}  # The only mask over the full histories.
+        lengths = [int(mask.sum()) for mask in rows.values()]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        dates = np.concatenate([to_epoch(data.index[rows[ticker]]) for ticker, data in signals.items()] or [np.empty(0, np.int64)])
+        table = {column: np.concatenate([data[column].to_numpy()[rows[ticker]] for ticker, data in signals.items()])
+                 for column in columns}
+        return cls(list(signals), offsets, dates, table, params)
+
+    @property
+    def selected(self):
+        """Tickers the backtest runs on, the keys of ETF_filtered."""
+        return [ticker for ticker in self.tickers if ticker not in self.excluded]
+
+    def bounds(self, ticker, start=None, end=None):
+        """Rows of a ticker from `start` to `end` (both included, None for no limit), by binary search."""
+        i = self._position[ticker]
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        dates = self.dates[lo:hi]
+        start, end = _epoch(start), _epoch(end)
+        first = 0 if start is None else np.searchsorted(dates, start, side="left")
+        last = len(dates) if end is None else np.searchsorted(dates, end, side="right")
+        return lo + first, lo + last
+
+    def column(self, name, ticker, start=None, end=None):
+        """One column of a ticker over a date range, a view into the table."""
+        lo, hi = self.bounds(ticker, start, end)
+        return self.columns[name][lo:hi]
+
+    def frame(self, ticker, start=None, end=None, columns=None):
+        """
+        Signal days of a ticker over a date range, indexed by Date like an ETF_filtered frame.
+
+        The columns are read-only views into the table; copy (or reset_index) the frame before changing values in place.
+        """
+        lo, hi = self.bounds(ticker, start, end)
+        index = pd.Index(from_epoch(self.dates[lo:hi]), name="Date")
+        return pd.DataFrame({column: self.columns[column][lo:hi] for column in (columns or self.columns)},
+                            index=index, copy=False)
+
+    def query(self, tickers=None, start=None, end=None, columns=None):
+        """Ticker -> frame for every ticker asked for (all of them by default), in the order asked for."""
+        start, end = _epoch(start), _epoch(end)  # Converted once, not once per ticker.
+        return {ticker: self.frame(ticker, start, end, columns) for ticker in (self.tickers if tickers is None else tickers)}
+
+
+def save_index(index, path=None):
+    """Store the index under its parameter set, next to the ones built with other parameters."""
+    path = path or index_path()
+    store = {}
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            store = pickle.load(f)
+    store[index.params] = index
+    with open(path, "wb") as f:
+        pickle.dump(store, f)
+
+
+def load_index(params, path=None):
+    """The index built with a parameter set, None when ETFs.py has not been run with it."""
+    path = path or index_path()
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f).get(params)
+
+
+def date_slice(frame, start=None, end=None, column="Date"):
+    """
+    Rows of a frame sorted on `column` (None for its index) from `start` to `end` (both included), by binary search.
+
+    A positional slice of the frame instead of a boolean mask over every row. Works on datetime columns
+    as well as ISO date strings read from a CSV, which sort like the dates they hold.
+    """
+    values = frame.index if column is None else frame[column]
+    lo = 0 if start is None else values.searchsorted(start, side="left")
+    hi = len(frame) if end is None else values.searchsorted(end, side="right")
+    return frame.iloc[lo:hi]
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+from shortvol.schema import PRICE_DTYPE, flag, pack_flags
+
+
+def _stored(values):
+    """Float columns in PRICE_DTYPE, the others as they are."""
+    return values.astype(PRICE_DTYPE) if np.issubdtype(values.dtype, np.floating) else values
+
+
+def add_signals(data, vol_window, mom_window, for_window, mom_1):
+    """
+    Signal stage of ETFs.py for one ticker: volatility and momentum filters, then the forecast move.
+
+    Calculations run in float64 on the panel's Close, only the result is stored in the compact schema
+    (shortvol/schema.py): float32 columns and the three signals as bit flags in Signals (read them with schema.flag).
+
+    Parameters:
+      data (DataFrame): Daily history with at least Close, e.g. ticker_frame(load_panel(..., columns=["Close"])).
+      vol_window, mom_window, for_window (int): general.vol_window, mom_window and for_window.
+      mom_1 (float): general.mom_1, momentum threshold in percent.
+
+    Returns:
+      DataFrame: A new frame with the rows left after dropping the NaN from shifting: the price columns of
+      `data` except Volume, Dividends and Stock Splits, then Volatility, Momentum, Future_Close, Forecast_Move
+      and Signals (Signal_vol, Signal_mom_1 and Signal_1).
+    """
+    close = pd.Series(data['Close'].to_numpy(dtype=np.float64), index=data.index)
+    log_returns = np.log(close / close.shift(1)) #Getting the Logarithmic returns.
+    volatility = log_returns.rolling(window=vol_window).std() #Volatility as standard deviation of Close on Close over "vol_window" days.
+    Vol_20th = volatility.quantile(0.2)  #The 20 percent level of volatility.
+    signal_vol = volatility <= Vol_20th #Signal if Voltility is below the thresold of 20 percent.
+    momentum = ((close - close.shift(mom_window)) / close.shift(mom_window)) *100 #Get momentum as percentage change over "mom_window" days.
+    signal_mom_1 = momentum.abs() <= mom_1 #Signal if momentum is below thresold desired
+
+    #Dropping the NaN generated by shifting (and any gap in the history itself).
+    keep = (data.notna().all(axis=1) & log_returns.notna() & volatility.notna() & momentum.notna()).to_numpy()
+    columns = [column for column in data.columns if column not in ('Volume', 'Dividends', 'Stock Splits')] #Mostly no use for these columns
+    signals = pd.DataFrame({column: _stored(data[column].to_numpy()[keep]) for column in columns}, index=data.index[keep])
+
+    # For a forecast of 2019, the volatility threshold includes vol from 2020, 2021... (see ETFs.py).
+    close = close[keep]
+    future_close = close.shift(-for_window) #The Close "for_window" trading days later.
+    signals['Volatility'] = volatility[keep].astype(PRICE_DTYPE)
+    signals['Momentum'] = momentum[keep].astype(PRICE_DTYPE)
+    signals['Future_Close'] = future_close.astype(PRICE_DTYPE)
+    signals['Forecast_Move'] = (((future_close - close) / close) * 100).astype(PRICE_DTYPE) #Calculating the future move as a percentage change.
+
+    # Signal_1: Both Signal_vol and Signal_mom_1 must be True
+    signal_vol, signal_mom_1 = signal_vol[keep], signal_mom_1[keep]
+    signals['Signals'] = pack_flags(Signal_vol=signal_vol, Signal_mom_1=signal_mom_1, Signal_1=signal_vol & signal_mom_1)
+    return signals
+
+
+def forecast_summary(signals):
+    """
+    Statistics of the forecast move on the Signal_1 days of each ticker, the "results" table of ETFs.py.
+
+    Parameters:
+      signals (dict): Ticker -> output of add_signals, or frames of signal days only (SignalIndex.query).
+
+    Returns:
+      DataFrame: ETF_Name, Mean_Forecast_Move, Median_Forecast_Move and Std_Forecast_Move,
+      for the tickers with at least one signal.
+    """
+    results = []
+    for name, data in signals.items():
+        rows = flag(data) if 'Signals' in data.columns else slice(None)
+        moves = data.loc[rows, 'Forecast_Move'].abs().astype(np.float64)  # float64 so long sums keep their digits.
+        if moves.empty:
+            continue
+        results.append({
+            "ETF_Name": name,
+            "Mean_Forecast_Move": moves.mean(),
+            "Median_Forecast_Move": moves.median(),
+            "Std_Forecast_Move": moves.std(),
+        })
+    return pd.DataFrame(results, columns=["ETF_Name", "Mean_Forecast_Move", "Median_Forecast_Move", "Std_Forecast_Move"])
+
@@ -0,0 +1,229 @@
+import os
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from shortvol import instrument
+from shortvol.config import root_path
+from shortvol.schema import from_epoch
+
+### Data-quality checks
+# Every check is a vectorized mask over a whole dataset (the ETF panel, option prices, BTC candles), so the pass
+# costs a few array operations per ingestion batch. Flagged rows go to an issues table, one row per row and check.
+# "error" rows are quarantined (taken out before any P&L is computed and kept aside in "Data quality"),
+# "warning" rows are only reported.
+
+ISSUE_COLUMNS = ["Dataset", "Key", "Date", "Row", "Check", "Severity", "Value"]
+SPLIT_RATIOS = (2, 3, 4, 5, 8, 10, 20)  # Common split factors, a strike this far off spot is an unadjusted pairing.
+
+
+def issues_table(dataset, data, checks, key=None, dates=None):
+    """
+    Issues table from a dict of checks, name -> (mask, severity, values).
+
+    Parameters:
+      dataset (str): Name of the dataset checked.
+      data (DataFrame): The rows checked, their index labels go in Row.
+      key (str): Column identifying the series a row belongs to (e.g. Ticker), or None.
+      dates (array): Date or time of each row, or None.
+
+    Returns:
+      DataFrame: ISSUE_COLUMNS, one row per flagged row and check.
+    """
+    frames = []
+    for name, (mask, severity, values) in checks.items():
+        mask = np.asarray(mask, dtype=bool)
+        if not mask.any():
+            continue
+        frames.append(pd.DataFrame({
+            "Dataset": dataset,
+            "Key": np.asarray(data[key])[mask] if key else None,
+            "Date": np.asarray(dates)[mask] if dates is not None else None,
+            "Row": data.index[mask],
+            "Check": name,
+            "Severity": severity,
+            "Value": np.broadcast_to(np.asarray(values, dtype=object), mask.shape)[mask],
+        }))
+    if not frames:
+        return pd.DataFrame(columns=ISSUE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _previous(values, same_series):
+    """Previous value within the same series, NaN on each series' first row."""
+    previous = np.roll(np.asarray(values, dtype=np.float64), 1)
+    previous[~same_series] = np.nan
+    return previous
+
+
+def validate_panel(panel, max_move=0.25, stale_days=5):
+    """
+    Checks of a daily long panel (Ticker, Date and price columns, sorted by Ticker then Date).
+
+    Errors: missing or non-positive Close, duplicate Ticker and Date.
+    Warnings: High below Low or Close outside them, a day-on-day move above `max_move` (a split not applied,
+    or a bad print), the same Close `stale_days` days in a row or more, no volume traded.
+    """
+    tickers = np.asarray(panel["Ticker"])
+    close = panel["Close"].to_numpy(dtype=np.float64)
+    same_series = np.concatenate([[False], tickers[1:] == tickers[:-1]]) if len(panel) else np.zeros(0, dtype=bool)
+    previous = _previous(close, same_series)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        move = np.abs(close / previous - 1)
+    changed = ~same_series | (close != previous)
+    run = np.cumsum(changed)
+    run_length = np.bincount(run)[run]
+
+    checks = {
+        "missing_close": (~(close > 0), "error", close),
+        "duplicate_date": (panel.duplicated(["Ticker", "Date"]).to_numpy(), "error", panel["Date"].to_numpy()),
+        "price_jump": (move > max_move, "warning", move),
+        "stale_price": (~changed & (run_length >= stale_days), "warning", run_length),
+    }
+    if {"High", "Low"}.issubset(panel.columns):
+        high, low = panel["High"].to_numpy(dtype=np.float64), panel["Low"].to_numpy(dtype=np.float64)
+        checks["ohlc_inconsistent"] = ((high < low) | (close > high) | (close < low), "warning", close)
+    if "Volume" in panel.columns:
+        volume = panel["Volume"].to_numpy()
+        checks["zero_volume"] = (volume == 0, "warning", volume)
+    dates = from_epoch(panel["Date"]) if panel["Date"].dtype == np.int64 else pd.DatetimeIndex(panel["Date"])
+    return issues_table("ETF panel", panel, checks, key="Ticker", dates=dates)
+
+
+def validate_options(data, max_strike_distance=0.1, min_volume=1, close="Close", strike="Strike",
+                     prices=("Call_Price", "Put_Price"), volumes=("Call_Volume", "Put_Volume"),
+                     contracts=("Call_Contract", "Put_Contract")):
+    """
+    Checks of straddle rows before their P&L is computed, all errors.
+
+    - nonpositive_premium: a leg priced at zero or less.
+    - below_intrinsic: a leg cheaper than its intrinsic value on the signal's close.
+    - zero_volume: a leg's close printed on fewer than `min_volume` contracts, not a price anyone traded at.
+    - stale_quote: a contract with the same close as on the previous signal it was priced on.
+    - strike_far: strike more than `max_strike_distance` away from the underlying's close.
+    - split_mismatch: strike about a split factor away from the close, an unadjusted option paired
+      with a split-adjusted underlying.
+
+    Volume and contract checks only run on the columns the frame has, and only on rows priced from the API
+    when there is a Premium_Source column. Rows without a price are left to the caller's dropna.
+    Column names default to price_straddles' output.
+    """
+    spot = data[close].to_numpy(dtype=np.float64)
+    K = data[strike].to_numpy(dtype=np.float64)
+    fetched = (data["Premium_Source"] == "api").to_numpy() if "Premium_Source" in data.columns else np.ones(len(data), dtype=bool)
+    checks = {}
+
+    legs = [data[column].to_numpy(dtype=np.float64) for column in prices]
+    intrinsic = [np.maximum(spot - K, 0), np.maximum(K - spot, 0)]
+    checks["nonpositive_premium"] = (np.any([leg <= 0 for leg in legs], axis=0), "error", legs[0] + legs[1])
+    checks["below_intrinsic"] = (np.any([leg < value - 0.01 for leg, value in zip(legs, intrinsic)], axis=0) & fetched,
+                                 "error", legs[0] + legs[1])
+
+    if set(volumes).issubset(data.columns):
+        volume = np.vstack([data[column].to_numpy(dtype=np.float64) for column in volumes])
+        low = np.any(np.nan_to_num(volume, nan=0.0) < min_volume, axis=0)
+        priced = np.all([~np.isnan(leg) for leg in legs], axis=0)  # Legs without a close are not a volume problem.
+        checks["zero_volume"] = (low & fetched & priced, "error", np.nanmin(np.where(np.isnan(volume), 0, volume), axis=0))
+
+    if set(contracts).issubset(data.columns):
+        stale = np.zeros(len(data), dtype=bool)
+        for contract, price in zip(contracts, prices):
+            # Same contract and same close as the previous row quoting it.
+            quotes = pd.DataFrame({"contract": data[contract].to_numpy(), "price": data[price].to_numpy(dtype=np.float64)})
+            previous = quotes.groupby("contract", sort=False)["price"].shift(1).to_numpy()
+            stale |= quotes["contract"].notna().to_numpy() & (quotes["price"].to_numpy() == previous)
+        checks["stale_quote"] = (stale & fetched, "error", legs[0] + legs[1])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = K / spot
+    checks["strike_far"] = (np.abs(ratio - 1) > max_strike_distance, "error", ratio)
+    split = np.zeros(len(data), dtype=bool)
+    for factor in SPLIT_RATIOS:
+        split |= (np.abs(ratio / factor - 1) < 0.05) | (np.abs(ratio * factor - 1) < 0.05)
+    checks["split_mismatch"] = (split, "error", ratio)
+    return issues_table("Option prices", data, checks, dates=pd.DatetimeIndex(data["Date"]) if "Date" in data.columns else None)
+
+
+def validate_candles(candles, hours=1, name="BTC candles"):
+    """
+    Checks of crypto candles as fetch_candles returns them (Time in Unix milliseconds, or datetime).
+
+    Errors: the same Time twice (overlapping pages), a missing or non-positive price.
+    Warnings: High below the open or close, Low above them, a gap of more than `hours` before a candle.
+    """
+    time = candles["Time"]
+    if not pd.api.types.is_datetime64_any_dtype(time):
+        time = pd.to_datetime(pd.to_numeric(time), unit="ms")  # Bitget sends the milliseconds as strings.
+    prices = candles[["Open", "High", "Low", "Close"]].to_numpy(dtype=np.float64)
+    open_, high, low, close = prices.T
+    ordered = np.sort(time.to_numpy())
+    gaps = np.diff(ordered, prepend=ordered[:1]) / np.timedelta64(1, "h")
+    gap_before = pd.Series(gaps, index=ordered).groupby(level=0).first().reindex(time.to_numpy()).to_numpy()
+
+    checks = {
+        "duplicate_time": (time.duplicated().to_numpy(), "error", time.to_numpy()),
+        "missing_price": (~np.all(prices > 0, axis=1), "error", close),
+        "ohlc_inconsistent": ((high < np.maximum(open_, close)) | (low > np.minimum(open_, close)), "warning", close),
+        "gap": (gap_before > hours, "warning", gap_before),
+    }
+    return issues_table(name, candles, checks, dates=time.to_numpy())
+
+
+def panel_checks(config):
+    """validate_panel thresholds from the validation section of a config, the defaults for configs without one."""
+    validation = config.get("validation", {})
+    return {"max_move": validation.get("max_daily_move", 0.25), "stale_days": validation.get("stale_days", 5)}
+
+
+def option_checks(config):
+    """validate_options thresholds from the validation section of the ETF config."""
+    validation = config["validation"]
+    return {"max_strike_distance": validation["max_strike_distance"], "min_volume": validation["min_option_volume"]}
+
+
+def quarantine(data, issues):
+    """
+    Split a dataset in the rows to keep and the rows with an error.
+
+    Returns:
+      tuple: (clean rows, quarantined rows), both slices of `data`.
+    """
+    bad = data.index.isin(issues.loc[issues["Severity"] == "error", "Row"])
+    return data[~bad], data[bad]
+
+
+def record_issues(issues, quarantined=None, name=None):
+    """
+    Append the issues (and the quarantined rows) of a check to "Data quality" under the data path.
+
+    Each dataset has its own "<Dataset> issues.csv" and "<Dataset> quarantine.csv", every row stamped with
+    when it was checked, so the files keep the history of every ingestion batch. Counts go to the run report.
+    """
+    if issues.empty:
+        return
+    name = name or issues["Dataset"].iloc[0]
+    for (check, severity), count in issues.groupby(["Check", "Severity"]).size().items():
+        instrument.count(f"validation.{severity}.{check}", int(count))
+
+    folder = os.path.join(root_path(), "Data quality")
+    os.makedirs(folder, exist_ok=True)
+    checked = datetime.now().isoformat(timespec="seconds")
+    for rows, suffix in ((issues, "issues"), (quarantined, "quarantine")):
+        if rows is None or rows.empty:
+            continue
+        path = os.path.join(folder, f"{name} {suffix}.csv")
+        rows.assign(Checked=checked).to_csv(path, mode="a", header=not os.path.exists(path))
+    if quarantined is not None and not quarantined.empty:
+        instrument.count("validation.quarantined", len(quarantined))
+        print(f"{name}: {len(quarantined)} rows quarantined, see \"Data quality/{name} issues.csv\".")
+
+
+def check(dataset, data, validator, **options):
+    """Run a validator, record what it found and return the rows that passed."""
+    issues = validator(data, **options)
+    clean, quarantined = quarantine(data, issues)
+    record_issues(issues, quarantined, dataset)
+    return clean